@@ -1,18 +1,33 @@
 import os
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI
 from routes import health, firestore_routes, search , auth, user, chatbot, crm
 import firebase_admin
 from firebase_admin import credentials, firestore
 from elasticsearch import Elasticsearch
-from services.es_svc import index_many
-from prometheus_fastapi_instrumentator import Instrumentator
+from services.es_client import (
+    create_es_client,
+    create_async_es_client,
+    pool_metrics,
+    ES_SYNC_TIMEOUT,
+)
+from services.sync_svc import (
+    SYNC_CATALOG_COLLECTIONS,
+    SYNC_WORKERS,
+    cancel_sync_jobs,
+    catalog_version,
+    run_startup_sync,
+    start_change_feed,
+    stop_change_feeds,
+)
+from services.recommendation_svc import start_materializer, stop_materializer
+from services.match_feed_svc import SCHOLARSHIP_COLLECTION, ensure_profile_queries
+from services.fallback_svc import start_fallback_engine, stop_fallback_engine
+from services.cache_svc import start_version_poller, stop_version_poller
+from prometheus_fastapi_instrumentator import Instrumentator, metrics
 from fastapi.middleware.cors import CORSMiddleware
 
-ES_HOST = os.getenv("ELASTICSEARCH_HOST")
-ES_USER = os.getenv("ELASTIC_USER")
-ES_PASS = os.getenv("ELASTIC_PASSWORD")
 # --- Firebase init ---
 cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 if not firebase_admin._apps:
@@ -22,122 +37,70 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 
 db = firestore.client()
+# "incremental": sau lần sync đầu, giữ listener on_snapshot để đẩy thay đổi sang ES gần real-time
+ES_SYNC_MODE = os.getenv("ES_SYNC_MODE", "incremental")
 origins = [
     "http://localhost:3000",
     "https://scholarship-routing.vercel.app",
     "https://scholarshipsrouting.netlify.app"
 ]
 
-def sync_firestore_to_es():
+def sync_firestore_to_es(client: Elasticsearch):
     """Sync Firestore collections to Elasticsearch (runs in background)"""
-    import time
-    
-    es = Elasticsearch(
-        hosts=[ES_HOST],
-        basic_auth=(ES_USER, ES_PASS),
-        verify_certs=False,
-        max_retries=5,
-        retry_on_timeout=True,
-        request_timeout=120,  # Increased to 120 seconds for bulk operations
-    )
+    es = client.options(request_timeout=ES_SYNC_TIMEOUT, max_retries=5)
 
     try:
         print("🔄 Starting Firestore → Elasticsearch sync...")
-        collections = db.collections()
-        
-        for coll_ref in collections:
-            coll_name = coll_ref.id
-            
-            # Check if index exists and has data
-            index_exists = es.indices.exists(index=coll_name)
-            if index_exists:
-                try:
-                    # Check document count
-                    doc_count = es.count(index=coll_name).get("count", 0)
-                    if doc_count > 0:
-                        print(f"⏭️  Skipping '{coll_name}' - already has {doc_count} documents")
-                        continue
-                    else:
-                        print(f"📝 Index '{coll_name}' exists but empty, syncing...")
-                except Exception as e:
-                    print(f"⚠️  Could not check count for '{coll_name}': {e}. Skipping for now.")
-                    continue
-            else:
-                print(f"📝 Creating new index '{coll_name}'...")
-            
-            # Stream documents from Firestore
-            print(f"🔍 Fetching documents from Firestore collection '{coll_name}'...")
-            docs = coll_ref.stream()
-            records = []
-            for doc in docs:
-                data = doc.to_dict()
-                data["id"] = doc.id
-                records.append(data)
+        results = run_startup_sync(es, db, workers=SYNC_WORKERS)
+        print("✅ Firestore → Elasticsearch sync completed successfully")
 
-            if records:
-                print(f"📦 Preparing to index {len(records)} documents...")
-                
-                # Wait for index to be ready (shards to activate)
-                print(f"⏳ Waiting for index '{coll_name}' shards to become active...")
-                max_wait = 30  # Wait up to 30 seconds
-                for wait_attempt in range(max_wait):
-                    try:
-                        health = es.cluster.health(index=coll_name, timeout="5s")
-                        if health.get("status") in ["yellow", "green"]:
-                            print(f"✓ Index '{coll_name}' is ready ({health.get('status')})")
-                            break
-                    except Exception as e:
-                        pass
-                    
-                    if wait_attempt < max_wait - 1:
-                        time.sleep(1)
-                else:
-                    print(f"⚠️  Timeout waiting for '{coll_name}' to be ready, attempting anyway...")
-                
-                # Now try to index
-                print(f"📦 Indexing documents in batches of 50...")
-                result = index_many(
-                    es,
-                    records,
-                    index=coll_name,
-                    collection=coll_name,
-                    batch_size=50  # Reduced from 100 to 50
-                )
-                
-                if result.get("error"):
-                    print(f"❌ Error syncing '{coll_name}': {result['error']}")
-                else:
-                    print(f"✅ Synced {result['success']}/{len(records)} docs from '{coll_name}'")
-                    if result.get("failed", 0) > 0:
-                        print(f"⚠️  {result['failed']} documents failed")
-                
-                # Add delay between collections
-                print(f"💤 Waiting 5 seconds before next collection...")
-                time.sleep(5)
-            else:
-                print(f"⚠️ No documents in collection '{coll_name}'")
+        if ES_SYNC_MODE == "incremental":
+            # Chỉ collection catalog (SYNC_CATALOG_COLLECTIONS); `users`... không cần mirror liên tục sang ES
+            synced = {summary["collection"] for summary in results}
+            for collection in SYNC_CATALOG_COLLECTIONS:
+                if collection in synced:
+                    start_change_feed(es, collection, db=db)
 
-        print("✅ Firestore → Elasticsearch sync completed successfully")
+        # Lần triển khai đầu: đăng ký query percolator cho user đã có sẵn
+        ensure_profile_queries(es, db, SCHOLARSHIP_COLLECTION)
 
     except Exception as e:
         print(f"❌ Error syncing Firestore → ES: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        es.close()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown events"""
     # Startup: Run sync in background thread to not block startup
     print("🚀 Application starting up...")
+    app.state.es = create_es_client()
+    app.state.es_async = create_async_es_client()
     loop = asyncio.get_event_loop()
-    loop.run_in_executor(None, sync_firestore_to_es)
+    loop.run_in_executor(None, sync_firestore_to_es, app.state.es)
+    try:
+        start_materializer(app.state.es)
+    except Exception as e:
+        print(f"⚠️  Recommendation materializer not started: {e}")
+    start_fallback_engine(app.state.es)
+    # Cache trong process: bỏ kết quả cũ khi worker khác sync (xem cache_svc)
+    await asyncio.to_thread(
+        start_version_poller,
+        lambda collection: catalog_version(app.state.es, db, collection),
+        SYNC_CATALOG_COLLECTIONS,
+    )
     
     yield
     
     # Shutdown
     print("👋 Application shutting down...")
+    stop_change_feeds()
+    stop_version_poller()
+    stop_materializer()
+    stop_fallback_engine()
+    await asyncio.to_thread(cancel_sync_jobs)
+    app.state.es.close()
+    await app.state.es_async.close()
 
 # --- FastAPI app ---
 app = FastAPI(title="Scholarship Routing API", lifespan=lifespan)
@@ -155,4 +118,4 @@ app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(user.router, prefix="/api/v1/user", tags=["user"])
 app.include_router(chatbot.router, prefix="/api/v1/chatbot", tags=["chatbot"])
 app.include_router(crm.router, prefix="/api/v1/crm", tags=["crm"])
-Instrumentator().instrument(app).expose(app)
+Instrumentator().add(metrics.default()).add(pool_metrics()).instrument(app).expose(app)
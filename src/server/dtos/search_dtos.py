@@ -1,10 +1,43 @@
 # dtos/search_dtos.py
 
-from pydantic import BaseModel, Field
-from typing import List, Union, Literal
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Union, Literal
 
 class FilterItem(BaseModel):
     """Định nghĩa cấu trúc cho một tiêu chí lọc."""
     field: str = Field(..., description="Tên trường cần lọc trong document, ví dụ: 'Country'")
     values: List[Union[str, int, float, bool]] = Field(..., description="Danh sách các giá trị cần lọc")
-    operator: Literal["AND", "OR"] = Field("OR", description="Toán tử áp dụng cho các giá trị trong list `values`")
+    operator: Literal["AND", "OR", "GTE", "LTE", "RANGE"] = Field(
+        "OR",
+        description=(
+            "Toán tử áp dụng cho các giá trị trong list `values`. "
+            "GTE/LTE nhận 1 giá trị, RANGE nhận 2 giá trị [from, to]; dùng cho "
+            "Min_Gpa, Experience_Years, Start_Date, End_Date (ngày hỗ trợ date math, ví dụ 'now/d')"
+        ),
+    )
+
+    @model_validator(mode="after")
+    def check_range_values(self):
+        if self.operator == "RANGE" and len(self.values) != 2:
+            raise ValueError("RANGE operator needs exactly 2 values [from, to]")
+        if self.operator in ("GTE", "LTE") and len(self.values) != 1:
+            raise ValueError(f"{self.operator} operator needs exactly 1 value")
+        return self
+
+
+class BatchSpec(BaseModel):
+    """Một truy vấn con trong `/batch`: keyword search hoặc filter."""
+    type: Literal["search", "filter"] = Field(..., description="'search' (cần `q`) hoặc 'filter' (dùng `filters`)")
+    collection: str = Field(..., description="Tên collection")
+    q: Optional[str] = Field(None, description="Từ khóa full-text (type='search')")
+    filters: List[FilterItem] = Field(default_factory=list, description="Bộ lọc (type='filter')")
+    inter_field_operator: Literal["AND", "OR"] = "AND"
+    size: int = Field(10, ge=1, le=100)
+    offset: int = Field(0, ge=0)
+    fields: Optional[str] = Field(None, description="Projection: 'card' (mặc định), 'full', hoặc danh sách field")
+
+    @model_validator(mode="after")
+    def check_query(self):
+        if self.type == "search" and not (self.q and self.q.strip()):
+            raise ValueError("type='search' needs a non-empty `q`")
+        return self
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from elasticsearch import Elasticsearch
 from services.auth_svc import (
     register_user,
     create_guest_session,
@@ -10,8 +11,10 @@ from services.auth_svc import (
     verify_bot_token,
     AuthenticatedUser
 )
+from services.es_client import get_sync_es
+from services.match_feed_svc import PROFILE_QUERY_FIELDS, refresh_profile_query
+from services.recommendation_svc import RECOMMENDATION_PROFILE_FIELDS, schedule_recommendations
 from dtos.auth_dtos import RegisterRequest, VerifyRequest, UpdateProfileRequest
-from typing import Dict, Any
 
 router = APIRouter()
 
@@ -65,7 +68,9 @@ async def get_user_profile(
 async def update_user_profile(
     uid: str,
     req: UpdateProfileRequest,
-    current_user: AuthenticatedUser = Depends(verify_firebase_user)
+    background_tasks: BackgroundTasks,
+    current_user: AuthenticatedUser = Depends(verify_firebase_user),
+    es: Elasticsearch = Depends(get_sync_es),
 ):
     """Update profile - user can only update their own data"""
     require_user_ownership(current_user, uid)
@@ -73,6 +78,11 @@ async def update_user_profile(
     try:
         fields = req.dict(exclude_unset=True)
         updated = update_profile(uid, fields)
+        # Đổi tiêu chí mong muốn -> đăng ký lại query percolator (sau khi đã trả response)
+        if PROFILE_QUERY_FIELDS & fields.keys():
+            background_tasks.add_task(refresh_profile_query, es, uid, updated)
+        if RECOMMENDATION_PROFILE_FIELDS & fields.keys():
+            schedule_recommendations(uid)
         return updated
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,27 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from elasticsearch import Elasticsearch
-import os
+from services.es_client import get_health_es
 
 router = APIRouter()
 
-ES_HOST = os.getenv("ELASTICSEARCH_HOST")
-ES_USER = os.getenv("ELASTIC_USER")
-ES_PASS = os.getenv("ELASTIC_PASSWORD")
-
 @router.get("/live")
 def live():
     return {"status": "ok"}
 
 @router.get("/ready")
-def ready():
-    es = Elasticsearch(
-        hosts=[ES_HOST],
-        basic_auth=(ES_USER, ES_PASS),  # nếu có auth
-        verify_certs=False,
-        max_retries=30,
-        retry_on_timeout=True,
-        request_timeout=30,
-    )
+def ready(es: Elasticsearch = Depends(get_health_es)):
     try:
         if es.ping():
             info = es.info()
@@ -37,6 +25,3 @@ def ready():
             return {"status": "degraded", "elasticsearch": "ping failed"}
     except Exception as e:
         return {"status": "error", "elasticsearch": str(e)}
-    finally:
-        es.close()
-
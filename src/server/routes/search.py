@@ -1,69 +1,127 @@
 # routes/search.py
-import os
-from typing import Any, Dict, List, Union, Optional, Literal
-from fastapi import APIRouter, Body, Query
-from elasticsearch import Elasticsearch
-from services.es_svc import search_keyword, index_many, filter_advanced
-from firebase_admin import firestore
-from dtos.search_dtos import FilterItem
+import asyncio
+from typing import List, Optional, Literal
+from fastapi import APIRouter, Body, Query, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from services.es_svc import (
+    search_keyword_async,
+    filter_advanced_async,
+    facet_counts_async,
+    multi_search_async,
+    suggest_scholarships_async,
+    search_hybrid_async,
+    get_scholarship_async,
+    get_cards_async,
+    resolve_fields,
+)
+from services.es_client import get_async_search_es, get_sync_es
+from services.embedding_svc import get_embedder
+from services.fallback_svc import call_with_fallback, get_fallback_engine
+from services.similar_svc import get_similar_graph
+from services.sync_svc import (
+    start_change_feed,
+    submit_sync_job,
+    get_sync_job,
+    list_sync_jobs,
+    cancel_sync_job,
+)
+from dtos.search_dtos import BatchSpec, FilterItem
 
 router = APIRouter()
-ES_HOST = os.getenv("ELASTICSEARCH_HOST")
-ES_USER = os.getenv("ELASTIC_USER")
-ES_PASS = os.getenv("ELASTIC_PASSWORD")
-@router.get("/search")
-def search(
+
+@router.get("/search", response_class=ORJSONResponse)
+async def search(
     q: str = Query(..., description="Từ khóa full-text"),
     size: int = Query(10, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor phân trang (bỏ trống hoặc '*' để lấy trang đầu, sau đó dùng `next_cursor`)"),
     collection: str = Query(..., description="Tên collection cần search"),
+    fields: Optional[str] = Query(None, description="Projection: 'card' (mặc định), 'full', hoặc danh sách field phân tách bằng dấu phẩy"),
+    open_only: bool = Query(False, description="Chỉ học bổng còn hạn nộp (total tính tới 1000, `total_relation: gte` nếu nhiều hơn)"),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
 ):
-    es = Elasticsearch(
-        hosts=[ES_HOST],
-        basic_auth=(ES_USER, ES_PASS),
-        verify_certs=False,
-        max_retries=3,
-        retry_on_timeout=True,
-        request_timeout=30,
-    )
+    projection = resolve_fields(fields)
     try:
-        return search_keyword(
-            es, q,
-            index=collection, 
-            size=size,
-            offset=offset,
-            collection=collection
+        # ES quá tải / không phản hồi: trả lời từ snapshot trong process (`degraded: true`)
+        result = await call_with_fallback(
+            "search", collection,
+            lambda: search_keyword_async(
+                es, q,
+                index=collection, 
+                size=size,
+                offset=offset,
+                collection=collection,
+                cursor=cursor,
+                fields=projection,
+                open_only=open_only,
+            ),
+            lambda: get_fallback_engine().search(
+                collection, q,
+                size=size, offset=offset, cursor=cursor, fields=projection, open_only=open_only,
+            ),
         )
+        return ORJSONResponse(result)
     except Exception as e:
-        import traceback
-        return {
+        return ORJSONResponse({
             "error": str(e),
             "error_type": type(e).__name__,
             "message": "Search failed. Elasticsearch may be overloaded. Please try again.",
             "total": 0,
             "items": []
-        }
-    finally:
-        es.close()
+        })
+
+
+@router.get("/suggest", response_class=ORJSONResponse)
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="Tiền tố người dùng đang gõ (có dấu hoặc không dấu)"),
+    collection: str = Query(..., description="Tên collection cần gợi ý"),
+    size: int = Query(8, ge=1, le=20),
+    include_country: bool = Query(True, description="Gợi ý cả theo tên quốc gia"),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Gợi ý khi gõ (search-as-you-type) theo tên học bổng / quốc gia.
+    """
+    try:
+        result = await suggest_scholarships_async(
+            es, q,
+            index=collection,
+            collection=collection,
+            size=size,
+            include_country=include_country,
+        )
+        return ORJSONResponse(result)
+    except Exception as e:
+        return ORJSONResponse({
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "items": []
+        })
 
 
 @router.post("/sync")
 def sync_firestore_to_es(
     collection: str = Query(..., description="Tên Firestore collection cần sync"),
     force: bool = Query(False, description="Force resync even if data exists"),
+    mode: Literal["full", "incremental"] = Query("full", description="full: đọc lại cả collection; incremental: bật change feed (chỉ đẩy thay đổi)"),
+    es: Elasticsearch = Depends(get_sync_es),
 ):
     """Manual sync endpoint - use cautiously as ES may be under load from background sync"""
+    if mode == "incremental":
+        try:
+            feed = start_change_feed(es, collection)
+            return {"status": "ok", "mode": "incremental", **feed.status()}
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "collection": collection,
+                "error_type": type(e).__name__,
+            }
+
     try:
         # Check ES health first
-        es = Elasticsearch(
-            hosts=[ES_HOST],
-            basic_auth=(ES_USER, ES_PASS),
-            verify_certs=False,
-            max_retries=3,
-            retry_on_timeout=True,
-            request_timeout=30,
-        )
-        
         try:
             # Quick health check
             health = es.cluster.health(timeout="5s")
@@ -87,50 +145,16 @@ def sync_firestore_to_es(
                 "collection": collection
             }
         
-        db = firestore.client()
-        
-        try:
-            # Check if index already has data
-            if not force and es.indices.exists(index=collection):
-                try:
-                    doc_count = es.count(index=collection).get("count", 0)
-                    if doc_count > 0:
-                        return {
-                            "status": "skipped",
-                            "message": f"Index '{collection}' already has {doc_count} documents. Use force=true to resync.",
-                            "existing_documents": doc_count,
-                            "collection": collection
-                        }
-                except Exception as count_error:
-                    # If count fails (e.g., ES overloaded), log and continue with sync
-                    print(f"⚠️  Could not check document count for '{collection}': {count_error}")
-                    print(f"   Proceeding with sync attempt anyway...")
-            
-            docs = db.collection(collection).stream()
-            items = [{"id": doc.id, **doc.to_dict()} for doc in docs]
-
-            if not items:
-                return {"status": "ok", "message": f"No documents in collection '{collection}'"}
-
-            result = index_many(
-                es, 
-                items, 
-                index=collection, 
-                collection=collection,
-                batch_size=50  # Process in smaller batches
-            )
-            
-            return {
-                "status": "ok",
-                "total_documents": len(items),
-                "indexed": result["success"],
-                "failed": result["failed"],
-                "duplicates": result.get("duplicates", 0),
-                "failed_records": result["failed_ids"][:10],  # Limit to first 10
-                "collection": collection
-            }
-        finally:
-            es.close()
+        # Full sync chạy nền dưới dạng job: theo dõi bằng GET /sync/{job_id}, hủy bằng DELETE
+        job = submit_sync_job(es, collection, force=force)
+        return {
+            "status": "accepted",
+            "mode": "full",
+            "job_id": job.id,
+            "collection": collection,
+            "force": force,
+            "status_url": f"/api/v1/es/sync/{job.id}",
+        }
     except Exception as e:
         import traceback
         return {
@@ -141,6 +165,29 @@ def sync_firestore_to_es(
             "traceback": traceback.format_exc()
         }
 
+@router.get("/sync")
+def list_sync_jobs_route(collection: Optional[str] = Query(None, description="Chỉ lấy job của collection này")):
+    """Các sync job gần đây (mới nhất trước)."""
+    return {"items": list_sync_jobs(collection)}
+
+
+@router.get("/sync/{job_id}")
+def get_sync_job_status(job_id: str):
+    """Tiến độ sync job: số doc đã đọc / index / lỗi, tốc độ (docs/s) và ETA."""
+    job = get_sync_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Sync job '{job_id}' not found")
+    return job.status()
+
+
+@router.delete("/sync/{job_id}")
+def cancel_sync_job_route(job_id: str):
+    """Hủy sync job; job dừng sau đoạn đang index, checkpoint được giữ để chạy tiếp lần sau."""
+    job = cancel_sync_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Sync job '{job_id}' not found")
+    return job.status()
+
 filter_example = [
     {
       "field": "Country",
@@ -154,49 +201,221 @@ filter_example = [
     }
 ]
 
-@router.post("/filter")
-def filter_documents(
+@router.post("/filter", response_class=ORJSONResponse)
+async def filter_documents(
     # --- Các tham số Query Parameter ---
     collection: str = Query(..., description="Tên collection cần filter"),
     size: int = Query(10, ge=1, le=100, description="Số lượng kết quả trả về"),
     offset: int = Query(0, ge=0, description="Vị trí bắt đầu lấy kết quả"),
+    cursor: Optional[str] = Query(None, description="Cursor phân trang (bỏ trống hoặc '*' để lấy trang đầu, sau đó dùng `next_cursor`)"),
     inter_field_operator: Literal["AND", "OR"] = Query("AND", description="Toán tử kết hợp các bộ lọc với nhau"),
+    fields: Optional[str] = Query(None, description="Projection: 'card' (mặc định), 'full', hoặc danh sách field phân tách bằng dấu phẩy"),
+    open_only: bool = Query(False, description="Chỉ học bổng còn hạn nộp, hạn gần nhất trước (total tính tới 1000)"),
     
     # --- Request body giờ là một danh sách FilterItem ---
-    filters: List[FilterItem] = Body(..., examples=[filter_example])
+    filters: List[FilterItem] = Body(..., examples=[filter_example]),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
 ):
     """
     API để lọc document với các điều kiện phức tạp.
     """
-    es = Elasticsearch(
-        hosts=[ES_HOST],
-        basic_auth=(ES_USER, ES_PASS),
-        verify_certs=False,
-        max_retries=3,
-        retry_on_timeout=True,
-        request_timeout=30,
-    )
     try:
         # Chuyển đổi list các Pydantic model thành list các dict
         filters_dict = [item.model_dump() for item in filters]
+        projection = resolve_fields(fields)
+
+        result = await call_with_fallback(
+            "filter", collection,
+            lambda: filter_advanced_async(
+                client=es,
+                index=collection,
+                collection=collection,
+                filters=filters_dict,
+                inter_field_operator=inter_field_operator,
+                size=size,
+                offset=offset,
+                cursor=cursor,
+                fields=projection,
+                open_only=open_only,
+            ),
+            lambda: get_fallback_engine().filter(
+                collection, filters_dict,
+                inter_field_operator=inter_field_operator,
+                size=size, offset=offset, cursor=cursor, fields=projection, open_only=open_only,
+            ),
+        )
+        return ORJSONResponse(result)
+    except Exception as e:
+        return ORJSONResponse({
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "message": "Filter operation failed. Elasticsearch may be overloaded. Please try again.",
+            "total": 0,
+            "items": []
+        })
 
-        return filter_advanced(
-            client=es,
+
+@router.post("/hybrid", response_class=ORJSONResponse)
+async def hybrid_search(
+    q: str = Query(..., description="Câu truy vấn (tiếng Việt hoặc tiếng Anh)"),
+    collection: str = Query(..., description="Tên collection cần search"),
+    size: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    inter_field_operator: Literal["AND", "OR"] = Query("AND", description="Toán tử kết hợp các bộ lọc với nhau"),
+    fields: Optional[str] = Query(None, description="Projection: 'card' (mặc định), 'full', hoặc danh sách field phân tách bằng dấu phẩy"),
+    filters: List[FilterItem] = Body([], examples=[filter_example]),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Hybrid search: BM25 + kNN (vector) cùng bộ lọc, gộp bằng reciprocal rank fusion.
+    Khi chưa bật embedder (`ES_EMBEDDER`), chỉ dùng BM25 (`mode: "bm25"`).
+    """
+    try:
+        result = await search_hybrid_async(
+            es, q,
             index=collection,
             collection=collection,
-            filters=filters_dict,
+            filters=[item.model_dump() for item in filters],
             inter_field_operator=inter_field_operator,
             size=size,
-            offset=offset
+            offset=offset,
+            fields=resolve_fields(fields),
+            embedder=get_embedder(),
         )
+        return ORJSONResponse(result)
     except Exception as e:
-        import traceback
-        return {
+        return ORJSONResponse({
             "error": str(e),
             "error_type": type(e).__name__,
-            "message": "Filter operation failed. Elasticsearch may be overloaded. Please try again.",
+            "message": "Hybrid search failed. Elasticsearch may be overloaded. Please try again.",
             "total": 0,
             "items": []
-        }
-    finally:
-        es.close()
\ No newline at end of file
+        })
+
+
+@router.post("/facets", response_class=ORJSONResponse)
+async def facets(
+    collection: str = Query(..., description="Tên collection cần đếm facet"),
+    facets: Optional[List[str]] = Query(None, description="Các field facet (mặc định: Country, Funding_Level, Scholarship_Type, Wanted_Degree, Eligible_Field_Group)"),
+    facet_size: int = Query(50, ge=1, le=500, description="Số giá trị tối đa mỗi facet"),
+    inter_field_operator: Literal["AND", "OR"] = Query("AND", description="Toán tử kết hợp các bộ lọc với nhau"),
+    filters: List[FilterItem] = Body([], examples=[filter_example]),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Trả về các giá trị có sẵn và số lượng học bổng cho từng facet, theo các bộ lọc đang áp dụng.
+    Số đếm của mỗi facet bỏ qua bộ lọc trên chính field đó (post_filter).
+    """
+    try:
+        result = await facet_counts_async(
+            es,
+            index=collection,
+            collection=collection,
+            filters=[item.model_dump() for item in filters],
+            inter_field_operator=inter_field_operator,
+            facets=facets,
+            facet_size=facet_size,
+        )
+        return ORJSONResponse(result)
+    except Exception as e:
+        return ORJSONResponse({
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "message": "Facet aggregation failed. Elasticsearch may be overloaded. Please try again.",
+            "total": 0,
+            "facets": {}
+        })
+
+
+@router.post("/batch", response_class=ORJSONResponse)
+async def batch(
+    specs: List[BatchSpec] = Body(..., max_length=20, examples=[[
+        {"type": "search", "collection": "scholarships", "q": "data science"},
+        {"type": "filter", "collection": "scholarships", "filters": filter_example},
+    ]]),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Chạy nhiều truy vấn search/filter trong một round-trip `_msearch`.
+    Kết quả trả về theo đúng thứ tự, mỗi phần tử có field `error` riêng.
+    """
+    try:
+        results = await multi_search_async(
+            es,
+            [
+                {
+                    "type": spec.type,
+                    "index": spec.collection,
+                    "collection": spec.collection,
+                    "q": spec.q,
+                    "filters": [item.model_dump() for item in spec.filters],
+                    "inter_field_operator": spec.inter_field_operator,
+                    "size": spec.size,
+                    "offset": spec.offset,
+                    "fields": resolve_fields(spec.fields),
+                }
+                for spec in specs
+            ],
+        )
+        return ORJSONResponse({"results": results})
+    except Exception as e:
+        return ORJSONResponse({
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "message": "Batch search failed. Elasticsearch may be overloaded. Please try again.",
+            "results": []
+        })
+
+
+@router.get("/scholarships/{doc_id}", response_class=ORJSONResponse)
+async def get_scholarship_detail(
+    doc_id: str,
+    collection: str = Query(..., description="Tên collection chứa học bổng"),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Trả về đầy đủ document của một học bổng (trang chi tiết).
+    """
+    try:
+        doc = await get_scholarship_async(es, index=collection, doc_id=doc_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Could not load scholarship '{doc_id}': {type(e).__name__}: {e}",
+        )
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Scholarship '{doc_id}' not found in '{collection}'")
+    return ORJSONResponse(doc)
+
+
+@router.get("/scholarships/{doc_id}/similar", response_class=ORJSONResponse)
+async def get_similar_scholarships(
+    doc_id: str,
+    collection: str = Query(..., description="Tên collection chứa học bổng"),
+    size: int = Query(5, ge=1, le=50),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Học bổng tương tự (tính sẵn bởi `scripts/build_similar.py`): tra danh sách
+    láng giềng theo id rồi lấy card theo id.
+    """
+    graph = await asyncio.to_thread(get_similar_graph)
+    if graph is None:
+        raise HTTPException(status_code=503, detail="Similar scholarships have not been computed yet")
+    neighbors = graph.similar(doc_id, size)
+    if neighbors is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    scores = dict(neighbors)
+    try:
+        cards = await get_cards_async(es, index=collection, ids=[n for n, _ in neighbors])
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Could not load similar scholarships of '{doc_id}': {type(e).__name__}: {e}",
+        )
+    return ORJSONResponse({
+        "id": doc_id,
+        "items": [{**card, "score": scores.get(card["id"])} for card in cards],
+        "computed_at": graph.built_at,
+    })
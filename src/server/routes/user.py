@@ -1,10 +1,14 @@
 # routes/user.py
-import os
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional
 from fastapi import APIRouter, Query, Body, HTTPException, status, Depends
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch
 
-from services.user_svc import find_matching_scholarships_for_profile
+from services.user_svc import find_matching_scholarships_for_profile_async
+from services.match_feed_svc import get_new_matches, mark_matches_seen
+from services.recommendation_svc import get_materializer
+from services.es_svc import get_cards_async
+from services.es_client import get_async_search_es
 from dtos.user_dtos import (
     UserProfile,
     ScholarshipInterest,
@@ -22,10 +26,6 @@ from services.auth_svc import (
 
 router = APIRouter()
 
-ES_HOST = os.getenv("ELASTICSEARCH_HOST")
-ES_USER = os.getenv("ELASTIC_USER")
-ES_PASS = os.getenv("ELASTIC_PASSWORD")
-
 profile_example_data = {
     "uid": "user123",
     "email": "user@example.com",
@@ -44,9 +44,9 @@ profile_example_data = {
     "/match-scholarships-by-profile",
     response_model=Dict[str, Any],
     summary="Tìm học bổng phù hợp với hồ sơ người dùng",
-    description="Nhận một profile người dùng và trả về danh sách các học bổng tiềm năng được tìm thấy dựa trên các tiêu chí mong muốn. Đây là bước truy xuất ban đầu, chuẩn bị cho giai đoạn AI tái xếp hạng.",
+    description="Nhận một profile người dùng và trả về danh sách các học bổng tiềm năng, xếp hạng theo trọng số các tiêu chí mong muốn, độ phù hợp GPA / kinh nghiệm và hạn nộp.",
 )
-def match_scholarships_by_profile(
+async def match_scholarships_by_profile(
     # --- Thay đổi ở đây: Bỏ giá trị mặc định, dùng `...` để làm bắt buộc ---
     collection: str = Query(
         ..., # Tham số này giờ là bắt buộc
@@ -63,27 +63,20 @@ def match_scholarships_by_profile(
         ...,
         example=profile_example_data,
         description="Toàn bộ thông tin profile của người dùng để tìm học bổng phù hợp."
-    )
+    ),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
 ):
     """
     Endpoint này cho phép người dùng gửi thông tin profile của mình để nhận danh sách các học bổng
     tiềm năng. Hệ thống sẽ sử dụng các quy tắc để chuyển đổi profile thành các bộ lọc tìm kiếm
     trên Elasticsearch.
 
-    Kết quả trả về là một danh sách các học bổng được sắp xếp dựa trên độ phù hợp ban đầu của Elasticsearch.
-    Trong các phiên bản sau, kết quả này sẽ được AI phân tích và tái xếp hạng để mang lại độ chính xác cao hơn.
+    Kết quả trả về được xếp hạng ngay trong Elasticsearch (một lần gọi): mỗi tiêu chí khớp cộng
+    điểm theo trọng số, cộng thêm độ phù hợp GPA / số năm kinh nghiệm và điểm cho hạn nộp gần.
     """
-    es = Elasticsearch(
-            hosts=[ES_HOST],
-            basic_auth=(ES_USER, ES_PASS),
-            verify_certs=False,
-            max_retries=30,
-            retry_on_timeout=True,
-            request_timeout=30,
-        )
     try:
 
-        return find_matching_scholarships_for_profile(
+        return await find_matching_scholarships_for_profile_async(
             client=es,
             user_profile=user_profile,
             index=collection,
@@ -98,8 +91,101 @@ def match_scholarships_by_profile(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Đã xảy ra lỗi nội bộ: {str(e)}",
         )
-    finally:
-        es.close()
+
+
+@router.get(
+    "/recommendations/{uid}",
+    response_model=Dict[str, Any],
+    summary="Get precomputed scholarship recommendations (Protected)",
+    description="Top scholarships for the user's profile, computed in the background and hydrated as cards. User can only access their own data.",
+)
+async def get_user_recommendations(
+    uid: str,
+    size: int = Query(10, ge=1, le=100, description="Số lượng học bổng trả về"),
+    offset: int = Query(0, ge=0, description="Vị trí bắt đầu (dùng cho phân trang)"),
+    current_user: AuthenticatedUser = Depends(verify_firebase_user),
+    es: AsyncElasticsearch = Depends(get_async_search_es),
+):
+    """
+    Đọc danh sách gợi ý đã tính sẵn (id + score) rồi lấy card theo id. Danh sách
+    được tính lại ở background khi profile hoặc catalog thay đổi (`stale: true`
+    nghĩa là đang trả bản cũ trong lúc tính lại).
+    """
+    require_user_ownership(current_user, uid)
+
+    materializer = get_materializer()
+    if materializer is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Recommendations are not available")
+
+    try:
+        entry = await asyncio.to_thread(materializer.get, uid)
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+        ids = entry["ids"][offset:offset + size]
+        scores = dict(zip(entry["ids"], entry["scores"]))
+        cards = await get_cards_async(es, index=materializer.collection, ids=ids)
+        return {
+            "uid": uid,
+            "total": len(entry["ids"]),
+            "items": [{**card, "score": scores.get(card["id"])} for card in cards],
+            "computed_at": entry["computed_at"],
+            "stale": entry["stale"],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to load recommendations: {str(e)}"
+        )
+
+
+@router.get(
+    "/new-matches/{uid}",
+    response_model=Dict[str, Any],
+    summary="Get newly matched scholarships (Protected)",
+    description="Scholarships ingested after the user's profile was saved that match their desired criteria. User can only access their own data.",
+)
+async def get_user_new_matches(
+    uid: str,
+    unseen_only: bool = Query(True, description="Chỉ lấy các match chưa xem"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: AuthenticatedUser = Depends(verify_firebase_user)
+):
+    require_user_ownership(current_user, uid)
+
+    try:
+        items = get_new_matches(uid, unseen_only=unseen_only, limit=limit)
+        return {"uid": uid, "total": len(items), "items": items}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to load new matches: {str(e)}"
+        )
+
+
+@router.post(
+    "/new-matches/{uid}/seen",
+    response_model=Dict[str, Any],
+    summary="Mark new matches as seen (Protected)",
+    description="Mark the given scholarships (or all unseen matches when no ids are sent) as seen. User can only modify their own data.",
+)
+async def mark_user_new_matches_seen(
+    uid: str,
+    scholarship_ids: Optional[List[str]] = Body(None, description="Danh sách scholarship_id; bỏ trống = tất cả"),
+    current_user: AuthenticatedUser = Depends(verify_firebase_user)
+):
+    require_user_ownership(current_user, uid)
+
+    try:
+        marked = mark_matches_seen(uid, scholarship_ids)
+        return {"uid": uid, "marked": marked}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to mark matches as seen: {str(e)}"
+        )
 
 
 @router.get(
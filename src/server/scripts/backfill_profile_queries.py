@@ -0,0 +1,40 @@
+"""
+Đăng ký query percolator (feed "học bổng mới phù hợp") cho mọi user hiện có.
+
+    python scripts/backfill_profile_queries.py
+    python scripts/backfill_profile_queries.py --collection scholarships_test
+
+Server tự chạy khi percolator index chưa tồn tại; chạy lại script này sau khi
+đổi mapping percolator hoặc cách map profile -> filter.
+Cần GOOGLE_APPLICATION_CREDENTIALS (đọc profile từ Firestore).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin  # noqa: E402
+from firebase_admin import credentials, firestore  # noqa: E402
+
+from services.es_client import create_es_client  # noqa: E402
+from services.match_feed_svc import SCHOLARSHIP_COLLECTION, backfill_profile_queries  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default=SCHOLARSHIP_COLLECTION)
+    args = parser.parse_args()
+
+    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not cred_path or not os.path.exists(cred_path):
+        raise RuntimeError("Missing GOOGLE_APPLICATION_CREDENTIALS env")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+    counts = backfill_profile_queries(create_es_client(), firestore.client(), args.collection)
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Benchmark: catch-all `__text` tính bằng Python (trước) vs copy_to trong mapping (sau).
+
+Dữ liệu: data/1_bronze/scholarships.json (nhân bản `--repeat` lần).
+
+    python scripts/bench_catch_all.py --repeat 200
+
+Luôn đo phần offline (thời gian chuẩn bị payload + số byte bulk gửi đi).
+Nếu có ELASTICSEARCH_HOST thì index vào 2 index tạm để đo thêm throughput bulk
+và dung lượng store, sau đó xóa index tạm.
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.es_svc import _index_body, _prepare_source  # noqa: E402
+
+DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "data", "1_bronze", "scholarships.json"
+)
+
+
+def legacy_catch_all(doc: Dict[str, Any]) -> str:
+    """Bản sao của `_catch_all` cũ (walk đệ quy toàn bộ document)."""
+    vals: List[str] = []
+
+    def walk(x):
+        if isinstance(x, dict):
+            for v in x.values():
+                walk(v)
+        elif isinstance(x, list):
+            for v in x:
+                walk(v)
+        elif isinstance(x, (str, int, float, bool)):
+            vals.append(str(x))
+
+    walk(doc)
+    return " ".join(vals)
+
+
+def legacy_source(doc: Dict[str, Any], collection: str) -> Dict[str, Any]:
+    src = _prepare_source(doc, collection)
+    src["__text"] = legacy_catch_all(doc)
+    return src
+
+
+def legacy_body() -> Dict[str, Any]:
+    body = copy.deepcopy(_index_body())
+    mappings = body["mappings"]
+    mappings.pop("_source", None)
+    mappings.pop("dynamic_templates", None)
+    for prop in mappings["properties"].values():
+        prop.pop("copy_to", None)
+    return body
+
+
+def build_actions(docs, index, prepare):
+    return [
+        {"_op_type": "index", "_index": index, "_id": f"{i}", "_source": prepare(d, index)}
+        for i, d in enumerate(docs)
+    ]
+
+
+def ndjson_bytes(actions) -> int:
+    total = 0
+    for a in actions:
+        total += len(json.dumps({"index": {"_index": a["_index"], "_id": a["_id"]}}).encode()) + 1
+        total += len(json.dumps(a["_source"], default=str, ensure_ascii=False).encode()) + 1
+    return total
+
+
+def offline(docs) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, prepare in (("before", legacy_source), ("after", _prepare_source)):
+        start = time.perf_counter()
+        actions = build_actions(docs, "bench", prepare)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "prepare_s": elapsed,
+            "bulk_mb": ndjson_bytes(actions) / 1024 / 1024,
+        }
+    return results
+
+
+def online(docs, host: str) -> Dict[str, Dict[str, float]]:
+    from elasticsearch import Elasticsearch, helpers
+
+    es = Elasticsearch(
+        hosts=[host],
+        basic_auth=(os.getenv("ELASTIC_USER"), os.getenv("ELASTIC_PASSWORD")),
+        verify_certs=False,
+        request_timeout=300,
+    )
+    results = {}
+    for name, body, prepare in (
+        ("before", legacy_body(), legacy_source),
+        ("after", _index_body(), _prepare_source),
+    ):
+        index = f"bench_catch_all_{name}"
+        es.options(ignore_status=404).indices.delete(index=index)
+        es.indices.create(index=index, **body)
+        start = time.perf_counter()
+        success, _ = helpers.bulk(es, build_actions(docs, index, prepare), chunk_size=500, raise_on_error=False)
+        es.indices.refresh(index=index)
+        elapsed = time.perf_counter() - start
+        es.indices.forcemerge(index=index, max_num_segments=1)
+        stats = es.indices.stats(index=index, metric="store")
+        results[name] = {
+            "docs_per_s": success / elapsed,
+            "store_mb": stats["_all"]["primaries"]["store"]["size_in_bytes"] / 1024 / 1024,
+        }
+        es.indices.delete(index=index)
+    es.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--data", default=DATA_PATH)
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        base = json.load(f)
+    docs = [dict(d, id=f"{r}-{i}") for r in range(args.repeat) for i, d in enumerate(base)]
+    print(f"📄 {len(docs)} docs ({len(base)} x {args.repeat})")
+
+    for name, row in offline(docs).items():
+        print(f"[offline] {name:6s} prepare={row['prepare_s']:.3f}s bulk={row['bulk_mb']:.2f}MB")
+
+    host = os.getenv("ELASTICSEARCH_HOST")
+    if host:
+        for name, row in online(docs, host).items():
+            print(f"[es]      {name:6s} throughput={row['docs_per_s']:.0f} docs/s store={row['store_mb']:.2f}MB")
+    else:
+        print("ℹ️  ELASTICSEARCH_HOST not set, skipping throughput / index size")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Job offline: tính đồ thị "học bổng tương tự" cho `/scholarships/{id}/similar`.
+
+    python scripts/build_similar.py                # chỉ tính lại học bổng thay đổi
+    python scripts/build_similar.py --full         # tính lại toàn bộ
+
+Cần GOOGLE_APPLICATION_CREDENTIALS (đọc catalog từ Firestore, khóa theo id document)
+và ES_EMBEDDER=chatbot nếu muốn dùng embedding (không có thì chỉ dùng facet).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase_admin  # noqa: E402
+from firebase_admin import credentials  # noqa: E402
+
+from services.similar_svc import SIMILAR_GRAPH_PATH, SIMILAR_TOP_K, build_similar_graph, load_catalog  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default=os.getenv("SCHOLARSHIP_COLLECTION", "scholarships"))
+    parser.add_argument("--top-k", type=int, default=SIMILAR_TOP_K)
+    parser.add_argument("--path", default=SIMILAR_GRAPH_PATH)
+    parser.add_argument("--full", action="store_true", help="Bỏ qua đồ thị cũ, tính lại toàn bộ")
+    args = parser.parse_args()
+
+    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    if not cred_path or not os.path.exists(cred_path):
+        raise RuntimeError("Missing GOOGLE_APPLICATION_CREDENTIALS env")
+    firebase_admin.initialize_app(credentials.Certificate(cred_path))
+
+    ids, docs = load_catalog(args.collection)
+    print(f"📄 {len(docs)} scholarships in catalog")
+    build_similar_graph(ids, docs, path=args.path, top_k=args.top_k, full=args.full)
+
+
+if __name__ == "__main__":
+    main()
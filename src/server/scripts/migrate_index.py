@@ -0,0 +1,48 @@
+"""
+Migration: rebuild các index có mapping cũ (hoặc index legacy chưa có alias)
+sang phiên bản mới với mapping hiện tại, rồi đổi alias.
+
+    python scripts/migrate_index.py scholarships
+    python scripts/migrate_index.py scholarships --force   # rebuild kể cả khi mapping đã mới
+
+Search không tự rebuild khi thấy mapping cũ (chỉ log cảnh báo), nên sau khi
+đổi `_index_body` cần chạy script này hoặc `POST /sync?force=true`.
+Lock cấp cluster đảm bảo chỉ một nơi build tại một thời điểm.
+"""
+import argparse
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.es_client import create_es_client  # noqa: E402
+from services.es_svc import IndexLockedError, index_is_outdated, mapping_hash, rebuild_index  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("aliases", nargs="+")
+    parser.add_argument("--force", action="store_true", help="Rebuild kể cả khi mapping đã khớp")
+    args = parser.parse_args()
+
+    client = create_es_client()
+    failed = False
+    for alias in args.aliases:
+        if not client.indices.exists(index=alias):
+            print(f"⏭️  '{alias}' does not exist, skipping")
+            continue
+        if not args.force and not index_is_outdated(client, alias):
+            print(f"✅ '{alias}' already on mapping {mapping_hash()}")
+            continue
+        try:
+            rebuild_index(client, alias, owner=f"migrate_index on {socket.gethostname()} (pid {os.getpid()})")
+        except IndexLockedError as e:
+            failed = True
+            print(f"🔒 {e}")
+    client.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+# services/cache_svc.py
+"""
+Cache kết quả search/filter.
+
+Dữ liệu học bổng chỉ thay đổi khi có sync, nên mỗi collection (index) có một
+"generation" được tăng bởi `index_many` / `apply_changes` / đổi alias. Generation
+nằm trong cache key, nên sau khi sync các entry cũ không bao giờ được đọc lại
+(invalidation chính xác, LRU tự dọn). TTL chỉ là lưới an toàn; hết TTL nhưng
+còn trong cửa sổ stale thì trả entry cũ ngay và làm mới ở background
+(stale-while-revalidate).
+
+Mặc định cache nằm trong process (LRU + TTL) và bộ đếm generation cũng vậy,
+nên cache key còn gồm phiên bản catalog dùng chung giữa các worker (index vật
+lý sau alias + watermark sync trong `_sync_state`, xem `start_version_poller`),
+đọc lại mỗi `SEARCH_CACHE_VERSION_POLL` giây. Sync job / change feed chạy ở
+worker khác đổi phiên bản này, nên mọi worker bỏ entry cũ chậm nhất sau một
+chu kỳ poll thay vì chờ hết TTL. Đặt `SEARCH_CACHE_URL=redis://...` để dùng
+Redis chung (cả entry lẫn generation, invalidation tức thì; cần cài `redis`).
+Generation là bộ đếm trong process / Redis, không dùng được làm "phiên bản"
+lưu lâu dài (Firestore...).
+
+Giá trị trả về là bản sao: caller sửa kết quả (thêm `degraded`, `stale`...)
+không làm hỏng entry trong cache.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "60"))
+SEARCH_CACHE_MAXSIZE = int(os.getenv("SEARCH_CACHE_MAXSIZE", "2048"))
+SEARCH_CACHE_URL = os.getenv("SEARCH_CACHE_URL")
+SEARCH_CACHE_VERSION_POLL = float(os.getenv("SEARCH_CACHE_VERSION_POLL", "5"))
+
+ES_CACHE_REQUESTS = Counter(
+    "es_cache_requests_total",
+    "Search result cache lookups",
+    ["op", "result"],  # result: hit | stale | miss
+)
+ES_CACHE_ENTRIES = Gauge(
+    "es_cache_entries",
+    "Entries currently held by the in-process search result cache",
+)
+
+# (value, fresh_until, stale_until)
+_Entry = Tuple[Any, float, float]
+
+
+class _LocalBackend:
+    """LRU + TTL trong process."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                del self._entries[key]
+                ES_CACHE_ENTRIES.set(len(self._entries))
+                return None
+            self._entries.move_to_end(key)
+        value, fresh_until, stale_until = entry
+        return copy.deepcopy(value), fresh_until, stale_until
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float) -> None:
+        now = time.monotonic()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (value, now + ttl, now + ttl + stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+            ES_CACHE_ENTRIES.set(len(self._entries))
+
+    def generation(self, collection: str) -> int:
+        with self._lock:
+            return self._generations.get(collection, 0)
+
+    def bump(self, collection: str) -> int:
+        with self._lock:
+            gen = self._generations.get(collection, 0) + 1
+            self._generations[collection] = gen
+            return gen
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            ES_CACHE_ENTRIES.set(0)
+
+
+class _RedisBackend:
+    """Cache dùng chung giữa các worker; generation cũng nằm trên Redis (INCR)."""
+
+    blocking = True
+
+    def __init__(self, url: str):
+        import redis  # optional dependency
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key: str) -> Optional[_Entry]:
+        raw = self._redis.get(f"search_cache:{key}")
+        if raw is None:
+            return None
+        value, fresh_until, stale_until = json.loads(raw)
+        # Redis lưu mốc thời gian tuyệt đối (time.time) vì được chia sẻ giữa các process
+        offset = time.monotonic() - time.time()
+        return value, fresh_until + offset, stale_until + offset
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float) -> None:
+        now = time.time()
+        payload = json.dumps([value, now + ttl, now + ttl + stale_ttl], ensure_ascii=False, default=str)
+        self._redis.set(f"search_cache:{key}", payload, ex=max(1, int(ttl + stale_ttl)))
+
+    def generation(self, collection: str) -> int:
+        return int(self._redis.get(f"search_cache_gen:{collection}") or 0)
+
+    def bump(self, collection: str) -> int:
+        return int(self._redis.incr(f"search_cache_gen:{collection}"))
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter("search_cache:*"):
+            self._redis.delete(key)
+
+
+def _create_backend():
+    if SEARCH_CACHE_URL:
+        try:
+            backend = _RedisBackend(SEARCH_CACHE_URL)
+            print(f"🗄️  Search cache: shared backend {SEARCH_CACHE_URL.split('@')[-1]}")
+            return backend
+        except ImportError:
+            print("⚠️  SEARCH_CACHE_URL is set but 'redis' is not installed, using in-process cache")
+    return _LocalBackend(SEARCH_CACHE_MAXSIZE)
+
+
+_backend = _create_backend()
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+_background_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+# ============================================================================
+# Generation
+# ============================================================================
+
+def get_generation(collection: str) -> int:
+    try:
+        return _backend.generation(collection)
+    except Exception as e:
+        print(f"⚠️  Cache generation lookup failed for '{collection}': {e}")
+        return -1
+
+
+def bump_generation(collection: str) -> int:
+    """Đánh dấu dữ liệu của `collection` đã thay đổi: mọi entry cũ không còn được dùng."""
+    try:
+        return _backend.bump(collection)
+    except Exception as e:
+        print(f"⚠️  Cache generation bump failed for '{collection}': {e}")
+        return -1
+
+
+def clear_cache() -> None:
+    _backend.clear()
+
+
+# ============================================================================
+# Phiên bản catalog dùng chung (backend trong process)
+# ============================================================================
+
+_shared_versions: Dict[str, str] = {}
+_version_stop = threading.Event()
+_version_thread: Optional[threading.Thread] = None
+
+
+def _generation_tag(collection: str) -> str:
+    return f"{get_generation(collection)}@{_shared_versions.get(collection, '-')}"
+
+
+def _poll_versions(read_version: Callable[[str], str], collections: Iterable[str]) -> None:
+    for collection in collections:
+        try:
+            version = read_version(collection)
+        except Exception as e:
+            print(f"⚠️  Could not read catalog version of '{collection}': {e}")
+            continue
+        previous = _shared_versions.get(collection)
+        if version != previous:
+            _shared_versions[collection] = version
+            if previous is not None:
+                print(f"🗄️  Catalog '{collection}' changed ({version}), cached results dropped")
+
+
+def start_version_poller(
+    read_version: Callable[[str], str],
+    collections: Iterable[str],
+    *,
+    interval: float = SEARCH_CACHE_VERSION_POLL,
+) -> None:
+    """
+    Đọc phiên bản catalog (`read_version(collection)`) ngay và sau đó mỗi
+    `interval` giây ở thread nền; phiên bản nằm trong cache key. Không cần khi
+    dùng Redis (generation đã dùng chung).
+    """
+    global _version_thread
+    if not SEARCH_CACHE_ENABLED or _backend.blocking or _version_thread is not None:
+        return
+    collections = list(collections)
+    _poll_versions(read_version, collections)
+
+    def loop() -> None:
+        while not _version_stop.wait(interval):
+            _poll_versions(read_version, collections)
+
+    _version_thread = threading.Thread(target=loop, name="cache-version-poller", daemon=True)
+    _version_thread.start()
+
+
+def stop_version_poller() -> None:
+    _version_stop.set()
+
+
+# ============================================================================
+# Lookup
+# ============================================================================
+
+def cache_key(op: str, collection: str, generation: Any, params: Dict[str, Any]) -> str:
+    """Key ổn định: JSON với key đã sort, nên thứ tự tham số không ảnh hưởng."""
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    return f"{collection}:{generation}:{op}:{digest}"
+
+
+def _lookup(key: str) -> Optional[_Entry]:
+    try:
+        return _backend.get(key)
+    except Exception as e:
+        print(f"⚠️  Cache read failed: {e}")
+        return None
+
+
+def _store(key: str, value: Any) -> None:
+    try:
+        _backend.set(key, value, SEARCH_CACHE_TTL, SEARCH_CACHE_STALE_TTL)
+    except Exception as e:
+        print(f"⚠️  Cache write failed: {e}")
+
+
+def _claim_refresh(key: str) -> bool:
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release_refresh(key: str) -> None:
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def cached(op: str, collection: str, params: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+    """Trả kết quả từ cache nếu có, nếu không thì gọi `compute()` và lưu lại."""
+    if not SEARCH_CACHE_ENABLED:
+        return compute()
+
+    key = cache_key(op, collection, _generation_tag(collection), params)
+    entry = _lookup(key)
+    if entry is not None:
+        value, fresh_until, _ = entry
+        if fresh_until > time.monotonic():
+            ES_CACHE_REQUESTS.labels(op, "hit").inc()
+            return value
+        ES_CACHE_REQUESTS.labels(op, "stale").inc()
+        if _claim_refresh(key):
+            def refresh() -> None:
+                try:
+                    _store(key, compute())
+                except Exception as e:
+                    print(f"⚠️  Background cache refresh failed ({op}): {e}")
+                finally:
+                    _release_refresh(key)
+
+            threading.Thread(target=refresh, daemon=True).start()
+        return value
+
+    ES_CACHE_REQUESTS.labels(op, "miss").inc()
+    value = compute()
+    _store(key, value)
+    return value
+
+
+async def cached_async(
+    op: str, collection: str, params: Dict[str, Any], compute: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Phiên bản asyncio của `cached`."""
+    if not SEARCH_CACHE_ENABLED:
+        return await compute()
+
+    if _backend.blocking:
+        generation = await asyncio.to_thread(_generation_tag, collection)
+        key = cache_key(op, collection, generation, params)
+        entry = await asyncio.to_thread(_lookup, key)
+    else:
+        key = cache_key(op, collection, _generation_tag(collection), params)
+        entry = _lookup(key)
+
+    async def store(value: Any) -> None:
+        if _backend.blocking:
+            await asyncio.to_thread(_store, key, value)
+        else:
+            _store(key, value)
+
+    if entry is not None:
+        value, fresh_until, _ = entry
+        if fresh_until > time.monotonic():
+            ES_CACHE_REQUESTS.labels(op, "hit").inc()
+            return value
+        ES_CACHE_REQUESTS.labels(op, "stale").inc()
+        if _claim_refresh(key):
+            async def refresh() -> None:
+                try:
+                    await store(await compute())
+                except Exception as e:
+                    print(f"⚠️  Background cache refresh failed ({op}): {e}")
+                finally:
+                    _release_refresh(key)
+
+            task = asyncio.create_task(refresh())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return value
+
+    ES_CACHE_REQUESTS.labels(op, "miss").inc()
+    value = await compute()
+    await store(value)
+    return value
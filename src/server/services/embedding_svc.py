@@ -0,0 +1,86 @@
+# services/embedding_svc.py
+"""
+Embedder cắm được cho `index_many` / `search_hybrid`.
+
+Embedder là bất kỳ object nào có `embed_documents(texts) -> List[List[float]]`
+và `embed_query(text) -> List[float]` (đúng interface `Embeddings` của
+LangChain, nên dùng lại được model của chatbot).
+
+`ES_EMBEDDER`:
+  - "none" (mặc định): không tính embedding, hybrid search lùi về BM25.
+  - "chatbot": dùng `get_embedding_model()` của chatbot_thread2 (theo
+    `EMBEDDING_CHOICE`, google = 768 chiều, hf/e5-large = 1024 chiều).
+`ES_EMBEDDING_DIMS` phải khớp số chiều của model.
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional, Protocol
+
+ES_EMBEDDER = os.getenv("ES_EMBEDDER", "none").lower()
+ES_EMBEDDING_DIMS = int(os.getenv("ES_EMBEDDING_DIMS", "768"))
+ES_EMBEDDING_BATCH = int(os.getenv("ES_EMBEDDING_BATCH", "64"))
+EMBEDDING_FIELD = "embedding"
+
+# Các field đưa vào text để embed (theo thứ tự ưu tiên), cắt bớt cho vừa context model
+EMBEDDING_SOURCE_FIELDS = [
+    "Scholarship_Name",
+    "Country",
+    "Wanted_Degree",
+    "Scholarship_Type",
+    "Funding_Level",
+    "Eligible_Field_Group",
+    "Eligible_Fields",
+    "Eligibility_Criteria",
+    "Funding_Details",
+]
+EMBEDDING_MAX_CHARS = 2000
+
+
+class Embedder(Protocol):
+    def embed_documents(self, texts: List[str]) -> List[List[float]]: ...
+
+    def embed_query(self, text: str) -> List[float]: ...
+
+
+_embedder: Optional[Embedder] = None
+_embedder_loaded = False
+_embedder_lock = threading.Lock()
+
+
+def set_embedder(embedder: Optional[Embedder]) -> None:
+    """Gắn embedder tùy ý (ví dụ trong script hoặc khi đổi model)."""
+    global _embedder, _embedder_loaded
+    with _embedder_lock:
+        _embedder = embedder
+        _embedder_loaded = True
+
+
+def get_embedder() -> Optional[Embedder]:
+    """Embedder theo `ES_EMBEDDER`, khởi tạo lười một lần; None nếu không bật."""
+    global _embedder, _embedder_loaded
+    if _embedder_loaded:
+        return _embedder
+    with _embedder_lock:
+        if not _embedder_loaded:
+            if ES_EMBEDDER == "chatbot":
+                try:
+                    from services.chatbot_thread2.rag_pipeline.indexing import get_embedding_model
+
+                    _embedder = get_embedding_model()
+                    print(f"🧭 Embedder: chatbot model ({ES_EMBEDDING_DIMS} dims)")
+                except Exception as e:
+                    print(f"⚠️  Could not load chatbot embedding model, hybrid search falls back to BM25: {e}")
+                    _embedder = None
+            elif ES_EMBEDDER != "none":
+                print(f"⚠️  Unknown ES_EMBEDDER '{ES_EMBEDDER}', embeddings disabled")
+            _embedder_loaded = True
+    return _embedder
+
+
+def embedding_text(doc: Dict[str, Any]) -> str:
+    parts = []
+    for field in EMBEDDING_SOURCE_FIELDS:
+        value = doc.get(field)
+        if value:
+            parts.append(f"{field}: {value}")
+    return "\n".join(parts)[:EMBEDDING_MAX_CHARS]
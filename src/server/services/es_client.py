@@ -0,0 +1,168 @@
+# services/es_client.py
+import os
+import socket
+import time
+from typing import Callable, List, Tuple
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from fastapi import Request
+from prometheus_client import Gauge, Histogram
+from prometheus_fastapi_instrumentator.metrics import Info
+from urllib3.connection import HTTPConnection
+
+ES_HOST = os.getenv("ELASTICSEARCH_HOST")
+ES_USER = os.getenv("ELASTIC_USER")
+ES_PASS = os.getenv("ELASTIC_PASSWORD")
+
+# --- Pool tuning (override qua biến môi trường) ---
+ES_POOL_MAXSIZE = int(os.getenv("ES_POOL_MAXSIZE", "20"))
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+ES_KEEPALIVE_IDLE = int(os.getenv("ES_KEEPALIVE_IDLE", "60"))
+ES_KEEPALIVE_INTERVAL = int(os.getenv("ES_KEEPALIVE_INTERVAL", "15"))
+ES_KEEPALIVE_COUNT = int(os.getenv("ES_KEEPALIVE_COUNT", "4"))
+
+# --- Timeout theo loại route (giây) ---
+ES_SEARCH_TIMEOUT = float(os.getenv("ES_SEARCH_TIMEOUT", "30"))
+ES_SYNC_TIMEOUT = float(os.getenv("ES_SYNC_TIMEOUT", "120"))
+ES_HEALTH_TIMEOUT = float(os.getenv("ES_HEALTH_TIMEOUT", "5"))
+
+# --- Bulk indexing (sync Firestore -> ES) ---
+ES_BULK_CONCURRENCY = int(os.getenv("ES_BULK_CONCURRENCY", "4"))
+ES_BULK_CHUNK_DOCS = int(os.getenv("ES_BULK_CHUNK_DOCS", "500"))
+ES_BULK_MAX_BYTES = int(os.getenv("ES_BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+# Gộp segment sau full sync (tốn IO một lần, search nhanh hơn về sau)
+ES_BULK_FORCE_MERGE = os.getenv("ES_BULK_FORCE_MERGE", "false").lower() == "true"
+# Số replica khôi phục sau bulk load (mặc định của ES là 1)
+ES_NUMBER_OF_REPLICAS = int(os.getenv("ES_NUMBER_OF_REPLICAS", "1"))
+
+ES_POOL_CONNECTIONS_IN_USE = Gauge(
+    "es_pool_connections_in_use",
+    "Elasticsearch connections currently checked out of the pool",
+)
+ES_POOL_CONNECTIONS_MAX = Gauge(
+    "es_pool_connections_max",
+    "Maximum Elasticsearch connections per node",
+)
+ES_POOL_WAIT_SECONDS = Histogram(
+    "es_pool_wait_seconds",
+    "Time spent waiting for a free Elasticsearch connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+def _keepalive_socket_options() -> List[Tuple[int, int, int]]:
+    """TCP keep-alive để kết nối nhàn rỗi trong pool không bị LB/NAT cắt."""
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, ES_KEEPALIVE_IDLE))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, ES_KEEPALIVE_INTERVAL))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, ES_KEEPALIVE_COUNT))
+    return options
+
+
+def _instrument_pool(pool) -> None:
+    """Bật keep-alive và đo thời gian chờ lấy connection của một urllib3 pool."""
+    pool.conn_kw["socket_options"] = _keepalive_socket_options()
+
+    get_conn = pool._get_conn
+
+    def timed_get_conn(timeout=None):
+        start = time.perf_counter()
+        try:
+            return get_conn(timeout=timeout)
+        finally:
+            ES_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    pool._get_conn = timed_get_conn
+
+
+def create_es_client() -> Elasticsearch:
+    """Tạo client Elasticsearch dùng chung cho toàn bộ process."""
+    client = Elasticsearch(
+        hosts=[ES_HOST],
+        basic_auth=(ES_USER, ES_PASS),
+        verify_certs=False,
+        connections_per_node=ES_POOL_MAXSIZE,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=True,
+        request_timeout=ES_SEARCH_TIMEOUT,
+    )
+    for node in client.transport.node_pool.all():
+        pool = getattr(node, "pool", None)
+        if pool is not None:
+            _instrument_pool(pool)
+    ES_POOL_CONNECTIONS_MAX.set(ES_POOL_MAXSIZE)
+    return client
+
+
+def create_async_es_client() -> AsyncElasticsearch:
+    """Client asyncio (aiohttp) dùng chung cho các route `async def`."""
+    return AsyncElasticsearch(
+        hosts=[ES_HOST],
+        basic_auth=(ES_USER, ES_PASS),
+        verify_certs=False,
+        connections_per_node=ES_POOL_MAXSIZE,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=True,
+        request_timeout=ES_SEARCH_TIMEOUT,
+    )
+
+
+def _connections_in_use(client) -> int:
+    in_use = 0
+    for node in client.transport.node_pool.all():
+        pool = getattr(node, "pool", None)
+        if pool is not None and pool.pool is not None:
+            in_use += pool.pool.maxsize - pool.pool.qsize()
+        session = getattr(node, "session", None)
+        if session is not None and session.connector is not None:
+            in_use += len(session.connector._acquired)
+    return in_use
+
+
+def pool_metrics() -> Callable[[Info], None]:
+    """Instrumentation cho `Instrumentator`: cập nhật số connection đang dùng sau mỗi request."""
+
+    def instrumentation(info: Info) -> None:
+        state = info.request.app.state
+        in_use = 0
+        for name in ("es", "es_async"):
+            client = getattr(state, name, None)
+            if client is not None:
+                in_use += _connections_in_use(client)
+        ES_POOL_CONNECTIONS_IN_USE.set(in_use)
+
+    return instrumentation
+
+
+# ============================================================================
+# FastAPI dependencies
+# ============================================================================
+
+def get_es(request: Request) -> Elasticsearch:
+    """Client dùng chung, được tạo trong lifespan của app."""
+    return request.app.state.es
+
+
+def get_search_es(request: Request) -> Elasticsearch:
+    return get_es(request).options(request_timeout=ES_SEARCH_TIMEOUT)
+
+
+def get_sync_es(request: Request) -> Elasticsearch:
+    return get_es(request).options(request_timeout=ES_SYNC_TIMEOUT)
+
+
+def get_health_es(request: Request) -> Elasticsearch:
+    return get_es(request).options(request_timeout=ES_HEALTH_TIMEOUT, max_retries=0)
+
+
+def get_async_es(request: Request) -> AsyncElasticsearch:
+    """Client asyncio dùng chung, được tạo trong lifespan của app."""
+    return request.app.state.es_async
+
+
+def get_async_search_es(request: Request) -> AsyncElasticsearch:
+    return get_async_es(request).options(request_timeout=ES_SEARCH_TIMEOUT)
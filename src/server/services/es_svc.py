@@ -1,130 +1,689 @@
-from typing import Any, Dict, Iterable, List, Optional, Literal
-from elasticsearch import Elasticsearch, helpers
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import re
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Literal, Set, Tuple
+from elasticsearch import AsyncElasticsearch, BadRequestError, ConflictError, Elasticsearch, NotFoundError, helpers
 
-def ensure_index(client: Elasticsearch, index: str) -> str:
-    if not client.indices.exists(index=index):
-        client.indices.create(
-            index=index,
-            settings={
-                "analysis": {
-                    "analyzer": {
-                        "en_std": {"type": "standard", "stopwords": "_english_"}
-                    }
-                }
+from services.cache_svc import bump_generation, cached, cached_async
+from services.es_client import ES_NUMBER_OF_REPLICAS
+from services.synonyms import country_synonym_rules, synonym_rules
+from services.embedding_svc import (
+    EMBEDDING_FIELD,
+    ES_EMBEDDING_BATCH,
+    ES_EMBEDDING_DIMS,
+    Embedder,
+    embedding_text,
+)
+
+def _index_body() -> Dict[str, Any]:
+    """Settings và mappings dùng chung khi tạo index (sync lẫn async)."""
+    return dict(
+        settings={
+            # Doc được lưu theo hạn nộp tăng dần: query "còn hạn, sắp hết hạn trước"
+            # (sort end_date asc) dừng sớm được thay vì duyệt cả index
+            "index": {
+                "sort.field": "end_date",
+                "sort.order": "asc",
+                "sort.missing": "_last",
             },
-            mappings={
-                "properties": {
-                    "collection": {"type": "keyword"},
-                    "__text": {"type": "text", "analyzer": "en_std"},
-                    "Scholarship_Name": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Country": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "country": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Funding_Level": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Scholarship_Type": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "degreeLevel": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Required_Degree": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "fieldOfStudy": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Eligible_Fields": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Eligible_Field_Group": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Wanted_Degree": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                        "fields": {"raw": {"type": "keyword"}},
-                    },
-                    "Language_Certificate": {
-                        "type": "text",
-                        "analyzer": "en_std",
+            "analysis": {
+                "filter": {
+                    "english_stop": {"type": "stop", "stopwords": "_english_"},
+                    # Chỉ dùng lúc search: "Đức" -> germany, "toàn phần" -> full scholarship...
+                    "vi_en_synonyms": {"type": "synonym_graph", "synonyms": synonym_rules(), "lenient": True},
+                    # Riêng field Country: thêm tên nước một từ ("Đức", "Mỹ"), không mơ hồ ở đây
+                    "vi_en_country_synonyms": {
+                        "type": "synonym_graph", "synonyms": country_synonym_rules(), "lenient": True,
                     },
-                    "Min_Gpa": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                },
+                "analyzer": {
+                    "en_std": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "english_stop"],
                     },
-                    "Experience_Years": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                    "en_search": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "vi_en_synonyms", "english_stop"],
                     },
-                    "Funding_Details": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                    "country_search": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "vi_en_country_synonyms", "english_stop"],
                     },
-                    "Eligibility_Criteria": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                    # Gợi ý khi gõ: bỏ dấu tiếng Việt để "hoc bong duc" khớp "Học bổng Đức"
+                    "folding": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding"],
                     },
-                    "Other_Requirements": {
-                        "type": "text",
-                        "analyzer": "en_std",
-                    },
-                    "End_Date": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                }
+            }
+        },
+        mappings={
+            # `__text` được ES điền qua copy_to, không lưu trong _source
+            "_source": {"excludes": ["__text"]},
+            "dynamic_templates": [
+                {
+                    "strings_to_catch_all": {
+                        "match_mapping_type": "string",
+                        "mapping": {
+                            "type": "text",
+                            "analyzer": "en_std",
+                            "search_analyzer": "en_search",
+                            "copy_to": "__text",
+                            "fields": {"keyword": {"type": "keyword", "ignore_above": 256}},
+                        },
+                    }
+                }
+            ],
+            "properties": {
+                "collection": {"type": "keyword"},
+                "__text": {"type": "text", "analyzer": "en_std", "search_analyzer": "en_search"},
+                "Scholarship_Name": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {
+                        "raw": {"type": "keyword"},
+                        "suggest": {"type": "search_as_you_type", "analyzer": "folding"},
                     },
-                    "Start_Date": {
-                        "type": "text",
-                        "analyzer": "en_std",
+                },
+                "Country": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "country_search",
+                    "copy_to": "__text",
+                    "fields": {
+                        "raw": {"type": "keyword"},
+                        "suggest": {"type": "search_as_you_type", "analyzer": "folding"},
                     },
-                }
-            },
+                },
+                "country": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "country_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Funding_Level": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Scholarship_Type": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "degreeLevel": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Required_Degree": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "fieldOfStudy": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Eligible_Fields": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Eligible_Field_Group": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Wanted_Degree": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                    "fields": {"raw": {"type": "keyword"}},
+                },
+                "Language_Certificate": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Min_Gpa": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Experience_Years": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Funding_Details": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Eligibility_Criteria": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Other_Requirements": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "End_Date": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                "Start_Date": {
+                    "type": "text",
+                    "analyzer": "en_std",
+                    "search_analyzer": "en_search",
+                    "copy_to": "__text",
+                },
+                # Giá trị đã chuẩn hóa (xem `_normalize_fields`) dùng cho range filter
+                "min_gpa": {"type": "float"},
+                "experience_years": {"type": "integer"},
+                "start_date": {"type": "date"},
+                "end_date": {"type": "date"},
+                # Vector cho kNN / hybrid search (chỉ có khi index với embedder, xem embedding_svc)
+                EMBEDDING_FIELD: {
+                    "type": "dense_vector",
+                    "dims": ES_EMBEDDING_DIMS,
+                    "index": True,
+                    "similarity": "cosine",
+                },
+            }
+        },
+    )
+
+
+# ============================================================================
+# Index registry: index vật lý có phiên bản (`scholarships_v3`) nằm sau alias
+# đọc/ghi (`scholarships`). Registry nhớ các alias đã sẵn sàng trong process,
+# nên search/index không còn tốn thêm round-trip `indices.exists` mỗi lần gọi.
+# ============================================================================
+
+_VERSION_RE = re.compile(r"^(?P<alias>.+)_v(?P<version>\d+)$")
+_REINDEX_TIMEOUT = 600
+
+_ready_indices: Dict[str, str] = {}  # alias (hoặc index vật lý) -> index vật lý
+_registry_lock = threading.RLock()
+_async_registry_lock = asyncio.Lock()
+
+
+def mapping_hash() -> str:
+    """Hash của settings + mappings hiện tại, lưu trong `_meta` của index vật lý."""
+    raw = json.dumps(_index_body(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _versioned_body() -> Dict[str, Any]:
+    body = _index_body()
+    body["mappings"] = {**body["mappings"], "_meta": {"mapping_hash": mapping_hash()}}
+    return body
+
+
+def _version_name(alias: str, existing: Iterable[str]) -> str:
+    versions = [
+        int(m.group("version"))
+        for m in (_VERSION_RE.match(name) for name in existing)
+        if m and m.group("alias") == alias
+    ]
+    return f"{alias}_v{max(versions, default=0) + 1}"
+
+
+def _stored_hash(mapping: Dict[str, Any]) -> Optional[str]:
+    return mapping.get("mappings", {}).get("_meta", {}).get("mapping_hash")
+
+
+def _alias_actions(client_has_legacy: bool, alias: str, old: List[str], new: str) -> List[Dict[str, Any]]:
+    actions: List[Dict[str, Any]] = []
+    if client_has_legacy:
+        # Index cũ (chưa có alias) trùng tên với alias: xóa và gắn alias trong cùng một thao tác
+        actions.append({"remove_index": {"index": alias}})
+    actions.extend({"remove": {"index": o, "alias": alias}} for o in old if o != new)
+    actions.append({"add": {"index": new, "alias": alias}})
+    return actions
+
+
+def _mark_ready(name: str, physical: str) -> None:
+    with _registry_lock:
+        _ready_indices[name] = physical
+        _ready_indices[physical] = physical
+
+
+def _bump_generations(index: str) -> None:
+    """Dữ liệu của `index` vừa thay đổi: tăng generation cache của nó và của các alias trỏ vào nó."""
+    with _registry_lock:
+        names = {index} | {alias for alias, physical in _ready_indices.items() if physical == index}
+    for name in names:
+        bump_generation(name)
+
+
+def _physical_indices(client: Elasticsearch, alias: str) -> List[str]:
+    try:
+        return list(client.indices.get_alias(name=alias).keys())
+    except NotFoundError:
+        return []
+
+
+def create_index_version(client: Elasticsearch, alias: str, *, attach_alias: bool = False) -> str:
+    """Tạo index vật lý phiên bản kế tiếp cho `alias` với mapping hiện tại."""
+    existing = client.indices.get(index=f"{alias}_v*").keys()
+    physical = _version_name(alias, existing)
+    client.indices.create(
+        index=physical,
+        aliases={alias: {}} if attach_alias else None,
+        **_versioned_body(),
+    )
+    _mark_ready(physical, physical)
+    if attach_alias:
+        _mark_ready(alias, physical)
+    return physical
+
+
+def promote_index_version(client: Elasticsearch, alias: str, physical: str, *, delete_old: bool = True) -> None:
+    """Chuyển alias sang `physical` một cách nguyên tử, rồi xóa các phiên bản cũ."""
+    old = _physical_indices(client, alias)
+    legacy = not old and client.indices.exists(index=alias)
+    client.indices.update_aliases(actions=_alias_actions(legacy, alias, old, physical))
+    if delete_old:
+        for o in old:
+            if o != physical:
+                client.indices.delete(index=o)
+    with _registry_lock:
+        for o in old:
+            _ready_indices.pop(o, None)
+    _mark_ready(alias, physical)
+    bump_generation(alias)
+
+
+def _rebuild_actions(hits: Iterable[Dict[str, Any]], physical: str) -> Iterable[Dict[str, Any]]:
+    for h in hits:
+        yield {
+            "_op_type": "index",
+            "_index": physical,
+            "_id": h["_id"],
+            "_source": _prepare_source(h["_source"]),
+        }
+
+
+# ----------------------------------------------------------------------------
+# Lock cấp cluster cho việc build phiên bản mới: document create-only trong
+# `INDEX_LOCKS_INDEX`, nên hai worker / pod không cùng build (và xóa index của
+# nhau khi promote). Người giữ lock gia hạn định kỳ (`refresh_index_lock`); lock
+# không được gia hạn quá `INDEX_LOCK_TTL` (process chết giữa chừng) bị thu hồi.
+# ----------------------------------------------------------------------------
+
+INDEX_LOCKS_INDEX = "index_migration_locks"
+INDEX_LOCK_TTL = 600
+_LOCK_REFRESH_DOCS = 5000
+
+
+class IndexLockedError(RuntimeError):
+    pass
+
+
+def _acquire_index_lock(client: Elasticsearch, alias: str, owner: str) -> None:
+    now = time.time()
+    document = {"owner": owner, "host": socket.gethostname(), "acquired_at": now, "heartbeat_at": now}
+    for _ in range(2):
+        try:
+            client.create(index=INDEX_LOCKS_INDEX, id=alias, document=document)
+            return
+        except ConflictError:
+            pass
+        try:
+            held = client.get(index=INDEX_LOCKS_INDEX, id=alias)
+        except NotFoundError:
+            continue
+        lock = held["_source"]
+        if time.time() - float(lock.get("heartbeat_at") or 0) <= INDEX_LOCK_TTL:
+            raise IndexLockedError(
+                f"Index '{alias}' is being rebuilt by {lock.get('owner')} on {lock.get('host')}"
+            )
+        print(f"⚠️  Reclaiming expired rebuild lock on '{alias}' held by {lock.get('owner')}")
+        try:
+            client.delete(
+                index=INDEX_LOCKS_INDEX, id=alias,
+                if_seq_no=held["_seq_no"], if_primary_term=held["_primary_term"],
+            )
+        except (ConflictError, NotFoundError):
+            pass
+    raise IndexLockedError(f"Could not acquire rebuild lock on '{alias}'")
+
+
+def refresh_index_lock(client: Elasticsearch, alias: str) -> None:
+    """Gia hạn lock đang giữ (gọi định kỳ trong lúc build)."""
+    client.update(index=INDEX_LOCKS_INDEX, id=alias, doc={"heartbeat_at": time.time()})
+
+
+@contextmanager
+def index_migration_lock(client: Elasticsearch, alias: str, *, owner: str):
+    """Giữ lock build phiên bản mới của `alias` (ném `IndexLockedError` nếu nơi khác đang giữ)."""
+    _acquire_index_lock(client, alias, owner)
+    try:
+        yield
+    finally:
+        try:
+            client.delete(index=INDEX_LOCKS_INDEX, id=alias)
+        except NotFoundError:
+            pass
+
+
+def index_is_outdated(client: Elasticsearch, alias: str) -> bool:
+    """Index chưa có alias (legacy) hoặc mapping khác `mapping_hash()` hiện tại."""
+    physical = _physical_indices(client, alias)
+    if not physical:
+        return client.indices.exists(index=alias) and not _VERSION_RE.match(alias)
+    mapping = client.indices.get_mapping(index=physical[0])[physical[0]]
+    return _stored_hash(mapping) != mapping_hash()
+
+
+def _with_lock_refresh(client: Elasticsearch, alias: str, hits: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    for i, hit in enumerate(hits, start=1):
+        if i % _LOCK_REFRESH_DOCS == 0:
+            refresh_index_lock(client, alias)
+        yield hit
+
+
+def rebuild_index(client: Elasticsearch, alias: str, *, owner: str = "migration") -> str:
+    """
+    Reindex dữ liệu hiện có sang phiên bản mới (mapping mới) rồi đổi alias.
+    Chỉ chạy từ job/script migration (không chạy trên đường request).
+    """
+    with index_migration_lock(client, alias, owner=owner):
+        physical = create_index_version(client, alias)
+        # Đọc lại qua Python (không dùng _reindex) để các field chuẩn hóa được tính lại
+        helpers.bulk(
+            client.options(request_timeout=_REINDEX_TIMEOUT),
+            _rebuild_actions(_with_lock_refresh(client, alias, helpers.scan(client, index=alias)), physical),
+            chunk_size=500,
+            max_retries=3,
         )
+        client.indices.refresh(index=physical)
+        promote_index_version(client, alias, physical)
+    print(f"🔁 Rebuilt '{alias}' into '{physical}' (mapping {mapping_hash()})")
+    return physical
+
+
+def _warn_outdated(index: str, reason: str) -> None:
+    print(
+        f"⚠️  Index '{index}' mapping outdated ({reason}), serving it as is. "
+        f"Run a force sync or scripts/migrate_index.py to rebuild."
+    )
+
+
+def ensure_index(client: Elasticsearch, index: str) -> str:
+    if index in _ready_indices:
+        return index
+
+    with _registry_lock:
+        if index not in _ready_indices:
+            _prepare_index(client, index)
     return index
 
 
-def _catch_all(doc: Dict[str, Any]) -> str:
-    vals: List[str] = []
+def _prepare_index(client: Elasticsearch, index: str) -> None:
+    physical = _physical_indices(client, index)
+    if physical:
+        current = physical[0]
+        mapping = client.indices.get_mapping(index=current)[current]
+        if _stored_hash(mapping) != mapping_hash():
+            _warn_outdated(index, f"'{current}' has hash {_stored_hash(mapping)}, expected {mapping_hash()}")
+        _mark_ready(index, current)
+    elif client.indices.exists(index=index):
+        if not _VERSION_RE.match(index):
+            # Index cũ chưa có alias: vẫn dùng trực tiếp, chuyển sang phiên bản khi rebuild
+            _warn_outdated(index, "legacy index without alias")
+        # (Index vật lý đang được build (full reindex) thì ghi thẳng vào)
+        _mark_ready(index, index)
+    else:
+        create_index_version(client, index, attach_alias=True)
 
-    def walk(x):
-        if isinstance(x, dict):
-            for v in x.values():
-                walk(v)
-        elif isinstance(x, list):
-            for v in x:
-                walk(v)
-        else:
-            if isinstance(x, (str, int, float, bool)):
-                vals.append(str(x))
 
-    walk(doc)
-    return " ".join(vals)
+async def _physical_indices_async(client: AsyncElasticsearch, alias: str) -> List[str]:
+    try:
+        return list((await client.indices.get_alias(name=alias)).keys())
+    except NotFoundError:
+        return []
+
+
+async def create_index_version_async(
+    client: AsyncElasticsearch, alias: str, *, attach_alias: bool = False
+) -> str:
+    """Phiên bản asyncio của `create_index_version`."""
+    existing = (await client.indices.get(index=f"{alias}_v*")).keys()
+    physical = _version_name(alias, existing)
+    await client.indices.create(
+        index=physical,
+        aliases={alias: {}} if attach_alias else None,
+        **_versioned_body(),
+    )
+    _mark_ready(physical, physical)
+    if attach_alias:
+        _mark_ready(alias, physical)
+    return physical
+
+
+async def promote_index_version_async(
+    client: AsyncElasticsearch, alias: str, physical: str, *, delete_old: bool = True
+) -> None:
+    """Phiên bản asyncio của `promote_index_version`."""
+    old = await _physical_indices_async(client, alias)
+    legacy = not old and await client.indices.exists(index=alias)
+    await client.indices.update_aliases(actions=_alias_actions(legacy, alias, old, physical))
+    if delete_old:
+        for o in old:
+            if o != physical:
+                await client.indices.delete(index=o)
+    with _registry_lock:
+        for o in old:
+            _ready_indices.pop(o, None)
+    _mark_ready(alias, physical)
+    bump_generation(alias)
+
+
+async def ensure_index_async(client: AsyncElasticsearch, index: str) -> str:
+    if index in _ready_indices:
+        return index
+
+    async with _async_registry_lock:
+        if index not in _ready_indices:
+            await _prepare_index_async(client, index)
+    return index
+
+
+async def _prepare_index_async(client: AsyncElasticsearch, index: str) -> None:
+    physical = await _physical_indices_async(client, index)
+    if physical:
+        current = physical[0]
+        mapping = (await client.indices.get_mapping(index=current))[current]
+        if _stored_hash(mapping) != mapping_hash():
+            _warn_outdated(index, f"'{current}' has hash {_stored_hash(mapping)}, expected {mapping_hash()}")
+        _mark_ready(index, current)
+    elif await client.indices.exists(index=index):
+        if not _VERSION_RE.match(index):
+            _warn_outdated(index, "legacy index without alias")
+        _mark_ready(index, index)
+    else:
+        await create_index_version_async(client, index, attach_alias=True)
+
+
+# ============================================================================
+# Chuẩn hóa các field số / ngày (dữ liệu gốc là text tự do, ví dụ "~GPA 3.5",
+# "June 1, 2025", "Not stated") thành giá trị có kiểu để range filter chạy trong ES.
+# ============================================================================
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+_DATE_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), ["%Y-%m-%d"]),
+    (re.compile(r"\d{1,2}/\d{1,2}/\d{4}"), ["%d/%m/%Y", "%m/%d/%Y"]),
+    (re.compile(r"[A-Za-z]+\.? \d{1,2}(?:st|nd|rd|th)?,? \d{4}"), ["%B %d %Y", "%b %d %Y"]),
+    (re.compile(r"\d{1,2} [A-Za-z]+\.? \d{4}"), ["%d %B %Y", "%d %b %Y"]),
+]
+
+# Field gốc -> field chuẩn hóa
+RANGE_FIELDS = {
+    "Min_Gpa": "min_gpa",
+    "Experience_Years": "experience_years",
+    "Start_Date": "start_date",
+    "End_Date": "end_date",
+}
+
+
+def _parse_number(value: Any, *, upper: float) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = _NUMBER_RE.search(str(value))
+        if not match:
+            return None
+        number = float(match.group(0).replace(",", "."))
+    if math.isnan(number) or not 0 <= number <= upper:
+        return None
+    return number
+
+
+def _parse_date(value: Any) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if not isinstance(value, str) or not value.strip():
+        return None
+    text = value.strip()
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        pass
+    for pattern, formats in _DATE_PATTERNS:
+        match = pattern.search(text)
+        if not match:
+            continue
+        token = re.sub(r"(\d)(st|nd|rd|th)", r"\1", match.group(0)).replace(",", "").replace(".", "")
+        for fmt in formats:
+            try:
+                return datetime.strptime(token, fmt).date().isoformat()
+            except ValueError:
+                continue
+    return None
+
+
+def _normalize_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Tính các field có kiểu (`min_gpa`, `experience_years`, `start_date`, `end_date`)."""
+    normalized: Dict[str, Any] = {}
+
+    gpa = _parse_number(doc.get("Min_Gpa"), upper=10)
+    if gpa is not None:
+        normalized["min_gpa"] = gpa
+
+    years = _parse_number(doc.get("Experience_Years"), upper=50)
+    if years is not None:
+        normalized["experience_years"] = int(math.ceil(years))
+
+    for source_field in ("Start_Date", "End_Date"):
+        parsed = _parse_date(doc.get(source_field))
+        if parsed is not None:
+            normalized[RANGE_FIELDS[source_field]] = parsed
+
+    return normalized
+
+
+def _prepare_source(doc: Dict[str, Any], collection: Optional[str] = None) -> Dict[str, Any]:
+    """Payload gửi lên ES: document gốc + các field chuẩn hóa (`__text` do copy_to điền)."""
+    src = {
+        k: v for k, v in doc.items()
+        if k != "__text" and k not in RANGE_FIELDS.values()
+    }
+    src.update(_normalize_fields(src))
+    if collection:
+        src["collection"] = collection
+    return src
+
+
+def _attach_embeddings(actions: List[Dict[str, Any]], embedder: Embedder) -> None:
+    """Gắn vector vào `_source` của các action index; lỗi embed thì index không kèm vector."""
+    targets = [a for a in actions if a.get("_op_type", "index") == "index"]
+    if not targets:
+        return
+    try:
+        vectors = embedder.embed_documents([embedding_text(a["_source"]) for a in targets])
+    except Exception as e:
+        print(f"⚠️  Embedding failed for {len(targets)} docs, indexing without vectors: {e}")
+        return
+    mismatched, dims = 0, None
+    for action, vector in zip(targets, vectors):
+        vector = list(vector)
+        if len(vector) != ES_EMBEDDING_DIMS:
+            # Mapping cố định `dims`: vector sai số chiều làm hỏng cả document, nên chỉ bỏ vector
+            mismatched, dims = mismatched + 1, len(vector)
+            continue
+        action["_source"][EMBEDDING_FIELD] = vector
+    if mismatched:
+        print(
+            f"⚠️  {mismatched} embeddings do not match ES_EMBEDDING_DIMS={ES_EMBEDDING_DIMS} "
+            f"(got {dims}), indexing those docs without vectors"
+        )
+
+
+def _with_embeddings(
+    actions: Iterable[Dict[str, Any]], embedder: Embedder, batch_size: int = ES_EMBEDDING_BATCH
+) -> Iterable[Dict[str, Any]]:
+    """Embed theo batch (một lần gọi model cho mỗi `batch_size` doc) trong khi vẫn stream."""
+    batch: List[Dict[str, Any]] = []
+    for action in actions:
+        batch.append(action)
+        if len(batch) >= batch_size:
+            _attach_embeddings(batch, embedder)
+            yield from batch
+            batch = []
+    if batch:
+        _attach_embeddings(batch, embedder)
+        yield from batch
 
 
 def index_one(
@@ -137,10 +696,7 @@ def index_one(
 ) -> str:
     ensure_index(client, index)
 
-    payload = dict(doc)
-    payload["__text"] = _catch_all(payload)
-    if collection:
-        payload["collection"] = collection
+    payload = _prepare_source(doc, collection)
 
     # Ưu tiên dùng Firestore doc.id để tránh trùng
     es_id = id or doc.get("id") or doc.get("doc_id")
@@ -149,25 +705,137 @@ def index_one(
     return res["_id"]
 
 
+class _Backpressure:
+    """
+    Điều tiết tốc độ đẩy bulk: mỗi lần ES trả 429 thì tăng thời gian nghỉ giữa
+    các chunk (nhân đôi, có trần), mỗi chunk thành công thì giảm dần về 0.
+    """
+
+    def __init__(self, initial: float = 0.5, maximum: float = 30.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = 0.0
+        self.rejections = 0
+
+    def rejected(self) -> None:
+        self.rejections += 1
+        self.delay = min(self.maximum, max(self.initial, self.delay * 2))
+
+    def accepted(self) -> None:
+        self.delay = self.delay / 2 if self.delay > self.initial / 8 else 0.0
+
+    def wait(self) -> None:
+        if self.delay:
+            time.sleep(self.delay)
+
+
+# Settings tạm thời khi nạp hàng loạt: không refresh, không replica, translog ghi async
+_BULK_LOAD_SETTINGS = {
+    "index.refresh_interval": "-1",
+    "index.number_of_replicas": "0",
+    "index.translog.durability": "async",
+}
+# Giá trị khôi phục khi setting trên index đang là giá trị bulk (full sync trước bị crash)
+_DEFAULT_LOAD_SETTINGS = {
+    "index.refresh_interval": None,
+    "index.number_of_replicas": str(ES_NUMBER_OF_REPLICAS),
+    "index.translog.durability": "request",
+}
+
+
+@contextmanager
+def bulk_load_settings(client: Elasticsearch, index: str, *, force_merge: bool = False):
+    """
+    Context cho full sync: tắt refresh, bỏ replica và cho translog ghi async để
+    bulk nhanh hơn. Khi thoát (kể cả khi lỗi) luôn khôi phục settings cũ, refresh,
+    và nếu `force_merge` thì gộp segment (index chủ yếu để đọc sau full sync).
+
+    Setting đang mang giá trị bulk lúc vào (job trước crash giữa chừng, job
+    resume vào lại) không được coi là settings cũ: khôi phục về
+    `_DEFAULT_LOAD_SETTINGS` thay vì giữ index ở chế độ bulk.
+    """
+    current = client.indices.get_settings(index=index, flat_settings=True)
+    # Setting chưa từng đặt -> None, khi khôi phục ES dùng lại giá trị mặc định
+    original = {
+        physical: {
+            key: _DEFAULT_LOAD_SETTINGS[key] if body["settings"].get(key) == bulk else body["settings"].get(key)
+            for key, bulk in _BULK_LOAD_SETTINGS.items()
+        }
+        for physical, body in current.items()
+    }
+    client.indices.put_settings(index=index, settings=_BULK_LOAD_SETTINGS)
+    print(f"🚚 Bulk-load mode on '{index}' (refresh off, replicas 0, async translog)")
+    try:
+        yield
+    finally:
+        for physical, settings in original.items():
+            try:
+                client.indices.put_settings(index=physical, settings=settings)
+            except Exception as e:
+                print(f"❌ Could not restore settings on '{physical}': {e}")
+        try:
+            client.indices.refresh(index=index)
+        except Exception as e:
+            print(f"⚠️  Refresh of '{index}' failed: {e}")
+        if force_merge:
+            try:
+                client.options(request_timeout=_REINDEX_TIMEOUT).indices.forcemerge(
+                    index=index, max_num_segments=1
+                )
+            except Exception as e:
+                print(f"⚠️  Force merge of '{index}' failed: {e}")
+        print(f"✅ Bulk-load mode off on '{index}', settings restored")
+
+
 def index_many(
     client: Elasticsearch,
     docs: Iterable[Dict[str, Any]],
     *,
     index: str,
     collection: Optional[str] = None,
-    batch_size: int = 50,  # Reduced default batch size
+    batch_size: int = 500,
+    max_chunk_bytes: int = 5 * 1024 * 1024,
+    concurrency: int = 4,
+    max_retries: int = 5,
+    embedder: Optional[Embedder] = None,
+    bulk_load: bool = False,
+    force_merge: bool = False,
 ) -> Dict[str, Any]:
-    """Index multiple documents with batching to prevent ES overload"""
+    """
+    Index documents theo kiểu streaming: `docs` có thể là generator (ví dụ
+    `firestore_svc.iter_documents`), được đẩy thẳng vào `helpers.parallel_bulk`.
+    Chunk giới hạn theo số byte (`max_chunk_bytes`) và số doc (`batch_size`),
+    `concurrency` request bulk chạy song song. Doc bị từ chối 429 được gửi lại
+    với backoff, đồng thời producer chậm lại (backpressure), nên bộ nhớ chỉ giữ
+    các chunk đang bay chứ không giữ toàn bộ collection.
+    Có `embedder` thì mỗi doc được gắn thêm vector `embedding` (embed theo batch).
+    `bulk_load=True` (full sync) chạy trong `bulk_load_settings` - xem hàm đó.
+    """
     ensure_index(client, index)
-    
-    import time
-    
-    failed_docs = []
+    load = ExitStack()
+    if bulk_load:
+        load.enter_context(bulk_load_settings(client, index, force_merge=force_merge))
+
+    failed_docs: List[Dict[str, str]] = []
+    failed_ids: Set[str] = set()
+    failed_count = 0
     doc_ids_seen = set()
     duplicate_count = 0
     total_success = 0
+    pressure = _Backpressure()
+    in_flight: Deque[Dict[str, Any]] = deque()  # action theo đúng thứ tự kết quả trả về
+    rejected: List[Dict[str, Any]] = []
+    bulk_client = client.options(request_timeout=120)
 
-    def gen():
+    def record_failure(doc_id: str, error: Any) -> None:
+        nonlocal failed_count
+        failed_count += 1
+        failed_ids.add(doc_id)
+        if len(failed_docs) < 10:
+            failed_docs.append({"id": doc_id, "error": str(error)})
+        print(f"❌ Bulk error for doc {doc_id}: {error}")
+
+    def prepared():
         nonlocal duplicate_count
         for d in docs:
             try:
@@ -180,152 +848,597 @@ def index_many(
                     continue
                 doc_ids_seen.add(es_id)
                 
-                src = {**d, "__text": _catch_all(d)}
-                if collection:
-                    src["collection"] = collection
-
-                yield {"_op_type": "index", "_index": index, "_id": es_id, "_source": src}
+                src = _prepare_source(d, collection)
+                action = {"_op_type": "index", "_index": index, "_id": es_id, "_source": src}
             except Exception as e:
                 doc_id = d.get("id") or d.get("doc_id") or "unknown"
-                failed_docs.append({"id": doc_id, "error": str(e)})
-                print(f"❌ Error preparing doc {doc_id}: {e}")
+                record_failure(doc_id, f"prepare failed: {e}")
                 continue
+            yield action
 
-    try:
-        # Use chunk_size and request_timeout to control bulk operations
+    def gen():
+        actions = prepared()
+        if embedder is not None:
+            actions = _with_embeddings(actions, embedder)
+        for n, action in enumerate(actions):
+            if n % batch_size == 0:
+                pressure.wait()
+            in_flight.append(action)
+            yield action
+
+    def retry_rejected() -> None:
+        # helpers.bulk tự retry 429 với exponential backoff
+        nonlocal total_success
+        batch, rejected[:] = list(rejected), []
         success, errors = helpers.bulk(
-            client, 
-            gen(), 
-            chunk_size=batch_size,  # Process in smaller chunks
-            request_timeout=120,  # Increase timeout for bulk operations
-            max_retries=3,
+            bulk_client,
+            batch,
+            chunk_size=batch_size,
+            max_chunk_bytes=max_chunk_bytes,
+            max_retries=max_retries,
             initial_backoff=2,
-            stats_only=False, 
-            raise_on_error=False
+            max_backoff=60,
+            stats_only=False,
+            raise_on_error=False,
         )
-        total_success = success
-        
-        # Add bulk operation errors to failed_docs
-        if errors:
-            for error in errors:
-                error_info = error.get("index", {})
-                doc_id = error_info.get("_id", "unknown")
-                error_msg = error_info.get("error", {})
-                if isinstance(error_msg, dict):
-                    error_msg = error_msg.get("reason", str(error_msg))
-                failed_docs.append({"id": doc_id, "error": str(error_msg)})
-                print(f"❌ Bulk error for doc {doc_id}: {error_msg}")
-    
+        total_success += success
+        for error in errors:
+            info = error.get("index", {})
+            record_failure(info.get("_id", "unknown"), _error_reason(info))
+
+    try:
+        for ok, item in helpers.parallel_bulk(
+            bulk_client,
+            gen(),
+            thread_count=concurrency,
+            chunk_size=batch_size,
+            max_chunk_bytes=max_chunk_bytes,
+            queue_size=concurrency,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            action = in_flight.popleft()
+            info = item.get("index", {})
+            if ok:
+                total_success += 1
+                pressure.accepted()
+            elif info.get("status") == 429:
+                pressure.rejected()
+                rejected.append(action)
+                if len(rejected) >= batch_size:
+                    retry_rejected()
+            else:
+                record_failure(info.get("_id", action["_id"]), _error_reason(info))
+
+        if rejected:
+            retry_rejected()
+
     except Exception as e:
         print(f"❌ Critical error during bulk indexing: {e}")
         import traceback
         traceback.print_exc()
         return {
-            "success": 0,
-            "failed": len(doc_ids_seen),
+            "success": total_success,
+            "failed": len(doc_ids_seen) - total_success,
             "duplicates": duplicate_count,
             "failed_ids": [{"id": "bulk_operation", "error": str(e)}],
+            "rejected": pressure.rejections,
             "error": str(e)
         }
+    finally:
+        # Luôn trả lại settings (kể cả khi lỗi), refresh xong mới đổi generation cache
+        load.close()
+        # Kể cả khi lỗi giữa chừng, một phần doc có thể đã được ghi
+        _bump_generations(index)
     
     # Log summary
     total_attempted = len(doc_ids_seen) + duplicate_count
-    print(f"📊 Index Summary: Total={total_attempted}, Success={total_success}, Failed={len(failed_docs)}, Duplicates={duplicate_count}")
+    print(f"📊 Index Summary: Total={total_attempted}, Success={total_success}, Failed={failed_count}, Duplicates={duplicate_count}")
     
     return {
         "success": total_success,
-        "failed": len(failed_docs),
+        "failed": failed_count,
         "duplicates": duplicate_count,
-        "failed_ids": [{"id": f["id"], "error": f["error"]} for f in failed_docs[:10]]  # Limit error list
+        "failed_ids": failed_docs,  # Limit error list (tối đa 10)
+        "failed_doc_ids": sorted(failed_ids),  # đủ id lỗi (bỏ qua khi percolate...)
+        "rejected": pressure.rejections,  # số lần ES trả 429 (tín hiệu quá tải)
     }
 
 
-def search_keyword(
+def _error_reason(info: Dict[str, Any]) -> str:
+    error_msg = info.get("error", {})
+    if isinstance(error_msg, dict):
+        error_msg = error_msg.get("reason", str(error_msg))
+    return str(error_msg)
+
+
+def apply_changes(
     client: Elasticsearch,
-    q: str,
     *,
     index: str,
-    size: int = 10,
-    offset: int = 0,
+    upserts: Dict[str, Dict[str, Any]],
+    deletes: Iterable[str] = (),
     collection: Optional[str] = None,
+    batch_size: int = 500,
+    embedder: Optional[Embedder] = None,
 ) -> Dict[str, Any]:
+    """
+    Áp dụng một batch thay đổi nhỏ (upsert + delete) từ change feed trong một lần bulk.
+    Xóa doc không tồn tại (404) không bị tính là lỗi.
+    """
     ensure_index(client, index)
 
-    must = [
-        {
-            "match": {
-                "__text": {
-                "query": q,
-                "operator": "or",
-                "fuzziness": "AUTO"
-                }
-            }
-        }
+    actions: List[Dict[str, Any]] = [
+        {"_op_type": "index", "_index": index, "_id": doc_id, "_source": _prepare_source(doc, collection)}
+        for doc_id, doc in upserts.items()
     ]
-    if collection:
-        must.append({"term": {"collection": collection}})
+    if embedder is not None:
+        _attach_embeddings(actions, embedder)
+    actions.extend({"_op_type": "delete", "_index": index, "_id": doc_id} for doc_id in deletes)
+    if not actions:
+        return {"success": 0, "failed": 0, "failed_ids": []}
 
-    res = client.search(
-        index=index,
-        query={"bool": {"must": must}},
-        size=size,
-        from_=offset,
+    success, errors = helpers.bulk(
+        client,
+        actions,
+        chunk_size=batch_size,
+        max_retries=3,
+        initial_backoff=2,
+        ignore_status=(404,),
+        stats_only=False,
+        raise_on_error=False,
     )
+    _bump_generations(index)
+    failed_ids = []
+    for error in errors:
+        info = next(iter(error.values()), {})
+        failed_ids.append({"id": info.get("_id", "unknown"), "error": _error_reason(info)})
+    # `errors`: đủ danh sách (change feed cần để thử lại), `failed_ids`: tối đa 10 để log
+    return {"success": success, "failed": len(failed_ids), "failed_ids": failed_ids[:10], "errors": failed_ids}
+
+
+# ============================================================================
+# Projection: list/card view chỉ cần vài field, không cần các đoạn text dài
+# (Eligibility_Criteria, Funding_Details, Other_Requirements...).
+# ============================================================================
+
+CARD_FIELDS = [
+    "Scholarship_Name",
+    "Country",
+    "Funding_Level",
+    "Scholarship_Type",
+    "Wanted_Degree",
+    "Required_Degree",
+    "Eligible_Field_Group",
+    "Application_Mode",
+    "Start_Date",
+    "End_Date",
+    "Url",
+    "min_gpa",
+    "end_date",
+]
+
+
+def resolve_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    `None` / "card" -> CARD_FIELDS; "full" / "*" -> None (toàn bộ _source);
+    còn lại là danh sách field phân tách bằng dấu phẩy.
+    """
+    if fields is None or fields.strip().lower() == "card":
+        return CARD_FIELDS
+    if fields.strip().lower() in ("full", "*"):
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+def _to_result(res: Dict[str, Any]) -> Dict[str, Any]:
     hits = [
-        {"id": h["_id"], "score": h["_score"], "source": h["_source"]}
+        {"id": h["_id"], "score": h["_score"], "source": h.get("_source", {})}
         for h in res["hits"]["hits"]
     ]
-    return {"total": res["hits"]["total"]["value"], "items": hits}
+    total = res["hits"]["total"]
+    result: Dict[str, Any] = {"total": total["value"], "items": hits}
+    if total.get("relation") == "gte":
+        # Đếm dừng ở ngưỡng track_total_hits: `total` là cận dưới
+        result["total_relation"] = "gte"
+    return result
 
-def filter_advanced(
+
+def _empty_result(cursor: Optional[str] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"total": 0, "items": []}
+    if cursor is not None:
+        result["next_cursor"] = None
+    return result
+
+
+# ============================================================================
+# Cursor pagination: point-in-time + search_after với tiebreak ổn định.
+# Cursor là token opaque (base64 JSON chứa pit id và sort values của hit cuối).
+# ============================================================================
+
+CURSOR_KEEP_ALIVE = "2m"
+_CURSOR_SORT = [{"_score": {"order": "desc"}}, {"_shard_doc": {"order": "asc"}}]
+
+
+def _cursor_sort(sort: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Sort của trang cursor: sort yêu cầu (mặc định theo score) + tiebreak `_shard_doc`."""
+    if not sort:
+        return _CURSOR_SORT
+    return sort + [{"_shard_doc": {"order": "asc"}}]
+
+
+def _encode_cursor(pit_id: str, search_after: List[Any], state: Optional[Dict[str, Any]] = None) -> str:
+    data: Dict[str, Any] = {"pit": pit_id, "after": search_after}
+    if state:
+        data["state"] = state
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Optional[str], Optional[List[Any]]]:
+    """Cursor rỗng hoặc "*" nghĩa là trang đầu tiên."""
+    if cursor in ("", "*"):
+        return None, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return data["pit"], data["after"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _cursor_state(cursor: Optional[str]) -> Dict[str, Any]:
+    """Trạng thái kèm theo cursor (ví dụ phase của keyword search); {} với trang đầu."""
+    if cursor is None or cursor in ("", "*"):
+        return {}
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii"))).get("state") or {}
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _to_cursor_result(
+    res: Dict[str, Any], pit_id: str, size: int, state: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    result = _to_result(res)
+    hits = res["hits"]["hits"]
+    result["next_cursor"] = (
+        _encode_cursor(res.get("pit_id", pit_id), hits[-1]["sort"], state)
+        if len(hits) == size
+        else None
+    )
+    return result
+
+
+def _run_search(
     client: Elasticsearch,
     *,
     index: str,
-    filters: List[Dict[str, Any]],
-    collection: Optional[str] = None,
-    inter_field_operator: Literal["AND", "OR"] = "AND",
-    size: int = 10,
-    offset: int = 0,
+    size: int,
+    offset: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]] = None,
+    cursor_state: Optional[Dict[str, Any]] = None,
+    sort: Optional[List[Dict[str, Any]]] = None,
+    **search_kwargs: Any,
 ) -> Dict[str, Any]:
-    """
-    Hàm lọc tổng quát, hỗ trợ logic kết hợp linh hoạt và lọc theo collection.
-    """
-    ensure_index(client, index)
+    if fields is not None:
+        search_kwargs["source_includes"] = fields
+    else:
+        search_kwargs["source_excludes"] = [EMBEDDING_FIELD]
+    if cursor is None:
+        if sort:
+            search_kwargs["sort"] = sort
+        res = client.search(index=index, size=size, from_=offset, **search_kwargs)
+        return _to_result(res)
 
-    # Xây dựng các mệnh đề lọc từ input `filters`
-    clauses = []
-    
-    # Fields that contain descriptive text and should use text search instead of exact match
-    text_search_fields = ["Language_Certificate", "Min_Gpa", "Experience_Years", 
-                          "Funding_Details", "Eligibility_Criteria", "Other_Requirements"]
-    
-    # Fields that contain comma-separated values and need partial text matching
-    multi_value_fields = ["Eligible_Fields", "Funding_Level", "Scholarship_Type", 
-                          "Danh_Sách_Nhóm_Ngành", "Application_Mode", "Eligible_Field_Group"]
-    
-    # Fields that need case-insensitive exact matching
-    case_insensitive_fields = ["Wanted_Degree", "Country"]
-    
-    for f in filters:
-        field = f["field"]
-        values = f["values"]
-        intra_operator = f.get("operator", "OR").lower()
-        
-        # Determine if we should use text search or exact keyword matching
-        if field in text_search_fields or field in multi_value_fields:
-            # Use match_phrase query for exact phrase matching in comma-separated values
-            if intra_operator == "or":
-                # OR logic: any value matches
-                should_clauses = []
-                for value in values:
-                    should_clauses.append(
-                        {"match_phrase": {field: str(value)}}
-                    )
-                clauses.append({
-                    "bool": {
-                        "should": should_clauses,
-                        "minimum_should_match": 1
-                    }
+    pit_id, after = _decode_cursor(cursor)
+    if pit_id is None:
+        pit_id = client.open_point_in_time(index=index, keep_alive=CURSOR_KEEP_ALIVE)["id"]
+    res = client.search(
+        pit={"id": pit_id, "keep_alive": CURSOR_KEEP_ALIVE},
+        size=size,
+        sort=_cursor_sort(sort),
+        search_after=after,
+        **search_kwargs,
+    )
+    result = _to_cursor_result(res, pit_id, size, cursor_state)
+    if result["next_cursor"] is None:
+        # Trang cuối: giải phóng PIT ngay thay vì chờ hết keep_alive
+        client.close_point_in_time(id=res.get("pit_id", pit_id))
+    return result
+
+
+async def _run_search_async(
+    client: AsyncElasticsearch,
+    *,
+    index: str,
+    size: int,
+    offset: int,
+    cursor: Optional[str],
+    fields: Optional[List[str]] = None,
+    cursor_state: Optional[Dict[str, Any]] = None,
+    sort: Optional[List[Dict[str, Any]]] = None,
+    **search_kwargs: Any,
+) -> Dict[str, Any]:
+    if fields is not None:
+        search_kwargs["source_includes"] = fields
+    else:
+        search_kwargs["source_excludes"] = [EMBEDDING_FIELD]
+    if cursor is None:
+        if sort:
+            search_kwargs["sort"] = sort
+        res = await client.search(index=index, size=size, from_=offset, **search_kwargs)
+        return _to_result(res)
+
+    pit_id, after = _decode_cursor(cursor)
+    if pit_id is None:
+        pit_id = (await client.open_point_in_time(index=index, keep_alive=CURSOR_KEEP_ALIVE))["id"]
+    res = await client.search(
+        pit={"id": pit_id, "keep_alive": CURSOR_KEEP_ALIVE},
+        size=size,
+        sort=_cursor_sort(sort),
+        search_after=after,
+        **search_kwargs,
+    )
+    result = _to_cursor_result(res, pit_id, size, cursor_state)
+    if result["next_cursor"] is None:
+        await client.close_point_in_time(id=res.get("pit_id", pit_id))
+    return result
+
+
+# ============================================================================
+# "Còn hạn": range filter trên `end_date` (filter context, được cache), đếm tổng
+# tới ngưỡng `OPEN_ONLY_TRACK_TOTAL_HITS` để ES dừng sớm. Học bổng không parse
+# được hạn nộp không có `end_date` nên bị loại.
+# ============================================================================
+
+OPEN_ONLY_TRACK_TOTAL_HITS = 1000
+DEADLINE_SORT = [{"end_date": {"order": "asc", "missing": "_last"}}]
+
+
+def _open_clause() -> Dict[str, Any]:
+    return {"range": {"end_date": {"gte": "now/d"}}}
+
+
+def _open_only_kwargs(open_only: bool) -> Dict[str, Any]:
+    return {"track_total_hits": OPEN_ONLY_TRACK_TOTAL_HITS} if open_only else {}
+
+
+# ============================================================================
+# Keyword search hai pha: multi_match chính xác (có boost) trước, chỉ khi quá ít
+# kết quả mới chạy fuzzy (đắt nhất trên `__text`) với số term mở rộng bị giới hạn.
+# ============================================================================
+
+KEYWORD_FIELDS = [
+    "Scholarship_Name^3",
+    "Country^2",
+    "Eligible_Fields^1.5",
+    "Eligible_Field_Group^1.5",
+    "Scholarship_Type",
+    "Funding_Level",
+    "Wanted_Degree",
+    "__text",
+]
+FUZZY_MIN_HITS = 3
+FUZZY_PREFIX_LENGTH = 1
+FUZZY_MAX_EXPANSIONS = 20
+
+
+def _build_keyword_query(
+    q: str, collection: Optional[str] = None, *, fuzzy: bool = False, open_only: bool = False
+) -> Dict[str, Any]:
+    multi_match: Dict[str, Any] = {
+        "query": q,
+        "fields": KEYWORD_FIELDS,
+        "type": "best_fields",
+        "operator": "or",
+        "tie_breaker": 0.3,
+    }
+    if fuzzy:
+        multi_match.update(
+            fuzziness="AUTO",
+            prefix_length=FUZZY_PREFIX_LENGTH,
+            max_expansions=FUZZY_MAX_EXPANSIONS,
+        )
+    must = [{"multi_match": multi_match}]
+    if collection:
+        must.append({"term": {"collection": collection}})
+    query: Dict[str, Any] = {"bool": {"must": must}}
+    if open_only:
+        query["bool"]["filter"] = [_open_clause()]
+    return query
+
+
+def _search_cache_params(
+    q: str,
+    collection: Optional[str],
+    size: int,
+    offset: int,
+    fields: Optional[List[str]],
+    min_hits: int,
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    return {
+        "q": q.strip(),
+        "collection": collection,
+        "size": size,
+        "offset": offset,
+        "fields": fields,
+        "min_hits": min_hits,
+        "open_only": open_only,
+    }
+
+
+def _close_cursor(client: Elasticsearch, result: Dict[str, Any]) -> None:
+    if result.get("next_cursor"):
+        pit_id, _ = _decode_cursor(result["next_cursor"])
+        client.close_point_in_time(id=pit_id)
+
+
+async def _close_cursor_async(client: AsyncElasticsearch, result: Dict[str, Any]) -> None:
+    if result.get("next_cursor"):
+        pit_id, _ = _decode_cursor(result["next_cursor"])
+        await client.close_point_in_time(id=pit_id)
+
+
+def search_keyword(
+    client: Elasticsearch,
+    q: str,
+    *,
+    index: str,
+    size: int = 10,
+    offset: int = 0,
+    collection: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    min_hits: int = FUZZY_MIN_HITS,
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    """
+    Pha "exact": multi_match không fuzzy; nếu tổng số kết quả < `min_hits` thì
+    chạy lại pha "fuzzy". Kết quả có field `phase` cho biết pha nào đã trả lời;
+    các trang cursor tiếp theo giữ nguyên pha của trang đầu.
+    `open_only=True`: chỉ học bổng còn hạn (xem `_open_clause`).
+    """
+    def search(phase: str) -> Dict[str, Any]:
+        result = _run_search(
+            client,
+            index=index,
+            size=size,
+            offset=offset,
+            cursor=cursor,
+            fields=fields,
+            cursor_state={"phase": phase},
+            query=_build_keyword_query(q, collection, fuzzy=phase == "fuzzy", open_only=open_only),
+            **_open_only_kwargs(open_only),
+        )
+        return {**result, "phase": phase}
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        phase = _cursor_state(cursor).get("phase")
+        if phase is not None:
+            return search(phase)
+        result = search("exact")
+        if result["total"] >= min_hits:
+            return result
+        _close_cursor(client, result)
+        return search("fuzzy")
+
+    # Trang theo cursor gắn với PIT đang mở nên không cache
+    if cursor is not None:
+        return run()
+    params = _search_cache_params(q, collection, size, offset, fields, min_hits, open_only)
+    return cached("search", index, params, run)
+
+
+async def search_keyword_async(
+    client: AsyncElasticsearch,
+    q: str,
+    *,
+    index: str,
+    size: int = 10,
+    offset: int = 0,
+    collection: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    min_hits: int = FUZZY_MIN_HITS,
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `search_keyword`."""
+    async def search(phase: str) -> Dict[str, Any]:
+        result = await _run_search_async(
+            client,
+            index=index,
+            size=size,
+            offset=offset,
+            cursor=cursor,
+            fields=fields,
+            cursor_state={"phase": phase},
+            query=_build_keyword_query(q, collection, fuzzy=phase == "fuzzy", open_only=open_only),
+            **_open_only_kwargs(open_only),
+        )
+        return {**result, "phase": phase}
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        phase = _cursor_state(cursor).get("phase")
+        if phase is not None:
+            return await search(phase)
+        result = await search("exact")
+        if result["total"] >= min_hits:
+            return result
+        await _close_cursor_async(client, result)
+        return await search("fuzzy")
+
+    if cursor is not None:
+        return await run()
+    params = _search_cache_params(q, collection, size, offset, fields, min_hits, open_only)
+    return await cached_async("search", index, params, run)
+
+
+def _range_clause(field: str, operator: str, values: List[Any]) -> Dict[str, Any]:
+    target = RANGE_FIELDS.get(field, field)
+    if operator == "range":
+        if len(values) != 2:
+            raise ValueError(f"RANGE filter on '{field}' needs exactly 2 values [from, to]")
+        bounds = {"gte": values[0], "lte": values[1]}
+    else:
+        if len(values) != 1:
+            raise ValueError(f"{operator.upper()} filter on '{field}' needs exactly 1 value")
+        bounds = {operator: values[0]}
+    return {"range": {target: bounds}}
+
+
+def _build_filter_query(
+    filters: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    open_only: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """
+    Xây dựng bool query từ danh sách filter. Trả về None nếu không có điều kiện nào.
+    `open_only=True` thêm range filter "còn hạn" (một mình nó cũng là một điều kiện).
+    """
+    # Xây dựng các mệnh đề lọc từ input `filters`
+    clauses = []
+    
+    # Fields that contain descriptive text and should use text search instead of exact match
+    text_search_fields = ["Language_Certificate", "Min_Gpa", "Experience_Years", 
+                          "Funding_Details", "Eligibility_Criteria", "Other_Requirements"]
+    
+    # Fields that contain comma-separated values and need partial text matching
+    multi_value_fields = ["Eligible_Fields", "Funding_Level", "Scholarship_Type", 
+                          "Danh_Sách_Nhóm_Ngành", "Application_Mode", "Eligible_Field_Group"]
+    
+    # Fields that need case-insensitive exact matching
+    case_insensitive_fields = ["Wanted_Degree", "Country"]
+    
+    for f in filters:
+        field = f["field"]
+        values = f["values"]
+        intra_operator = f.get("operator", "OR").lower()
+
+        # Range operators (GTE / LTE / RANGE) trên field đã chuẩn hóa -> range filter (được cache)
+        if intra_operator in ("gte", "lte", "range"):
+            clauses.append(_range_clause(field, intra_operator, values))
+            continue
+        
+        # Determine if we should use text search or exact keyword matching
+        if field in text_search_fields or field in multi_value_fields:
+            # Use match_phrase query for exact phrase matching in comma-separated values
+            if intra_operator == "or":
+                # OR logic: any value matches
+                should_clauses = []
+                for value in values:
+                    should_clauses.append(
+                        {"match_phrase": {field: str(value)}}
+                    )
+                clauses.append({
+                    "bool": {
+                        "should": should_clauses,
+                        "minimum_should_match": 1
+                    }
                 })
             else:  # AND logic: all values must match
                 for value in values:
@@ -392,20 +1505,961 @@ def filter_advanced(
         # Thêm điều kiện lọc collection
         query_body["bool"]["filter"].append({"term": {"collection": collection}})
 
+    if open_only:
+        query_body["bool"].setdefault("filter", []).append(_open_clause())
 
-    # Trả về rỗng nếu không có bất kỳ điều kiện nào
     if not query_body["bool"]:
-        return {"total": 0, "items": []}
+        return None
+    return query_body
 
-    # Thực thi query
-    res = client.search(
-        index=index,
-        query=query_body,
-        size=size,
-        from_=offset,
+
+def _canonical_filters(filters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Thứ tự các filter và thứ tự giá trị trong AND/OR không ảnh hưởng kết quả,
+    nên sort lại để các request tương đương dùng chung một cache key.
+    """
+    canonical = []
+    for f in filters:
+        operator = str(f.get("operator", "OR")).upper()
+        values = list(f["values"])
+        if operator in ("AND", "OR"):
+            values = sorted(values, key=str)
+        canonical.append({"field": f["field"], "values": values, "operator": operator})
+    return sorted(canonical, key=lambda f: json.dumps(f, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def _filter_cache_params(
+    filters: List[Dict[str, Any]],
+    collection: Optional[str],
+    inter_field_operator: str,
+    size: int,
+    offset: int,
+    fields: Optional[List[str]],
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    return {
+        "filters": _canonical_filters(filters),
+        "collection": collection,
+        "inter_field_operator": inter_field_operator,
+        "size": size,
+        "offset": offset,
+        "fields": fields,
+        "open_only": open_only,
+    }
+
+
+def filter_advanced(
+    client: Elasticsearch,
+    *,
+    index: str,
+    filters: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    size: int = 10,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    """
+    Hàm lọc tổng quát, hỗ trợ logic kết hợp linh hoạt và lọc theo collection.
+    `open_only=True`: chỉ học bổng còn hạn, sắp xếp hạn nộp gần nhất trước
+    (trùng thứ tự index sort nên ES dừng sớm được).
+    """
+    query_body = _build_filter_query(filters, collection, inter_field_operator, open_only)
+
+    # Trả về rỗng nếu không có bất kỳ điều kiện nào
+    if query_body is None:
+        return _empty_result(cursor)
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        # Thực thi query
+        return _run_search(
+            client,
+            index=index,
+            size=size,
+            offset=offset,
+            cursor=cursor,
+            fields=fields,
+            query=query_body,
+            sort=DEADLINE_SORT if open_only else None,
+            **_open_only_kwargs(open_only),
+        )
+
+    # Trang theo cursor gắn với PIT đang mở nên không cache
+    if cursor is not None:
+        return run()
+    params = _filter_cache_params(filters, collection, inter_field_operator, size, offset, fields, open_only)
+    return cached("filter", index, params, run)
+
+
+async def filter_advanced_async(
+    client: AsyncElasticsearch,
+    *,
+    index: str,
+    filters: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    size: int = 10,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    open_only: bool = False,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `filter_advanced`."""
+    query_body = _build_filter_query(filters, collection, inter_field_operator, open_only)
+
+    if query_body is None:
+        return _empty_result(cursor)
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        return await _run_search_async(
+            client,
+            index=index,
+            size=size,
+            offset=offset,
+            cursor=cursor,
+            fields=fields,
+            query=query_body,
+            sort=DEADLINE_SORT if open_only else None,
+            **_open_only_kwargs(open_only),
+        )
+
+    if cursor is not None:
+        return await run()
+    params = _filter_cache_params(filters, collection, inter_field_operator, size, offset, fields, open_only)
+    return await cached_async("filter", index, params, run)
+
+
+# ============================================================================
+# Xếp hạng theo profile: mỗi tiêu chí là một mệnh đề `should` có trọng số
+# (constant_score, nên điểm = tổng trọng số các tiêu chí khớp), cộng thêm độ
+# phù hợp GPA / kinh nghiệm từ field số và điểm hạn nộp gần (gauss decay).
+# Một lần gọi ES trả về top N đã xếp hạng.
+# ============================================================================
+
+PROFILE_GPA_WEIGHT = 2.0
+PROFILE_EXPERIENCE_WEIGHT = 1.0
+PROFILE_DEADLINE_WEIGHT = 2.0
+# Hạn nộp cách hôm nay `scale` thì điểm deadline còn `decay` (một nửa)
+PROFILE_DEADLINE_SCALE = "60d"
+PROFILE_DEADLINE_DECAY = 0.5
+
+
+def _fit_clauses(field: str, value: Optional[float], weight: float) -> List[Dict[str, Any]]:
+    """
+    Yêu cầu `field` <= giá trị của người dùng -> đủ `weight`; học bổng không ghi
+    yêu cầu -> một nửa (chưa chắc); yêu cầu cao hơn -> 0.
+    """
+    if value is None or weight <= 0:
+        return []
+    return [
+        {"constant_score": {"filter": {"range": {field: {"lte": value}}}, "boost": weight}},
+        {"constant_score": {"filter": {"bool": {"must_not": {"exists": {"field": field}}}}, "boost": weight / 2}},
+    ]
+
+
+def _build_profile_query(
+    criteria: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    *,
+    gpa: Optional[float] = None,
+    years_of_experience: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    `criteria`: các filter (cùng dạng `filter_advanced`) kèm `weight`. Học bổng
+    phải khớp ít nhất một tiêu chí; GPA / kinh nghiệm / deadline chỉ cộng điểm.
+    """
+    scored = []
+    for c in criteria:
+        clause = _build_filter_query([c])
+        if clause is None:
+            continue
+        scored.append({"constant_score": {"filter": clause, "boost": float(c.get("weight", 1.0))}})
+    if not scored:
+        return None
+
+    query: Dict[str, Any] = {
+        "bool": {
+            "must": [{"bool": {"should": scored, "minimum_should_match": 1}}],
+            "should": (
+                _fit_clauses("min_gpa", gpa, PROFILE_GPA_WEIGHT)
+                + _fit_clauses("experience_years", years_of_experience, PROFILE_EXPERIENCE_WEIGHT)
+            ),
+        }
+    }
+    if collection:
+        query["bool"]["filter"] = [{"term": {"collection": collection}}]
+
+    return {
+        "function_score": {
+            "query": query,
+            "functions": [
+                {
+                    # Chỉ học bổng còn hạn mới được cộng, hạn càng gần càng nhiều điểm
+                    "filter": {"range": {"end_date": {"gte": "now/d"}}},
+                    "gauss": {
+                        "end_date": {
+                            "origin": "now/d",
+                            "scale": PROFILE_DEADLINE_SCALE,
+                            "decay": PROFILE_DEADLINE_DECAY,
+                        }
+                    },
+                    "weight": PROFILE_DEADLINE_WEIGHT,
+                }
+            ],
+            "score_mode": "sum",
+            "boost_mode": "sum",
+        }
+    }
+
+
+def _profile_cache_params(
+    criteria: List[Dict[str, Any]],
+    collection: Optional[str],
+    gpa: Optional[float],
+    years_of_experience: Optional[float],
+    size: int,
+    offset: int,
+    fields: Optional[List[str]],
+) -> Dict[str, Any]:
+    return {
+        "filters": _canonical_filters(criteria),
+        "weights": sorted([c["field"], float(c.get("weight", 1.0))] for c in criteria),
+        "collection": collection,
+        "gpa": gpa,
+        "years_of_experience": years_of_experience,
+        "size": size,
+        "offset": offset,
+        "fields": fields,
+    }
+
+
+def rank_by_profile(
+    client: Elasticsearch,
+    *,
+    index: str,
+    criteria: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    gpa: Optional[float] = None,
+    years_of_experience: Optional[float] = None,
+    size: int = 10,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Top học bổng cho một profile, xếp theo tổng trọng số tiêu chí khớp + độ phù
+    hợp GPA / kinh nghiệm + hạn nộp gần (xem `_build_profile_query`).
+    `use_cache=False`: luôn hỏi ES (kết quả được lưu lâu dài kèm phiên bản catalog).
+    """
+    query = _build_profile_query(
+        criteria, collection, gpa=gpa, years_of_experience=years_of_experience
     )
-    hits = [
-        {"id": h["_id"], "score": h["_score"], "source": h["_source"]}
-        for h in res["hits"]["hits"]
+    if query is None:
+        return _empty_result()
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        return _run_search(client, index=index, size=size, offset=offset, cursor=None, fields=fields, query=query)
+
+    if not use_cache:
+        return run()
+    params = _profile_cache_params(criteria, collection, gpa, years_of_experience, size, offset, fields)
+    return cached("profile", index, params, run)
+
+
+async def rank_by_profile_async(
+    client: AsyncElasticsearch,
+    *,
+    index: str,
+    criteria: List[Dict[str, Any]],
+    collection: Optional[str] = None,
+    gpa: Optional[float] = None,
+    years_of_experience: Optional[float] = None,
+    size: int = 10,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `rank_by_profile`."""
+    query = _build_profile_query(
+        criteria, collection, gpa=gpa, years_of_experience=years_of_experience
+    )
+    if query is None:
+        return _empty_result()
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        return await _run_search_async(
+            client, index=index, size=size, offset=offset, cursor=None, fields=fields, query=query
+        )
+
+    if not use_cache:
+        return await run()
+    params = _profile_cache_params(criteria, collection, gpa, years_of_experience, size, offset, fields)
+    return await cached_async("profile", index, params, run)
+
+
+# ============================================================================
+# Percolator: query của từng profile được lưu trong index `{collection}_profile_queries`
+# (cùng analysis + mappings với index học bổng). Khi học bổng mới / thay đổi được
+# ingest, một lệnh percolate trả về mọi user có query khớp.
+# ============================================================================
+
+PERCOLATOR_SUFFIX = "_profile_queries"
+PERCOLATE_BATCH_DOCS = 200
+
+_percolator_ready: Set[str] = set()
+
+
+def percolator_index(collection: str) -> str:
+    return f"{collection}{PERCOLATOR_SUFFIX}"
+
+
+def _percolator_body() -> Dict[str, Any]:
+    body = _index_body()
+    body["settings"].pop("index", None)  # query percolator không có hạn nộp để sort
+    mappings = body["mappings"]
+    mappings["properties"] = {
+        **mappings["properties"],
+        "query": {"type": "percolator"},
+        "uid": {"type": "keyword"},
+        "registered_at": {"type": "date"},
+    }
+    return body
+
+
+def ensure_percolator_index(client: Elasticsearch, collection: str) -> str:
+    name = percolator_index(collection)
+    if name in _percolator_ready:
+        return name
+    with _registry_lock:
+        if name not in _percolator_ready:
+            if not client.indices.exists(index=name):
+                try:
+                    client.indices.create(index=name, **_percolator_body())
+                    print(f"🪝 Created percolator index '{name}'")
+                except BadRequestError as e:
+                    if e.error != "resource_already_exists_exception":
+                        raise
+            _percolator_ready.add(name)
+    return name
+
+
+def register_profile_query(
+    client: Elasticsearch, collection: str, uid: str, filters: List[Dict[str, Any]]
+) -> bool:
+    """
+    Lưu (hoặc thay) query của profile `uid` - cùng query OR mà `filter_advanced`
+    dùng cho profile. Không còn tiêu chí nào thì xóa query cũ. Trả về True nếu
+    có query được lưu.
+    """
+    name = ensure_percolator_index(client, collection)
+    # Không có tiêu chí thì chỉ còn filter collection (khớp mọi học bổng) -> không lưu
+    query = _build_filter_query(filters, collection, "OR") if filters else None
+    if query is None:
+        try:
+            client.delete(index=name, id=uid)
+        except NotFoundError:
+            pass
+        return False
+    client.index(
+        index=name,
+        id=uid,
+        document={"uid": uid, "query": query, "registered_at": datetime.now(timezone.utc).isoformat()},
+    )
+    return True
+
+
+def percolate_documents(
+    client: Elasticsearch, collection: str, docs: Iterable[Dict[str, Any]]
+) -> Dict[str, List[str]]:
+    """
+    Trả về `{uid: [doc id, ...]}` cho mọi profile có query khớp ít nhất một doc.
+    Mỗi lệnh percolate gửi tối đa `PERCOLATE_BATCH_DOCS` doc.
+    """
+    name = ensure_percolator_index(client, collection)
+    matches: Dict[str, List[str]] = {}
+    docs = list(docs)
+    for start in range(0, len(docs), PERCOLATE_BATCH_DOCS):
+        batch = docs[start:start + PERCOLATE_BATCH_DOCS]
+        sources = [_prepare_source(doc, collection) for doc in batch]
+        for src in sources:
+            src.pop(EMBEDDING_FIELD, None)
+        hits = helpers.scan(
+            client,
+            index=name,
+            query={"query": {"percolate": {"field": "query", "documents": sources}}},
+            _source=["uid"],
+        )
+        for h in hits:
+            slots = h.get("fields", {}).get("_percolator_document_slot", [0])
+            matched = matches.setdefault(h["_source"].get("uid", h["_id"]), [])
+            matched.extend(str(batch[slot]["id"]) for slot in slots)
+    return matches
+
+
+# ============================================================================
+# Suggest: gợi ý khi gõ trên sub-field `search_as_you_type` (không fuzzy,
+# không đụng tới `__text`), payload chỉ gồm tên + quốc gia.
+# ============================================================================
+
+SUGGEST_FIELDS = ["Scholarship_Name", "Country"]
+
+
+def _build_suggest_body(
+    prefix: str, collection: Optional[str], size: int, include_country: bool
+) -> Dict[str, Any]:
+    targets = [("Scholarship_Name", 3)] + ([("Country", 1)] if include_country else [])
+    fields = [
+        f"{name}.suggest{suffix}^{boost}"
+        for name, boost in targets
+        for suffix in ("", "._2gram", "._3gram")
     ]
-    return {"total": res["hits"]["total"]["value"], "items": hits}
+    query: Dict[str, Any] = {"multi_match": {"query": prefix, "type": "bool_prefix", "fields": fields}}
+    if include_country:
+        # Tên nước tiếng Việt đã gõ xong ("Đức", "Mỹ"): `.suggest` chỉ bỏ dấu,
+        # còn field gốc dùng analyzer `country_search` (có đồng nghĩa)
+        query = {"bool": {"should": [query, {"match": {"Country": prefix}}], "minimum_should_match": 1}}
+    if collection:
+        query = {"bool": {"must": [query], "filter": [{"term": {"collection": collection}}]}}
+    return {
+        "query": query,
+        "size": size,
+        "track_total_hits": False,
+        "source_includes": SUGGEST_FIELDS,
+    }
+
+
+def _to_suggest_result(res: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "items": [
+            {
+                "id": h["_id"],
+                "name": h.get("_source", {}).get("Scholarship_Name"),
+                "country": h.get("_source", {}).get("Country"),
+            }
+            for h in res["hits"]["hits"]
+        ]
+    }
+
+
+def suggest_scholarships(
+    client: Elasticsearch,
+    prefix: str,
+    *,
+    index: str,
+    collection: Optional[str] = None,
+    size: int = 8,
+    include_country: bool = True,
+) -> Dict[str, Any]:
+    """Gợi ý tên học bổng theo tiền tố người dùng đang gõ (không phân biệt dấu)."""
+    prefix = prefix.strip()
+    if not prefix:
+        return {"items": []}
+    body = _build_suggest_body(prefix, collection, size, include_country)
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        return _to_suggest_result(client.search(index=index, **body))
+
+    params = {"q": prefix.lower(), "collection": collection, "size": size, "include_country": include_country}
+    return cached("suggest", index, params, run)
+
+
+async def suggest_scholarships_async(
+    client: AsyncElasticsearch,
+    prefix: str,
+    *,
+    index: str,
+    collection: Optional[str] = None,
+    size: int = 8,
+    include_country: bool = True,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `suggest_scholarships`."""
+    prefix = prefix.strip()
+    if not prefix:
+        return {"items": []}
+    body = _build_suggest_body(prefix, collection, size, include_country)
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        return _to_suggest_result(await client.search(index=index, **body))
+
+    params = {"q": prefix.lower(), "collection": collection, "size": size, "include_country": include_country}
+    return await cached_async("suggest", index, params, run)
+
+
+# ============================================================================
+# Batch: nhiều search/filter trong một round-trip `_msearch`
+# ============================================================================
+
+def _compile_batch_spec(spec: Dict[str, Any], fuzzy: bool = False) -> Optional[Dict[str, Any]]:
+    """Body search cho một spec; None nếu filter rỗng (kết quả rỗng, khỏi gửi lên ES)."""
+    if spec["type"] == "search":
+        query = _build_keyword_query(spec["q"], spec.get("collection"), fuzzy=fuzzy)
+    else:
+        query = _build_filter_query(
+            spec.get("filters") or [], spec.get("collection"), spec.get("inter_field_operator", "AND")
+        )
+        if query is None:
+            return None
+    body: Dict[str, Any] = {"query": query, "size": spec.get("size", 10), "from": spec.get("offset", 0)}
+    if spec.get("fields") is not None:
+        body["_source"] = {"includes": spec["fields"]}
+    return body
+
+
+def _batch_error(e: Any, error_type: str) -> Dict[str, Any]:
+    return {"error": str(e), "error_type": error_type, "total": 0, "items": []}
+
+
+def _prepare_batch(specs: List[Dict[str, Any]]) -> Tuple[List[Optional[Dict[str, Any]]], List[Dict[str, Any]], List[int]]:
+    """
+    Trả về (results đã biết trước, searches cho `_msearch`, vị trí tương ứng của từng search).
+    Spec lỗi khi build query chỉ làm hỏng kết quả của riêng nó.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(specs)
+    searches: List[Dict[str, Any]] = []
+    positions: List[int] = []
+    for i, spec in enumerate(specs):
+        try:
+            body = _compile_batch_spec(spec)
+        except Exception as e:
+            results[i] = _batch_error(e, type(e).__name__)
+            continue
+        if body is None:
+            results[i] = {**_empty_result(), "error": None}
+            continue
+        searches.extend([{"index": spec["index"]}, body])
+        positions.append(i)
+    return results, searches, positions
+
+
+def _fuzzy_batch(
+    specs: List[Dict[str, Any]], results: List[Optional[Dict[str, Any]]]
+) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Pha fuzzy cho các spec search có quá ít kết quả ở pha exact (giống `search_keyword`)."""
+    searches: List[Dict[str, Any]] = []
+    positions: List[int] = []
+    for i, spec in enumerate(specs):
+        result = results[i]
+        if spec["type"] == "search" and result and result["error"] is None and result["total"] < FUZZY_MIN_HITS:
+            searches.extend([{"index": spec["index"]}, _compile_batch_spec(spec, fuzzy=True)])
+            positions.append(i)
+    return searches, positions
+
+
+def _merge_batch(
+    specs: List[Dict[str, Any]],
+    results: List[Optional[Dict[str, Any]]],
+    positions: List[int],
+    responses: List[Dict[str, Any]],
+    phase: str,
+) -> List[Dict[str, Any]]:
+    for i, res in zip(positions, responses):
+        if "error" in res:
+            results[i] = _batch_error(_error_reason(res), f"HTTP {res.get('status', 'error')}")
+        else:
+            results[i] = {**_to_result(res), "error": None}
+            if specs[i]["type"] == "search":
+                results[i]["phase"] = phase
+    return results  # type: ignore[return-value]
+
+
+def multi_search(client: Elasticsearch, specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Chạy nhiều spec search/filter (cùng query builder với `search_keyword` /
+    `filter_advanced`) trong một request `_msearch`. Mỗi kết quả có field `error`
+    riêng (None nếu thành công), theo đúng thứ tự `specs`. Các search quá ít kết
+    quả được chạy lại pha fuzzy trong một `_msearch` thứ hai.
+    """
+    for index in {spec["index"] for spec in specs}:
+        ensure_index(client, index)
+
+    results, searches, positions = _prepare_batch(specs)
+    if searches:
+        res = client.msearch(searches=searches)
+        _merge_batch(specs, results, positions, res["responses"], "exact")
+    searches, positions = _fuzzy_batch(specs, results)
+    if searches:
+        res = client.msearch(searches=searches)
+        _merge_batch(specs, results, positions, res["responses"], "fuzzy")
+    return results  # type: ignore[return-value]
+
+
+async def multi_search_async(client: AsyncElasticsearch, specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Phiên bản asyncio của `multi_search`."""
+    for index in {spec["index"] for spec in specs}:
+        await ensure_index_async(client, index)
+
+    results, searches, positions = _prepare_batch(specs)
+    if searches:
+        res = await client.msearch(searches=searches)
+        _merge_batch(specs, results, positions, res["responses"], "exact")
+    searches, positions = _fuzzy_batch(specs, results)
+    if searches:
+        res = await client.msearch(searches=searches)
+        _merge_batch(specs, results, positions, res["responses"], "fuzzy")
+    return results  # type: ignore[return-value]
+
+
+# ============================================================================
+# Hybrid search: BM25 + kNN (cùng filter, đẩy xuống ANN search) trong một
+# `_msearch`, gộp bằng reciprocal rank fusion ở phía client.
+# ============================================================================
+
+HYBRID_RANK_CONSTANT = 60
+HYBRID_WINDOW = 50
+
+
+def _hybrid_searches(
+    q: str,
+    query_vector: Optional[List[float]],
+    *,
+    index: str,
+    filter_query: Dict[str, Any],
+    window: int,
+    num_candidates: int,
+    fields: Optional[List[str]],
+) -> List[Dict[str, Any]]:
+    source = {"includes": fields} if fields is not None else {"excludes": [EMBEDDING_FIELD]}
+    bm25 = {
+        "query": {"bool": {"must": [_build_keyword_query(q)], "filter": [filter_query]}},
+        "size": window,
+        "_source": source,
+    }
+    searches = [{"index": index}, bm25]
+    if query_vector is not None:
+        knn = {
+            "knn": {
+                "field": EMBEDDING_FIELD,
+                "query_vector": query_vector,
+                "k": window,
+                "num_candidates": num_candidates,
+                "filter": filter_query,
+            },
+            "size": window,
+            "_source": source,
+        }
+        searches.extend([{"index": index}, knn])
+    return searches
+
+
+def _rrf_result(
+    responses: List[Dict[str, Any]], size: int, offset: int, rank_constant: int = HYBRID_RANK_CONSTANT
+) -> Dict[str, Any]:
+    bm25 = responses[0]
+    if "error" in bm25:
+        raise RuntimeError(f"BM25 search failed: {_error_reason(bm25)}")
+    rankings = [("bm25", bm25)]
+    if len(responses) > 1:
+        if "error" in responses[1]:
+            print(f"⚠️  kNN search failed, hybrid falls back to BM25: {_error_reason(responses[1])}")
+        else:
+            rankings.append(("knn", responses[1]))
+
+    fused: Dict[str, Dict[str, Any]] = {}
+    for name, res in rankings:
+        for rank, h in enumerate(res["hits"]["hits"], start=1):
+            item = fused.setdefault(
+                h["_id"], {"id": h["_id"], "score": 0.0, "source": h.get("_source", {}), "ranks": {}}
+            )
+            item["score"] += 1.0 / (rank_constant + rank)
+            item["ranks"][name] = rank
+    items = sorted(fused.values(), key=lambda i: i["score"], reverse=True)
+    # `total`: số doc khớp BM25 (kèm doc chỉ kNN tìm thấy trong cửa sổ nếu nhiều hơn);
+    # chỉ phân trang được trong `window` kết quả đầu đã gộp
+    bm25_total = bm25["hits"]["total"]
+    result: Dict[str, Any] = {
+        "total": max(bm25_total["value"], len(items)),
+        "items": items[offset:offset + size],
+        "window": len(items),
+        "mode": "hybrid" if len(rankings) > 1 else "bm25",
+    }
+    if bm25_total.get("relation") == "gte":
+        result["total_relation"] = "gte"
+    return result
+
+
+def _hybrid_cache_params(
+    q: str,
+    filters: List[Dict[str, Any]],
+    collection: Optional[str],
+    inter_field_operator: str,
+    size: int,
+    offset: int,
+    fields: Optional[List[str]],
+    window: int,
+    embedded: bool,
+) -> Dict[str, Any]:
+    return {
+        **_filter_cache_params(filters, collection, inter_field_operator, size, offset, fields),
+        "q": q.strip(),
+        "window": window,
+        "embedded": embedded,
+    }
+
+
+def search_hybrid(
+    client: Elasticsearch,
+    q: str,
+    *,
+    index: str,
+    collection: Optional[str] = None,
+    filters: List[Dict[str, Any]] = (),
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    size: int = 10,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+    embedder: Optional[Embedder] = None,
+    window: int = HYBRID_WINDOW,
+) -> Dict[str, Any]:
+    """
+    Kết hợp BM25 (`_build_keyword_query`) và kNN trên `embedding`, cả hai cùng áp
+    dụng filter của `filter_advanced`, rồi xếp hạng lại bằng RRF. Không có
+    `embedder` (hoặc kNN lỗi) thì chỉ dùng BM25; `mode` cho biết đã dùng gì.
+    """
+    filters = list(filters)
+    filter_query = _build_filter_query(filters, collection, inter_field_operator) or {"match_all": {}}
+    window = max(window, offset + size)
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        query_vector = embedder.embed_query(q) if embedder is not None else None
+        searches = _hybrid_searches(
+            q, query_vector,
+            index=index,
+            filter_query=filter_query,
+            window=window,
+            num_candidates=window * 4,
+            fields=fields,
+        )
+        return _rrf_result(client.msearch(searches=searches)["responses"], size, offset)
+
+    params = _hybrid_cache_params(
+        q, filters, collection, inter_field_operator, size, offset, fields, window, embedder is not None
+    )
+    return cached("hybrid", index, params, run)
+
+
+async def search_hybrid_async(
+    client: AsyncElasticsearch,
+    q: str,
+    *,
+    index: str,
+    collection: Optional[str] = None,
+    filters: List[Dict[str, Any]] = (),
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    size: int = 10,
+    offset: int = 0,
+    fields: Optional[List[str]] = None,
+    embedder: Optional[Embedder] = None,
+    window: int = HYBRID_WINDOW,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `search_hybrid` (embed query chạy trong thread pool)."""
+    filters = list(filters)
+    filter_query = _build_filter_query(filters, collection, inter_field_operator) or {"match_all": {}}
+    window = max(window, offset + size)
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        query_vector = await asyncio.to_thread(embedder.embed_query, q) if embedder is not None else None
+        searches = _hybrid_searches(
+            q, query_vector,
+            index=index,
+            filter_query=filter_query,
+            window=window,
+            num_candidates=window * 4,
+            fields=fields,
+        )
+        return _rrf_result((await client.msearch(searches=searches))["responses"], size, offset)
+
+    params = _hybrid_cache_params(
+        q, filters, collection, inter_field_operator, size, offset, fields, window, embedder is not None
+    )
+    return await cached_async("hybrid", index, params, run)
+
+
+# ============================================================================
+# Facets: các giá trị có sẵn (kèm số lượng) cho bộ lọc trên UI
+# ============================================================================
+
+FACET_FIELDS = ["Country", "Funding_Level", "Scholarship_Type", "Wanted_Degree", "Eligible_Field_Group"]
+
+
+def _build_facets_body(
+    filters: List[Dict[str, Any]],
+    collection: Optional[str],
+    inter_field_operator: Literal["AND", "OR"],
+    facets: List[str],
+    facet_size: int,
+) -> Dict[str, Any]:
+    """
+    Query chỉ giới hạn theo collection; các filter đang áp dụng nằm ở `post_filter`.
+    Mỗi facet được đếm trên các filter của những field *khác* nó, nên người dùng
+    vẫn thấy các lựa chọn thay thế của field đang chọn (disjunctive faceting).
+    """
+    unknown = [f for f in facets if f not in FACET_FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported facet fields: {unknown}. Allowed: {FACET_FIELDS}")
+
+    aggs: Dict[str, Any] = {}
+    for field in facets:
+        others = [f for f in filters if f["field"] != field]
+        aggs[field] = {
+            "filter": _build_filter_query(others, None, inter_field_operator) or {"match_all": {}},
+            "aggs": {"values": {"terms": {"field": f"{field}.raw", "size": facet_size}}},
+        }
+
+    body: Dict[str, Any] = {
+        "size": 0,
+        "track_total_hits": True,
+        "query": {"term": {"collection": collection}} if collection else {"match_all": {}},
+        "aggs": aggs,
+    }
+    post_filter = _build_filter_query(filters, None, inter_field_operator)
+    if post_filter is not None:
+        body["post_filter"] = post_filter
+    return body
+
+
+def _to_facets_result(res: Dict[str, Any], facets: List[str]) -> Dict[str, Any]:
+    aggs = res.get("aggregations", {})
+    return {
+        "total": res["hits"]["total"]["value"],
+        "facets": {
+            field: [
+                {"value": b["key"], "count": b["doc_count"]}
+                for b in aggs.get(field, {}).get("values", {}).get("buckets", [])
+            ]
+            for field in facets
+        },
+    }
+
+
+def _facet_cache_params(
+    filters: List[Dict[str, Any]],
+    collection: Optional[str],
+    inter_field_operator: str,
+    facets: List[str],
+    facet_size: int,
+) -> Dict[str, Any]:
+    return {
+        "filters": _canonical_filters(filters),
+        "collection": collection,
+        "inter_field_operator": inter_field_operator,
+        "facets": sorted(facets),
+        "facet_size": facet_size,
+    }
+
+
+def facet_counts(
+    client: Elasticsearch,
+    *,
+    index: str,
+    filters: List[Dict[str, Any]] = (),
+    collection: Optional[str] = None,
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    facets: Optional[List[str]] = None,
+    facet_size: int = 50,
+) -> Dict[str, Any]:
+    """
+    Đếm số học bổng theo từng giá trị của các field facet (terms aggregation trên `.raw`),
+    `total` là số kết quả sau khi áp dụng `filters`.
+    """
+    facets = list(facets or FACET_FIELDS)
+    filters = list(filters)
+    body = _build_facets_body(filters, collection, inter_field_operator, facets, facet_size)
+
+    def run() -> Dict[str, Any]:
+        ensure_index(client, index)
+        return _to_facets_result(client.search(index=index, **body), facets)
+
+    params = _facet_cache_params(filters, collection, inter_field_operator, facets, facet_size)
+    return cached("facets", index, params, run)
+
+
+async def facet_counts_async(
+    client: AsyncElasticsearch,
+    *,
+    index: str,
+    filters: List[Dict[str, Any]] = (),
+    collection: Optional[str] = None,
+    inter_field_operator: Literal["AND", "OR"] = "AND",
+    facets: Optional[List[str]] = None,
+    facet_size: int = 50,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `facet_counts`."""
+    facets = list(facets or FACET_FIELDS)
+    filters = list(filters)
+    body = _build_facets_body(filters, collection, inter_field_operator, facets, facet_size)
+
+    async def run() -> Dict[str, Any]:
+        await ensure_index_async(client, index)
+        return _to_facets_result(await client.search(index=index, **body), facets)
+
+    params = _facet_cache_params(filters, collection, inter_field_operator, facets, facet_size)
+    return await cached_async("facets", index, params, run)
+
+
+def get_scholarship(client: Elasticsearch, *, index: str, doc_id: str) -> Optional[Dict[str, Any]]:
+    """Lấy đầy đủ một document (trang chi tiết). Trả về None nếu không tồn tại."""
+    ensure_index(client, index)
+    try:
+        res = client.get(index=index, id=doc_id, source_excludes=[EMBEDDING_FIELD])
+    except NotFoundError:
+        return None
+    return {"id": res["_id"], "source": res["_source"]}
+
+
+async def get_scholarship_async(
+    client: AsyncElasticsearch, *, index: str, doc_id: str
+) -> Optional[Dict[str, Any]]:
+    """Phiên bản asyncio của `get_scholarship`."""
+    await ensure_index_async(client, index)
+    try:
+        res = await client.get(index=index, id=doc_id, source_excludes=[EMBEDDING_FIELD])
+    except NotFoundError:
+        return None
+    return {"id": res["_id"], "source": res["_source"]}
+
+
+def _to_cards(res: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"id": d["_id"], "source": d.get("_source", {})} for d in res["docs"] if d.get("found")]
+
+
+def get_cards(
+    client: Elasticsearch, *, index: str, ids: List[str], fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Card view cho danh sách id (một lệnh mget, giữ thứ tự, bỏ id không tồn tại).
+    Được cache theo generation của index như search/filter.
+    """
+    if not ids:
+        return []
+    fields = fields or CARD_FIELDS
+
+    def run() -> List[Dict[str, Any]]:
+        ensure_index(client, index)
+        return _to_cards(client.mget(index=index, ids=ids, source_includes=fields))
+
+    return cached("cards", index, {"ids": ids, "fields": fields}, run)
+
+
+async def get_cards_async(
+    client: AsyncElasticsearch, *, index: str, ids: List[str], fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Phiên bản asyncio của `get_cards`."""
+    if not ids:
+        return []
+    fields = fields or CARD_FIELDS
+
+    async def run() -> List[Dict[str, Any]]:
+        await ensure_index_async(client, index)
+        return _to_cards(await client.mget(index=index, ids=ids, source_includes=fields))
+
+    return await cached_async("cards", index, {"ids": ids, "fields": fields}, run)
@@ -0,0 +1,714 @@
+# services/fallback_svc.py
+"""
+Search dự phòng trong process khi Elasticsearch quá tải / không phản hồi.
+
+Chỉ các collection catalog trong `FALLBACK_COLLECTIONS` (mặc định
+`SYNC_CATALOG_COLLECTIONS`) có snapshot; collection khác chỉ đi qua circuit
+breaker. Snapshot đọc từ Firestore (không phụ thuộc ES) và được chia sẻ giữa
+các worker qua file JSON trong `FALLBACK_SNAPSHOT_DIR`: khi có full sync mới
+(`full_sync_at` trong `_sync_state/{collection}`) hoặc file quá
+`FALLBACK_MAX_AGE`, chỉ worker giữ được file lock đọc lại collection và ghi
+file mới, các worker khác nạp lại file khi thấy nó đổi. Giữa hai lần đó, thay
+đổi mà change feed của worker đã áp dụng vào ES được áp dụng vào snapshot tại
+chỗ (mỗi chu kỳ poll, không đọc lại Firestore). Snapshot gồm:
+  - inverted index BM25 trên cùng các field/boost với `KEYWORD_FIELDS`
+    (best_fields + tie_breaker, bỏ dấu + stopword như analyzer `en_std`,
+    mở rộng đồng nghĩa VI <-> EN như `en_search`),
+  - bitmap (Python int) theo từng (field, giá trị) cho filter, cùng ngữ nghĩa
+    với `_build_filter_query`: match_phrase / match AND / term `.raw` / range.
+
+Circuit breaker bọc các lời gọi ES của `/search` và `/filter`: sau
+`FALLBACK_FAILURE_THRESHOLD` lỗi liên tiếp (timeout, lỗi kết nối, 429/5xx)
+hoặc khi cluster báo red, query được trả lời từ snapshot trong
+`FALLBACK_COOLDOWN` giây, sau đó một request thử lại ES (half-open). Response
+từ snapshot có `degraded: true`.
+"""
+import asyncio
+import base64
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter as TermCounter
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from elasticsearch import ApiError, Elasticsearch, TransportError
+from firebase_admin import firestore
+from prometheus_client import Counter, Gauge
+
+from services.es_svc import KEYWORD_FIELDS, RANGE_FIELDS, _normalize_fields, _parse_date
+from services.firestore_svc import iter_documents
+from services.synonyms import expand_phrase, fold_tokens
+from services.sync_svc import SYNC_CATALOG_COLLECTIONS, add_change_listener, load_full_sync_at
+
+FALLBACK_ENABLED = os.getenv("FALLBACK_ENABLED", "true").lower() == "true"
+FALLBACK_FAILURE_THRESHOLD = int(os.getenv("FALLBACK_FAILURE_THRESHOLD", "5"))
+FALLBACK_COOLDOWN = float(os.getenv("FALLBACK_COOLDOWN", "30"))
+FALLBACK_POLL_INTERVAL = float(os.getenv("FALLBACK_POLL_INTERVAL", "15"))
+FALLBACK_MAX_AGE = float(os.getenv("FALLBACK_MAX_AGE", "900"))
+FALLBACK_COLLECTIONS = [
+    c.strip() for c in os.getenv("FALLBACK_COLLECTIONS", ",".join(SYNC_CATALOG_COLLECTIONS)).split(",") if c.strip()
+]
+FALLBACK_SNAPSHOT_DIR = os.getenv(
+    "FALLBACK_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fallback"),
+)
+
+ES_CIRCUIT_STATE = Gauge(
+    "es_circuit_state",
+    "Elasticsearch circuit breaker state (0 = closed, 1 = half-open, 2 = open)",
+)
+ES_FALLBACK_REQUESTS = Counter(
+    "es_fallback_requests_total",
+    "Requests answered by the in-process fallback engine",
+    ["op", "reason"],
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TIE_BREAKER = 0.3
+
+# Giống stopword `_english_` của ES
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it",
+    "no", "not", "of", "on", "or", "such", "that", "the", "their", "then", "there", "these",
+    "they", "this", "to", "was", "will", "with",
+}
+
+# Cùng phân loại field với `_build_filter_query`
+_PHRASE_FIELDS = {
+    "Language_Certificate", "Min_Gpa", "Experience_Years", "Funding_Details", "Eligibility_Criteria",
+    "Other_Requirements", "Eligible_Fields", "Funding_Level", "Scholarship_Type", "Danh_Sách_Nhóm_Ngành",
+    "Application_Mode", "Eligible_Field_Group",
+}
+_ALL_TERMS_FIELDS = {"Wanted_Degree", "Country"}
+
+
+def _tokens(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [t for v in value for t in _tokens(v)]
+    return [t for t in fold_tokens(value) if t not in _STOPWORDS]
+
+
+def _contains(tokens: List[str], phrase: Tuple[str, ...]) -> bool:
+    n = len(phrase)
+    return any(tuple(tokens[i:i + n]) == phrase for i in range(len(tokens) - n + 1))
+
+
+# Field có search analyzer `country_search` (thêm tên nước một từ)
+_COUNTRY_FIELDS = {"Country", "country"}
+
+
+def _alternatives(phrase: Tuple[str, ...], field: Optional[str] = None) -> List[Tuple[str, ...]]:
+    """`phrase` và các cách viết đồng nghĩa (như filter `vi_en_synonyms` / `vi_en_country_synonyms`)."""
+    return [
+        tuple(t for t in alt if t not in _STOPWORDS)
+        for alt in expand_phrase(phrase, country=field in _COUNTRY_FIELDS)
+    ]
+
+
+def _field_name(spec: str) -> Tuple[str, float]:
+    name, _, boost = spec.partition("^")
+    return name, float(boost or 1.0)
+
+
+# ============================================================================
+# Snapshot
+# ============================================================================
+
+class CatalogSnapshot:
+    """Inverted index BM25 + bitmap filter cho một collection."""
+
+    def __init__(self, collection: str, docs: Iterable[Dict[str, Any]], version: str, built_at: float):
+        self.collection = collection
+        self.version = version
+        self.built_at = built_at
+
+        self.ids: List[str] = []
+        self.sources: List[Dict[str, Any]] = []
+        self._field_tokens: List[Dict[str, List[str]]] = []
+        self._fields = [_field_name(spec) for spec in KEYWORD_FIELDS]
+        # field -> term -> {doc: tf}
+        self._postings: Dict[str, Dict[str, Dict[int, int]]] = {name: {} for name, _ in self._fields}
+        self._lengths: Dict[str, List[int]] = {name: [] for name, _ in self._fields}
+        self._bitmaps: Dict[Tuple[str, str, str], int] = {}
+        self._bitmaps_lock = threading.Lock()
+
+        for doc in docs:
+            self._add(doc)
+        self.size = len(self.ids)
+        self.all = (1 << self.size) - 1
+        self._avg = {
+            name: (sum(lengths) / len(lengths) if lengths else 0.0) for name, lengths in self._lengths.items()
+        }
+
+    def _add(self, doc: Dict[str, Any]) -> None:
+        pos = len(self.ids)
+        source = {k: v for k, v in doc.items() if k not in ("__text", "embedding")}
+        source.update(_normalize_fields(source))
+        source["collection"] = self.collection
+        self.ids.append(str(doc.get("id")))
+        self.sources.append(source)
+
+        per_field = {k: _tokens(v) for k, v in source.items() if isinstance(v, (str, list))}
+        self._field_tokens.append(per_field)
+        for name, _ in self._fields:
+            tokens = (
+                [t for k, v in per_field.items() if k not in RANGE_FIELDS.values() and k != "collection" for t in v]
+                if name == "__text" else per_field.get(name, [])
+            )
+            self._lengths[name].append(len(tokens))
+            for term, tf in TermCounter(tokens).items():
+                self._postings[name].setdefault(term, {})[pos] = tf
+
+    # ------------------------------------------------------------------ search
+
+    def _bm25(self, name: str, term: str) -> Dict[int, float]:
+        postings = self._postings[name].get(term)
+        if not postings:
+            return {}
+        idf = math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+        avg = self._avg[name] or 1.0
+        lengths = self._lengths[name]
+        return {
+            doc: idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / avg))
+            for doc, tf in postings.items()
+        }
+
+    def search(self, q: str, mask: Optional[int] = None) -> List[Tuple[int, float]]:
+        """best_fields: điểm field cao nhất + TIE_BREAKER * tổng các field còn lại."""
+        tokens = _tokens(q)
+        terms = set(tokens)
+        for alt in _alternatives(tuple(tokens)):
+            terms.update(alt)
+        country_terms = set(tokens)
+        for alt in _alternatives(tuple(tokens), "Country"):
+            country_terms.update(alt)
+
+        per_doc: Dict[int, List[float]] = {}
+        for name, boost in self._fields:
+            field_scores: Dict[int, float] = {}
+            for term in country_terms if name in _COUNTRY_FIELDS else terms:
+                for doc, score in self._bm25(name, term).items():
+                    field_scores[doc] = field_scores.get(doc, 0.0) + score
+            for doc, score in field_scores.items():
+                per_doc.setdefault(doc, []).append(score * boost)
+
+        ranked = []
+        for doc, scores in per_doc.items():
+            if mask is not None and not (mask >> doc) & 1:
+                continue
+            best = max(scores)
+            ranked.append((doc, best + TIE_BREAKER * (sum(scores) - best)))
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked
+
+    # ------------------------------------------------------------------ filter
+
+    def _bitmap(self, kind: str, field: str, value: Any, match: Callable[[Dict[str, Any], List[str]], bool]) -> int:
+        key = (kind, field, repr(value))
+        with self._bitmaps_lock:
+            cached = self._bitmaps.get(key)
+        if cached is not None:
+            return cached
+        bits = 0
+        for pos in range(self.size):
+            if match(self.sources[pos], self._field_tokens[pos].get(field, [])):
+                bits |= 1 << pos
+        with self._bitmaps_lock:
+            self._bitmaps[key] = bits
+        return bits
+
+    def _value_bitmap(self, field: str, value: Any) -> int:
+        if field in _PHRASE_FIELDS:
+            alternatives = _alternatives(tuple(_tokens(value)), field)
+            return self._bitmap(
+                "phrase", field, value,
+                lambda src, tokens: any(alt and _contains(tokens, alt) for alt in alternatives),
+            )
+        if field in _ALL_TERMS_FIELDS:
+            alternatives = [set(alt) for alt in _alternatives(tuple(_tokens(value)), field)]
+            return self._bitmap(
+                "terms", field, value,
+                lambda src, tokens: any(alt and alt <= set(tokens) for alt in alternatives),
+            )
+
+        def exact(src: Dict[str, Any], _tokens_: List[str]) -> bool:
+            current = src.get(field)
+            if isinstance(current, list):
+                return value in current
+            return current == value
+
+        return self._bitmap("term", field, value, exact)
+
+    def _range_bitmap(self, field: str, operator: str, values: List[Any]) -> int:
+        target = RANGE_FIELDS.get(field, field)
+        if operator == "range":
+            if len(values) != 2:
+                raise ValueError(f"RANGE filter on '{field}' needs exactly 2 values [from, to]")
+            bounds = [("gte", values[0]), ("lte", values[1])]
+        else:
+            if len(values) != 1:
+                raise ValueError(f"{operator.upper()} filter on '{field}' needs exactly 1 value")
+            bounds = [(operator, values[0])]
+        is_date = target in ("start_date", "end_date")
+        bounds = [(op, (_parse_date(v) or str(v))[:10] if is_date else float(v)) for op, v in bounds]
+
+        def in_range(src: Dict[str, Any], _tokens_: List[str]) -> bool:
+            current = src.get(target)
+            if current is None:
+                return False
+            current = str(current)[:10] if is_date else float(current)
+            return all(current >= v if op == "gte" else current <= v for op, v in bounds)
+
+        return self._bitmap("range", target, bounds, in_range)
+
+    def open_bitmap(self) -> int:
+        today = date.today().isoformat()
+        return self._bitmap(
+            "open", "end_date", today,
+            lambda src, _t: src.get("end_date") is not None and str(src["end_date"])[:10] >= today,
+        )
+
+    def filter_mask(
+        self, filters: List[Dict[str, Any]], inter_field_operator: str = "AND", open_only: bool = False
+    ) -> int:
+        clauses = []
+        for f in filters:
+            field, values = f["field"], f["values"]
+            operator = str(f.get("operator", "OR")).lower()
+            if operator in ("gte", "lte", "range"):
+                clauses.append(self._range_bitmap(field, operator, values))
+                continue
+            bitmaps = [self._value_bitmap(field, v) for v in values]
+            # Như `_build_filter_query`: field term nhiều giá trị luôn là `terms` (OR)
+            use_and = operator == "and" and (field in _PHRASE_FIELDS or field in _ALL_TERMS_FIELDS)
+            combined = self.all if use_and else 0
+            for bits in bitmaps:
+                combined = combined & bits if use_and else combined | bits
+            clauses.append(combined)
+
+        if not clauses:
+            mask = self.all
+        elif inter_field_operator == "AND":
+            mask = self.all
+            for bits in clauses:
+                mask &= bits
+        else:
+            mask = 0
+            for bits in clauses:
+                mask |= bits
+        if open_only:
+            mask &= self.open_bitmap()
+        return mask
+
+    def positions(self, mask: int) -> List[int]:
+        result = []
+        pos = 0
+        while mask:
+            if mask & 1:
+                result.append(pos)
+            mask >>= 1
+            pos += 1
+        return result
+
+    # ------------------------------------------------------------------ result
+
+    def result(
+        self, ranked: List[Tuple[int, Optional[float]]], size: int, offset: int, fields: Optional[List[str]],
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if cursor is not None:
+            offset = _decode_local_cursor(cursor)
+        items = []
+        for pos, score in ranked[offset:offset + size]:
+            src = self.sources[pos]
+            if fields is not None:
+                src = {k: src[k] for k in fields if k in src}
+            items.append({"id": self.ids[pos], "score": score, "source": src})
+        result: Dict[str, Any] = {"total": len(ranked), "items": items}
+        if cursor is not None:
+            # Snapshot không có point-in-time: cursor cục bộ chỉ mang offset
+            result["next_cursor"] = _encode_local_cursor(offset + size) if offset + size < len(ranked) else None
+        return result
+
+    def with_changes(self, upserts: Dict[str, Dict[str, Any]], deletes: Set[str]) -> "CatalogSnapshot":
+        """Snapshot mới = snapshot này + thay đổi của change feed (giữ `version` / `built_at`)."""
+        docs = {doc_id: source for doc_id, source in zip(self.ids, self.sources) if doc_id not in deletes}
+        docs.update(upserts)
+        return CatalogSnapshot(self.collection, docs.values(), self.version, self.built_at)
+
+
+def _encode_local_cursor(offset: int) -> str:
+    raw = json.dumps({"local": offset}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_local_cursor(cursor: str) -> int:
+    """Offset của cursor do snapshot phát ra; cursor point-in-time của ES thì không dùng được ở đây."""
+    if cursor in ("", "*"):
+        return 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if "local" not in data:
+        raise ValueError(
+            "Elasticsearch is unavailable and its cursors cannot be resumed in degraded mode; "
+            "restart pagination with cursor=*"
+        )
+    return int(data["local"])
+
+
+# ============================================================================
+# Circuit breaker
+# ============================================================================
+
+class CircuitBreaker:
+    """closed -> (lỗi liên tiếp / cluster red) -> open -> (cooldown) -> half-open -> closed | open."""
+
+    def __init__(self, failure_threshold: int = FALLBACK_FAILURE_THRESHOLD, cooldown: float = FALLBACK_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.reason: Optional[str] = None
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        ES_CIRCUIT_STATE.set({"closed": 0, "half_open": 1, "open": 2}[state])
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set("half_open")
+                self._trial = False
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                print("✅ Elasticsearch recovered, circuit closed")
+            self.failures = 0
+            self.reason = None
+            self._trial = False
+            self._set("closed")
+
+    def record_failure(self, reason: str) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self._open(reason)
+
+    def trip(self, reason: str) -> None:
+        with self._lock:
+            self._open(reason)
+
+    def _open(self, reason: str) -> None:
+        if self.state != "open":
+            print(f"🔌 Elasticsearch circuit opened ({reason}), serving from local snapshot")
+        self.reason = reason
+        self._opened_at = time.monotonic()
+        self._set("open")
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "reason": self.reason}
+
+
+def is_es_failure(e: BaseException) -> bool:
+    """Lỗi cho thấy ES quá tải / không phản hồi (khác lỗi query 4xx)."""
+    if isinstance(e, (TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(e, ApiError):
+        return e.meta.status == 429 or e.meta.status >= 500
+    return False
+
+
+# ============================================================================
+# File snapshot chia sẻ giữa các worker
+# ============================================================================
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def write_snapshot_file(path: str, version: str, docs: Iterable[Dict[str, Any]]) -> None:
+    """Ghi snapshot ra file tạm rồi `os.replace` để worker khác không đọc phải file dở."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "built_at": time.time(), "docs": list(docs)}, f,
+                  ensure_ascii=False, default=_json_default)
+    os.replace(tmp, path)
+
+
+# ============================================================================
+# Engine: snapshot theo collection + thread làm mới / kiểm tra health
+# ============================================================================
+
+class FallbackEngine:
+    def __init__(
+        self, client: Optional[Elasticsearch] = None, db=None, *,
+        collections: Iterable[str] = FALLBACK_COLLECTIONS, snapshot_dir: str = FALLBACK_SNAPSHOT_DIR,
+        poll_interval: float = FALLBACK_POLL_INTERVAL,
+    ):
+        self.client = client
+        self.db = db
+        self.collections = list(collections)
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self.breaker = CircuitBreaker()
+        self._snapshots: Dict[str, CatalogSnapshot] = {}
+        self._loaded_mtime: Dict[str, float] = {}
+        # Thay đổi từ change feed chờ áp dụng vào snapshot: collection -> (upserts, deletes)
+        self._pending: Dict[str, Tuple[Dict[str, Dict[str, Any]], Set[str]]] = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        add_change_listener(self.on_changes)
+        self._thread = threading.Thread(target=self._loop, name="es-fallback", daemon=True)
+        self._thread.start()
+        print(f"🛟 Fallback search engine started (collections: {self.collections})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def snapshot(self, collection: str) -> Optional[CatalogSnapshot]:
+        return self._snapshots.get(collection)
+
+    def _path(self, collection: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{collection}.json")
+
+    def _catalog_version(self, collection: str) -> str:
+        """
+        Full sync gần nhất của collection: cùng giá trị ở mọi worker, chỉ tốn một
+        lần đọc doc. Thay đổi của change feed không đổi giá trị này (xem `on_changes`).
+        """
+        full_sync_at = load_full_sync_at(self.db or firestore.client(), collection)
+        return full_sync_at.isoformat() if full_sync_at is not None else "-"
+
+    def on_changes(self, collection: str, upserts: Dict[str, Dict[str, Any]], deletes: Set[str]) -> None:
+        """Listener của change feed: gom thay đổi, thread nền áp dụng ở chu kỳ poll kế tiếp."""
+        if collection not in self.collections:
+            return
+        # Cùng dạng với doc đọc từ file snapshot (datetime -> chuỗi ISO)
+        upserts = json.loads(json.dumps(upserts, ensure_ascii=False, default=_json_default))
+        with self._pending_lock:
+            pending_upserts, pending_deletes = self._pending.setdefault(collection, ({}, set()))
+            for doc_id in deletes:
+                pending_upserts.pop(doc_id, None)
+                pending_deletes.add(doc_id)
+            for doc_id, doc in upserts.items():
+                pending_deletes.discard(doc_id)
+                pending_upserts[doc_id] = doc
+
+    def _apply_pending(self, collection: str) -> None:
+        with self._pending_lock:
+            pending = self._pending.pop(collection, None)
+        snapshot = self._snapshots.get(collection)
+        if pending is None or snapshot is None:
+            return
+        upserts, deletes = pending
+        started = time.monotonic()
+        self._snapshots[collection] = snapshot.with_changes(upserts, deletes)
+        print(
+            f"🛟 Fallback snapshot of '{collection}': applied {len(upserts)} upserts / {len(deletes)} deletes "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+    @staticmethod
+    def _is_fresh(version: Optional[str], built_at: float, expected: Optional[str]) -> bool:
+        # expected None: không đọc được watermark, giữ / nhận snapshot sẵn có
+        return expected is None or (version == expected and time.time() - built_at <= FALLBACK_MAX_AGE)
+
+    def _load_file(self, collection: str, expected: Optional[str]) -> Optional[CatalogSnapshot]:
+        """Nạp file snapshot nếu nó khác bản đang giữ và còn khớp `expected`."""
+        path = self._path(collection)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if self._loaded_mtime.get(collection) == mtime:
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not self._is_fresh(data.get("version"), data.get("built_at", 0.0), expected):
+            return None
+        started = time.monotonic()
+        snapshot = CatalogSnapshot(collection, data["docs"], data["version"], data["built_at"])
+        self._snapshots[collection] = snapshot
+        self._loaded_mtime[collection] = mtime
+        print(f"🛟 Fallback snapshot of '{collection}' loaded: {snapshot.size} docs in {time.monotonic() - started:.1f}s")
+        return snapshot
+
+    def refresh(self, collection: str) -> Optional[CatalogSnapshot]:
+        """
+        Làm mới snapshot khi có full sync mới / quá `FALLBACK_MAX_AGE`. Chỉ worker
+        giữ được file lock đọc Firestore; worker khác giữ bản cũ tới lần poll sau.
+        """
+        try:
+            expected: Optional[str] = self._catalog_version(collection)
+        except Exception as e:
+            print(f"⚠️  Could not read sync state of '{collection}': {e}")
+            expected = None
+        current = self._snapshots.get(collection)
+        if current is not None and self._is_fresh(current.version, current.built_at, expected):
+            return current
+        loaded = self._load_file(collection, expected)
+        if loaded is not None or expected is None:
+            return loaded or current
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        with open(self._path(collection) + ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return current
+            try:
+                # Worker khác có thể vừa ghi xong trước khi ta lấy được lock
+                loaded = self._load_file(collection, expected)
+                if loaded is not None:
+                    return loaded
+                started = time.monotonic()
+                db = self.db or firestore.client()
+                write_snapshot_file(self._path(collection), expected, iter_documents(db.collection(collection)))
+                print(f"🛟 Fallback snapshot of '{collection}' rebuilt from Firestore in {time.monotonic() - started:.1f}s")
+                return self._load_file(collection, expected)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _check_health(self) -> None:
+        if self.client is None:
+            return
+        try:
+            health = self.client.options(request_timeout=5).cluster.health(timeout="2s")
+            if health.get("status") == "red":
+                self.breaker.trip("cluster status red")
+        except Exception as e:
+            if is_es_failure(e):
+                self.breaker.trip(f"health check failed: {type(e).__name__}")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self._check_health()
+            for collection in self.collections:
+                if self._stop.is_set():
+                    return
+                try:
+                    self.refresh(collection)
+                    self._apply_pending(collection)
+                except Exception as e:
+                    print(f"⚠️  Could not build fallback snapshot of '{collection}': {e}")
+            self._stop.wait(self.poll_interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.status(),
+            "snapshots": {
+                name: {"docs": s.size, "version": s.version, "age_seconds": round(time.time() - s.built_at, 1)}
+                for name, s in self._snapshots.items()
+            },
+        }
+
+    # ------------------------------------------------------------------ queries
+
+    def search(
+        self, collection: str, q: str, *, size: int = 10, offset: int = 0,
+        cursor: Optional[str] = None, fields: Optional[List[str]] = None, open_only: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot(collection)
+        if snapshot is None:
+            return None
+        mask = snapshot.open_bitmap() if open_only else None
+        return {**snapshot.result(snapshot.search(q, mask), size, offset, fields, cursor), "phase": "local"}
+
+    def filter(
+        self, collection: str, filters: List[Dict[str, Any]], *, inter_field_operator: str = "AND",
+        size: int = 10, offset: int = 0, cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None, open_only: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot(collection)
+        if snapshot is None:
+            return None
+        positions = snapshot.positions(snapshot.filter_mask(filters, inter_field_operator, open_only))
+        if open_only:
+            # Như `filter_advanced`: hạn nộp gần nhất trước
+            positions.sort(key=lambda pos: str(snapshot.sources[pos].get("end_date")))
+        return snapshot.result([(pos, None) for pos in positions], size, offset, fields, cursor)
+
+
+_engine = FallbackEngine()
+
+
+def get_fallback_engine() -> FallbackEngine:
+    return _engine
+
+
+def start_fallback_engine(client: Elasticsearch, db=None) -> FallbackEngine:
+    _engine.client = client
+    _engine.db = db
+    if FALLBACK_ENABLED and _engine._thread is None:
+        _engine.start()
+    return _engine
+
+
+def stop_fallback_engine() -> None:
+    _engine.stop()
+
+
+async def call_with_fallback(
+    op: str,
+    collection: str,
+    remote: Callable[[], Awaitable[Dict[str, Any]]],
+    local: Callable[[], Optional[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    Gọi ES qua circuit breaker; khi circuit mở hoặc ES lỗi quá tải thì trả lời
+    từ snapshot (`degraded: true`). Không có snapshot (collection ngoài
+    `FALLBACK_COLLECTIONS` hoặc chưa build xong) thì ném lại lỗi gốc.
+    """
+    if not FALLBACK_ENABLED:
+        return await remote()
+    breaker = _engine.breaker
+
+    if breaker.allow():
+        try:
+            result = await remote()
+        except Exception as e:
+            if not is_es_failure(e):
+                # ES vẫn trả lời (lỗi query): không tính là ES hỏng
+                breaker.record_success()
+                raise
+            breaker.record_failure(type(e).__name__)
+            degraded = await asyncio.to_thread(local)
+            if degraded is None:
+                raise
+            ES_FALLBACK_REQUESTS.labels(op, "error").inc()
+            return {**degraded, "degraded": True, "degraded_reason": f"Elasticsearch error: {type(e).__name__}"}
+        breaker.record_success()
+        return result
+
+    degraded = await asyncio.to_thread(local)
+    if degraded is None:
+        raise RuntimeError(f"Elasticsearch is unavailable ({breaker.reason}) and no local snapshot of '{collection}' is ready")
+    ES_FALLBACK_REQUESTS.labels(op, "circuit_open").inc()
+    return {**degraded, "degraded": True, "degraded_reason": f"circuit open: {breaker.reason}"}
@@ -1,8 +1,10 @@
+import os
 import re
-from typing import Optional, Dict, Any, List, Iterable
+from typing import Optional, Dict, Any, List, Iterable, Iterator
 from firebase_admin import firestore
 
 _COLLECTION_RE = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+FIRESTORE_PAGE_SIZE = int(os.getenv("FIRESTORE_PAGE_SIZE", "500"))
 
 def _ensure_valid_collection(collection: str) -> str:
     if not _COLLECTION_RE.match(collection):
@@ -56,3 +58,31 @@ def get_one_raw(collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
     db = _db()
     snap = db.collection(col).document(doc_id).get()
     return snap.to_dict() if snap.exists else None
+
+def iter_snapshots(col_ref, page_size: int = FIRESTORE_PAGE_SIZE, start_after: Optional[str] = None) -> Iterator[Any]:
+    """
+    Đọc collection theo từng trang (order by document id + start_after),
+    chỉ giữ một trang trong bộ nhớ. Trả về DocumentSnapshot (có `update_time`).
+    `start_after`: id của doc cuối đã xử lý (checkpoint) để đọc tiếp từ sau nó.
+    """
+    last = {"__name__": col_ref.document(start_after)} if start_after else None
+    while True:
+        query = col_ref.order_by("__name__").limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        page = list(query.stream())
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+def iter_documents(
+    col_ref, page_size: int = FIRESTORE_PAGE_SIZE, start_after: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """Như `iter_snapshots`, mỗi phần tử là `{"id": doc.id, **data}`."""
+    for snap in iter_snapshots(col_ref, page_size, start_after):
+        yield {"id": snap.id, **(snap.to_dict() or {})}
+
+def stream_collection(collection: str, page_size: int = FIRESTORE_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    col = _ensure_valid_collection(collection)
+    return iter_documents(_db().collection(col), page_size=page_size)
@@ -0,0 +1,167 @@
+# services/match_feed_svc.py
+"""
+Feed "học bổng mới phù hợp" cho từng user (reverse matching bằng percolator).
+
+- Khi profile thay đổi các trường mong muốn, query của profile (đúng bộ filter
+  từ `map_profile_to_filters`) được lưu vào percolator index.
+- Khi học bổng mới / thay đổi được đẩy sang ES (change feed, hoặc full sync /
+  `SyncJob` với các doc đổi sau watermark lần sync trước), một lệnh percolate
+  cho cả batch trả về mọi user bị ảnh hưởng; kết quả được ghi vào
+  `users/{uid}/new_matches/{scholarship_id}`. Lần load đầu (chưa có watermark)
+  không percolate.
+- User có từ trước khi có percolator: `ensure_profile_queries` lúc khởi động
+  (lần đầu) hoặc `scripts/backfill_profile_queries.py` đăng ký query cho tất cả.
+
+Thay cho việc mỗi user phải gọi lại `/match-scholarships-by-profile` để biết có
+học bổng mới hay không.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from elasticsearch import Elasticsearch
+from firebase_admin import firestore
+
+from dtos.user_dtos import UserProfile
+from services.es_svc import percolate_documents, percolator_index, register_profile_query
+from services.firestore_svc import iter_documents
+from services.user_svc import map_profile_to_filters
+
+SCHOLARSHIP_COLLECTION = os.getenv("SCHOLARSHIP_COLLECTION", "scholarships")
+USERS_COLLECTION = "users"
+NEW_MATCHES_COLLECTION = "new_matches"
+
+# Các trường profile ảnh hưởng tới query (đổi trường khác thì không cần đăng ký lại)
+PROFILE_QUERY_FIELDS = {
+    "desired_countries",
+    "desired_scholarship_type",
+    "desired_funding_level",
+    "desired_application_mode",
+    "desired_field_of_study",
+    "field_of_study",
+}
+
+_FIRESTORE_BATCH_LIMIT = 500
+
+
+def _profile_filters(uid: str, profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Profile trong Firestore có thể thiếu field bắt buộc của DTO (email...), chỉ cần các trường desired_*
+    user_profile = UserProfile.model_construct(**{**profile, "uid": uid})
+    return [f.model_dump() for f in map_profile_to_filters(user_profile)]
+
+
+def refresh_profile_query(
+    client: Elasticsearch, uid: str, profile: Dict[str, Any], collection: str = SCHOLARSHIP_COLLECTION
+) -> bool:
+    """Đăng ký lại query percolator cho `uid` từ profile (dict lưu trong Firestore)."""
+    filters = _profile_filters(uid, profile)
+    try:
+        registered = register_profile_query(client, collection, uid, filters)
+    except Exception as e:
+        print(f"⚠️  Could not register profile query for '{uid}': {e}")
+        return False
+    print(f"🪝 Profile query {'registered' if registered else 'removed'} for '{uid}' ({len(filters)} criteria)")
+    return registered
+
+
+def backfill_profile_queries(
+    client: Elasticsearch, db=None, collection: str = SCHOLARSHIP_COLLECTION
+) -> Dict[str, int]:
+    """
+    Đăng ký query cho mọi user hiện có (profile chỉ được đăng ký khi cập nhật,
+    nên user cũ cần chạy hàm này một lần). Trả về số query đã lưu / bỏ qua / lỗi.
+    """
+    db = db or firestore.client()
+    counts = {"registered": 0, "skipped": 0, "failed": 0}
+    for profile in iter_documents(db.collection(USERS_COLLECTION)):
+        uid = str(profile.pop("id"))
+        try:
+            registered = register_profile_query(client, collection, uid, _profile_filters(uid, profile))
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"⚠️  Could not register profile query for '{uid}': {e}")
+            continue
+        counts["registered" if registered else "skipped"] += 1
+    print(f"🪝 Profile queries backfilled for '{collection}': {counts}")
+    return counts
+
+
+def ensure_profile_queries(client: Elasticsearch, db=None, collection: str = SCHOLARSHIP_COLLECTION) -> None:
+    """Lúc khởi động: chưa có percolator index (lần triển khai đầu) thì backfill toàn bộ user."""
+    if client.indices.exists(index=percolator_index(collection)):
+        return
+    backfill_profile_queries(client, db, collection)
+
+
+def notify_new_matches(
+    client: Elasticsearch, collection: str, docs: Iterable[Dict[str, Any]], db=None
+) -> int:
+    """
+    Percolate các học bổng vừa ingest và ghi vào feed của từng user khớp.
+    Trả về số cặp (user, học bổng) được ghi.
+    """
+    docs = [d for d in docs if d.get("id")]
+    if not docs:
+        return 0
+    matches = percolate_documents(client, collection, docs)
+    if not matches:
+        return 0
+
+    by_id = {str(d["id"]): d for d in docs}
+    db = db or firestore.client()
+    batch = db.batch()
+    pending = written = 0
+    for uid, doc_ids in matches.items():
+        feed = db.collection(USERS_COLLECTION).document(uid).collection(NEW_MATCHES_COLLECTION)
+        for doc_id in dict.fromkeys(doc_ids):
+            doc = by_id.get(doc_id, {})
+            batch.set(feed.document(doc_id), {
+                "scholarship_id": doc_id,
+                "collection": collection,
+                "name": doc.get("Scholarship_Name"),
+                "end_date": doc.get("End_Date"),
+                "matched_at": firestore.SERVER_TIMESTAMP,
+                "seen": False,
+            })
+            pending += 1
+            written += 1
+            if pending >= _FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    print(f"🔔 {written} new matches for {len(matches)} users from {len(docs)} '{collection}' docs")
+    return written
+
+
+def get_new_matches(uid: str, *, unseen_only: bool = True, limit: int = 50, db=None) -> List[Dict[str, Any]]:
+    db = db or firestore.client()
+    query = db.collection(USERS_COLLECTION).document(uid).collection(NEW_MATCHES_COLLECTION)
+    if unseen_only:
+        query = query.where(filter=firestore.FieldFilter("seen", "==", False))
+    snaps = query.limit(limit).stream()
+    items = [{"id": s.id, **(s.to_dict() or {})} for s in snaps]
+    # Sort phía client để không cần composite index (seen + matched_at)
+    items.sort(key=lambda m: str(m.get("matched_at") or ""), reverse=True)
+    return items
+
+
+def mark_matches_seen(uid: str, scholarship_ids: Optional[List[str]] = None, db=None) -> int:
+    """
+    Đánh dấu đã xem các match (mặc định: tất cả match chưa xem). Id không có
+    trong feed của user bị bỏ qua (không tạo document mới). Trả về số match được đánh dấu.
+    """
+    db = db or firestore.client()
+    feed = db.collection(USERS_COLLECTION).document(uid).collection(NEW_MATCHES_COLLECTION)
+    if scholarship_ids is None:
+        scholarship_ids = [m["id"] for m in get_new_matches(uid, unseen_only=True, limit=1000, db=db)]
+    else:
+        refs = [feed.document(doc_id) for doc_id in dict.fromkeys(scholarship_ids)]
+        scholarship_ids = [snap.id for snap in db.get_all(refs) if snap.exists] if refs else []
+    batch = db.batch()
+    for i, doc_id in enumerate(scholarship_ids, start=1):
+        batch.update(feed.document(doc_id), {"seen": True})
+        if i % _FIRESTORE_BATCH_LIMIT == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return len(scholarship_ids)
@@ -0,0 +1,270 @@
+# services/recommendation_svc.py
+"""
+Danh sách gợi ý học bổng được tính sẵn cho từng user.
+
+Materializer chạy nền tính top N (id + score) bằng `rank_by_profile` và lưu
+gọn vào `users/{uid}/recommendations/{collection}` (kèm bản sao trong process).
+Trang gợi ý chỉ đọc danh sách này rồi lấy card theo id (`get_cards`, có cache),
+không chạy lại query profile mỗi lần.
+
+Danh sách được tính lại khi:
+  - profile đổi tiêu chí mong muốn / GPA / kinh nghiệm (`schedule_recommendations`),
+  - phiên bản catalog đổi (sau sync): các user đã xem gợi ý trong process
+    này được tính lại ngay, user khác được tính lại ở lần đọc tiếp theo,
+  - danh sách cũ hơn `RECOMMENDATION_MAX_AGE`.
+
+Giới hạn độ cũ:
+  - cũ hơn `RECOMMENDATION_MAX_AGE` hoặc khác phiên bản catalog: vẫn trả ngay
+    (`stale: true`) và tính lại ở background;
+  - cũ hơn `RECOMMENDATION_MAX_STALE_AGE`: tính lại trước khi trả.
+
+Phiên bản catalog (`catalog_version`) = index vật lý sau alias + watermark sync
+trong `_sync_state` - giống nhau giữa các process và sau khi khởi động lại
+(`sync_svc.catalog_version`, khác generation của cache_svc là bộ đếm trong process).
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from elasticsearch import Elasticsearch
+from firebase_admin import firestore
+
+from dtos.user_dtos import UserProfile
+from services.es_svc import rank_by_profile
+from services.match_feed_svc import PROFILE_QUERY_FIELDS, SCHOLARSHIP_COLLECTION, USERS_COLLECTION
+from services.sync_svc import catalog_version
+from services.user_svc import map_profile_to_criteria
+
+RECOMMENDATION_TOP_N = int(os.getenv("RECOMMENDATION_TOP_N", "50"))
+RECOMMENDATION_MAX_AGE = float(os.getenv("RECOMMENDATION_MAX_AGE", "3600"))
+RECOMMENDATION_MAX_STALE_AGE = float(os.getenv("RECOMMENDATION_MAX_STALE_AGE", "86400"))
+RECOMMENDATION_POLL_INTERVAL = float(os.getenv("RECOMMENDATION_POLL_INTERVAL", "30"))
+RECOMMENDATION_MEMORY_SIZE = int(os.getenv("RECOMMENDATION_MEMORY_SIZE", "10000"))
+RECOMMENDATIONS_COLLECTION = "recommendations"
+
+# Các trường profile làm thay đổi kết quả xếp hạng
+RECOMMENDATION_PROFILE_FIELDS = PROFILE_QUERY_FIELDS | {"gpa_range_4", "years_of_experience"}
+
+
+class RecommendationMaterializer:
+    """Thread nền tính lại danh sách gợi ý theo hàng đợi uid."""
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        db,
+        collection: str = SCHOLARSHIP_COLLECTION,
+        *,
+        top_n: int = RECOMMENDATION_TOP_N,
+        poll_interval: float = RECOMMENDATION_POLL_INTERVAL,
+    ):
+        self.client = client
+        self.db = db
+        self.collection = collection
+        self.top_n = top_n
+        self.poll_interval = poll_interval
+        self.computed = 0
+        self.failed = 0
+
+        self._lists: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._queued: Set[str] = set()
+        self._version: Optional[str] = None
+        self._version_checked = 0.0
+        self._seen_version: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._loop, name="recommendations", daemon=True)
+        self._thread.start()
+        print(f"🧮 Recommendation materializer started for '{self.collection}' (top {self.top_n})")
+
+    def stop(self) -> None:
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "collection": self.collection,
+            "catalog_version": self._version,
+            "materialized": len(self._lists),
+            "queued": self._queue.qsize(),
+            "computed": self.computed,
+            "failed": self.failed,
+        }
+
+    # ------------------------------------------------------------------ queue
+
+    def enqueue(self, uid: str) -> None:
+        with self._lock:
+            if uid in self._queued:
+                return
+            self._queued.add(uid)
+        self._queue.put(uid)
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                uid = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._check_version()
+                continue
+            if uid is None:
+                return
+            with self._lock:
+                self._queued.discard(uid)
+            try:
+                self.materialize(uid)
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️  Could not materialize recommendations for '{uid}': {e}")
+            self._check_version()
+
+    def catalog_version(self) -> Optional[str]:
+        """
+        Phiên bản catalog (index vật lý + watermark sync), đọc lại tối đa mỗi
+        `poll_interval` giây. None nếu chưa đọc được.
+        """
+        if self._version is None or time.monotonic() - self._version_checked >= self.poll_interval:
+            try:
+                self._version = catalog_version(self.client, self.db, self.collection)
+            except Exception as e:
+                print(f"⚠️  Could not read catalog version of '{self.collection}': {e}")
+            self._version_checked = time.monotonic()
+        return self._version
+
+    def _check_version(self) -> None:
+        version = self.catalog_version()
+        previous, self._seen_version = self._seen_version, version
+        if previous is None or version == previous:
+            return
+        with self._lock:
+            uids = list(self._lists)
+        print(f"🔁 Catalog '{self.collection}' changed ({version}), refreshing {len(uids)} lists")
+        for uid in uids:
+            self.enqueue(uid)
+
+    # ------------------------------------------------------------------ storage
+
+    def _ref(self, uid: str):
+        return (
+            self.db.collection(USERS_COLLECTION).document(uid)
+            .collection(RECOMMENDATIONS_COLLECTION).document(self.collection)
+        )
+
+    def _remember(self, uid: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._lists[uid] = entry
+            self._lists.move_to_end(uid)
+            while len(self._lists) > RECOMMENDATION_MEMORY_SIZE:
+                self._lists.popitem(last=False)
+
+    def load(self, uid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._lists.get(uid)
+            if entry is not None:
+                self._lists.move_to_end(uid)
+                return entry
+        snap = self._ref(uid).get()
+        if not snap.exists:
+            return None
+        entry = snap.to_dict() or {}
+        self._remember(uid, entry)
+        return entry
+
+    def materialize(self, uid: str) -> Optional[Dict[str, Any]]:
+        """Tính và lưu top N cho `uid`; None nếu user không tồn tại."""
+        snap = self.db.collection(USERS_COLLECTION).document(uid).get()
+        if not snap.exists:
+            return None
+        profile = snap.to_dict() or {}
+        user_profile = UserProfile.model_construct(**{**profile, "uid": uid})
+        criteria = map_profile_to_criteria(user_profile)
+
+        version = self.catalog_version()
+        if criteria:
+            result = rank_by_profile(
+                self.client,
+                index=self.collection,
+                collection=self.collection,
+                criteria=criteria,
+                gpa=user_profile.gpa_range_4,
+                years_of_experience=user_profile.years_of_experience,
+                size=self.top_n,
+                fields=["Scholarship_Name"],
+                # Cache kết quả theo process có thể còn bản trước sync: danh sách lưu
+                # kèm `catalog_version` phải được tính từ chính index hiện tại
+                use_cache=False,
+            )
+        else:
+            result = {"total": 0, "items": []}
+
+        entry = {
+            "ids": [item["id"] for item in result["items"]],
+            "scores": [round(float(item["score"] or 0), 4) for item in result["items"]],
+            "total": result["total"],
+            "catalog_version": version,
+            "computed_at": time.time(),
+        }
+        self._ref(uid).set(entry)
+        self._remember(uid, entry)
+        self.computed += 1
+        return entry
+
+    def is_stale(self, entry: Dict[str, Any]) -> bool:
+        age = time.time() - float(entry.get("computed_at") or 0)
+        return age > RECOMMENDATION_MAX_AGE or entry.get("catalog_version") != self.catalog_version()
+
+    def get(self, uid: str) -> Optional[Dict[str, Any]]:
+        """
+        Danh sách đã tính của `uid` (kèm `stale`). Chưa có hoặc quá
+        `RECOMMENDATION_MAX_STALE_AGE` thì tính ngay; cũ vừa phải thì trả bản cũ
+        và tính lại ở background.
+        """
+        entry = self.load(uid)
+        if entry is None or time.time() - float(entry.get("computed_at") or 0) > RECOMMENDATION_MAX_STALE_AGE:
+            entry = self.materialize(uid)
+            return {**entry, "stale": False} if entry is not None else None
+        stale = self.is_stale(entry)
+        if stale:
+            self.enqueue(uid)
+        return {**entry, "stale": stale}
+
+
+# ============================================================================
+# Materializer của process (khởi động trong lifespan của app)
+# ============================================================================
+
+_materializer: Optional[RecommendationMaterializer] = None
+
+
+def start_materializer(client: Elasticsearch, db=None) -> RecommendationMaterializer:
+    global _materializer
+    if _materializer is None:
+        _materializer = RecommendationMaterializer(client, db or firestore.client())
+        _materializer.start()
+    return _materializer
+
+
+def get_materializer() -> Optional[RecommendationMaterializer]:
+    return _materializer
+
+
+def stop_materializer() -> None:
+    global _materializer
+    if _materializer is not None:
+        _materializer.stop()
+        _materializer = None
+
+
+def schedule_recommendations(uid: str) -> None:
+    """Đưa `uid` vào hàng đợi tính lại (bỏ qua nếu materializer chưa chạy)."""
+    if _materializer is not None:
+        _materializer.enqueue(uid)
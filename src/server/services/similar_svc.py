@@ -0,0 +1,292 @@
+# services/similar_svc.py
+"""
+Đồ thị "học bổng tương tự" tính sẵn (offline) cho trang chi tiết.
+
+Job (`scripts/build_similar.py`) đọc catalog từ Firestore (mỗi document là
+một học bổng, khóa theo id document — học bổng trùng tên vẫn là hai nút riêng),
+rồi tính top K láng giềng cho từng học bổng:
+
+    score = SIMILAR_EMBEDDING_WEIGHT * cosine(embedding)
+          + SIMILAR_FACET_WEIGHT * trung bình Jaccard(Country, Eligible_Field_Group, Wanted_Degree)
+
+Kết quả lưu gọn trong một file `.npz` (id, láng giềng int32, score float32,
+embedding, fingerprint). Lần chạy sau chỉ embed lại học bổng có fingerprint đổi
+và chỉ tính lại những hàng bị ảnh hưởng:
+  - học bổng mới / đổi: tính lại cả hàng,
+  - hàng có láng giềng bị đổi / bị xóa: tính lại cả hàng,
+  - hàng còn lại: gộp top K cũ với score so với các học bổng đổi.
+
+Endpoint `/scholarships/{id}/similar` tra hàng theo id (dict) nên O(1).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.embedding_svc import Embedder, embedding_text, get_embedder
+
+SIMILAR_GRAPH_PATH = os.getenv(
+    "SIMILAR_GRAPH_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "similar_scholarships.npz"),
+)
+SIMILAR_TOP_K = int(os.getenv("SIMILAR_TOP_K", "10"))
+SIMILAR_EMBEDDING_WEIGHT = float(os.getenv("SIMILAR_EMBEDDING_WEIGHT", "0.7"))
+SIMILAR_FACET_WEIGHT = float(os.getenv("SIMILAR_FACET_WEIGHT", "0.3"))
+SIMILAR_FACETS = ["Country", "Eligible_Field_Group", "Wanted_Degree"]
+
+
+def _facet_values(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [v for item in value for v in _facet_values(item)]
+    if not isinstance(value, str) or value == "Not available":
+        return []
+    return [v.strip().lower() for v in value.split(",") if v.strip()]
+
+
+def _fingerprint(doc_id: str, doc: Dict[str, Any]) -> str:
+    """Hash các trường ảnh hưởng tới score (text embed + facet) và id."""
+    payload = {"id": doc_id, "text": embedding_text(doc), **{f: doc.get(f) for f in SIMILAR_FACETS}}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _embedder_name(embedder: Optional[Embedder]) -> str:
+    if embedder is None:
+        return "none"
+    return getattr(embedder, "model", None) or getattr(embedder, "model_name", None) or type(embedder).__name__
+
+
+# ============================================================================
+# Score
+# ============================================================================
+
+class _Scorer:
+    """Ma trận embedding (đã chuẩn hóa) + ma trận one-hot của từng facet."""
+
+    def __init__(self, embeddings: np.ndarray, docs: List[Dict[str, Any]]):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True) if embeddings.size else None
+        self.embeddings = embeddings / np.maximum(norms, 1e-12) if embeddings.size else embeddings
+        self.facets = []
+        for field in SIMILAR_FACETS:
+            values = [set(_facet_values(doc.get(field))) for doc in docs]
+            vocab = {v: i for i, v in enumerate(sorted(set().union(*values)))}
+            onehot = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+            for row, vals in enumerate(values):
+                for v in vals:
+                    onehot[row, vocab[v]] = 1.0
+            self.facets.append((onehot, onehot.sum(axis=1)))
+
+    def scores(self, rows: np.ndarray, cols: Optional[np.ndarray] = None) -> np.ndarray:
+        """Score của `rows` với `cols` (mặc định: mọi học bổng), shape (len(rows), len(cols))."""
+        cols = np.arange(len(self.facets[0][0])) if cols is None else cols
+        total = np.zeros((len(rows), len(cols)), dtype=np.float32)
+        if self.embeddings.size:
+            total += SIMILAR_EMBEDDING_WEIGHT * (self.embeddings[rows] @ self.embeddings[cols].T)
+        for onehot, sizes in self.facets:
+            inter = onehot[rows] @ onehot[cols].T
+            union = sizes[rows][:, None] + sizes[cols][None, :] - inter
+            total += (SIMILAR_FACET_WEIGHT / len(self.facets)) * np.where(union > 0, inter / np.maximum(union, 1), 0)
+        return total
+
+
+def _top_k(scores: np.ndarray, cols: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top `k` của một hàng score (các cột không hợp lệ đã là -inf); thiếu thì đệm -1 / nan."""
+    neighbors = np.full(k, -1, dtype=np.int32)
+    best = np.full(k, np.nan, dtype=np.float32)
+    valid = np.isfinite(scores)
+    n = int(min(k, valid.sum()))
+    if n:
+        part = np.argpartition(-scores, n - 1)[:n]
+        part = part[np.argsort(-scores[part], kind="stable")]
+        neighbors[:n] = cols[part]
+        best[:n] = scores[part]
+    return neighbors, best
+
+
+# ============================================================================
+# Job
+# ============================================================================
+
+def load_catalog(collection: str = "scholarships", db=None) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Catalog học bổng từ Firestore: (id document, dữ liệu) theo thứ tự đọc."""
+    from firebase_admin import firestore
+
+    from services.firestore_svc import iter_documents
+
+    db = db or firestore.client()
+    ids, docs = [], []
+    for doc in iter_documents(db.collection(collection)):
+        ids.append(doc.pop("id"))
+        docs.append(doc)
+    return ids, docs
+
+
+def build_similar_graph(
+    ids: List[str],
+    docs: List[Dict[str, Any]],
+    *,
+    path: str = SIMILAR_GRAPH_PATH,
+    top_k: int = SIMILAR_TOP_K,
+    embedder: Optional[Embedder] = None,
+    full: bool = False,
+) -> Dict[str, Any]:
+    """
+    Tính (lại) đồ thị láng giềng cho catalog `ids`/`docs` và ghi vào `path`.
+    Nếu đã có file cùng cấu hình thì chỉ tính lại phần bị ảnh hưởng.
+    """
+    started = time.monotonic()
+    embedder = embedder if embedder is not None else get_embedder()
+    model = _embedder_name(embedder)
+    fingerprints = np.array([_fingerprint(i, d) for i, d in zip(ids, docs)], dtype=str)
+    n = len(ids)
+
+    previous = None
+    if not full and os.path.exists(path):
+        with np.load(path) as data:
+            previous = {key: data[key] for key in data.files}
+        same_config = (
+            str(previous["model"]) == model
+            and int(previous["neighbors"].shape[1]) == top_k
+            and np.allclose(previous["weights"], [SIMILAR_EMBEDDING_WEIGHT, SIMILAR_FACET_WEIGHT])
+        )
+        if not same_config:
+            print("🔁 Similar graph config changed (model / top_k / weights), full rebuild")
+            previous = None
+
+    # Ánh xạ hàng mới -> hàng cũ (cùng id và cùng fingerprint thì giữ nguyên)
+    old_row = np.full(n, -1, dtype=np.int64)
+    if previous is not None:
+        old_index = {doc_id: row for row, doc_id in enumerate(previous["ids"].tolist())}
+        for row, doc_id in enumerate(ids):
+            old = old_index.get(doc_id)
+            if old is not None and previous["fingerprints"][old] == fingerprints[row]:
+                old_row[row] = old
+    changed = np.flatnonzero(old_row < 0)
+
+    # Embedding: chỉ embed học bổng mới / đổi
+    if embedder is not None:
+        embeddings = None
+        if len(changed):
+            fresh = np.asarray(embedder.embed_documents([embedding_text(docs[r]) for r in changed]), dtype=np.float32)
+            embeddings = np.zeros((n, fresh.shape[1]), dtype=np.float32)
+            embeddings[changed] = fresh
+        kept = np.flatnonzero(old_row >= 0)
+        if len(kept):
+            if embeddings is None:
+                embeddings = np.zeros((n, previous["embeddings"].shape[1]), dtype=np.float32)
+            embeddings[kept] = previous["embeddings"][old_row[kept]]
+        if embeddings is None:
+            embeddings = np.zeros((n, 0), dtype=np.float32)
+    else:
+        embeddings = np.zeros((n, 0), dtype=np.float32)
+
+    scorer = _Scorer(embeddings, docs)
+    neighbors = np.full((n, top_k), -1, dtype=np.int32)
+    scores = np.full((n, top_k), np.nan, dtype=np.float32)
+    all_cols = np.arange(n)
+
+    # Hàng cần tính lại toàn bộ: học bổng đổi + hàng có láng giềng cũ bị đổi / bị xóa
+    recompute = set(changed.tolist())
+    merge_rows = []
+    if previous is not None:
+        new_of_old = np.full(len(previous["ids"]), -1, dtype=np.int64)
+        new_of_old[old_row[old_row >= 0]] = np.flatnonzero(old_row >= 0)
+        for row in np.flatnonzero(old_row >= 0):
+            old_neighbors = previous["neighbors"][old_row[row]]
+            old_neighbors = old_neighbors[old_neighbors >= 0]
+            mapped = new_of_old[old_neighbors]
+            if (mapped < 0).any():
+                recompute.add(int(row))
+            else:
+                merge_rows.append((int(row), mapped, previous["scores"][old_row[row]][:len(mapped)]))
+
+    full_rows = np.array(sorted(recompute), dtype=np.int64)
+    for start in range(0, len(full_rows), 256):
+        rows = full_rows[start:start + 256]
+        block = scorer.scores(rows)
+        block[np.arange(len(rows)), rows] = -np.inf
+        for i, row in enumerate(rows):
+            neighbors[row], scores[row] = _top_k(block[i], all_cols, top_k)
+
+    if merge_rows:
+        vs_changed = scorer.scores(np.array([r for r, _, _ in merge_rows]), changed) if len(changed) else None
+        for i, (row, old_neighbors, old_scores) in enumerate(merge_rows):
+            cols = np.concatenate([old_neighbors, changed]).astype(np.int64)
+            candidate = np.concatenate([old_scores, vs_changed[i] if vs_changed is not None else []]).astype(np.float32)
+            neighbors[row], scores[row] = _top_k(candidate, cols, top_k)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        ids=np.array(ids, dtype=str),
+        names=np.array([str(d.get("Scholarship_Name", "")) for d in docs], dtype=str),
+        neighbors=neighbors,
+        scores=scores,
+        embeddings=embeddings,
+        fingerprints=fingerprints,
+        model=np.array(model),
+        weights=np.array([SIMILAR_EMBEDDING_WEIGHT, SIMILAR_FACET_WEIGHT], dtype=np.float32),
+        built_at=np.array(time.time()),
+    )
+    os.replace(tmp_path, path)
+
+    stats = {
+        "scholarships": n,
+        "changed": int(len(changed)),
+        "recomputed_rows": int(len(full_rows)),
+        "merged_rows": len(merge_rows),
+        "model": model,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    print(f"🕸️  Similar graph written to {path}: {stats}")
+    return stats
+
+
+# ============================================================================
+# Đọc đồ thị (endpoint)
+# ============================================================================
+
+class SimilarGraph:
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.ids: List[str] = data["ids"].tolist()
+            self.neighbors = data["neighbors"]
+            self.scores = data["scores"]
+            self.built_at = float(data["built_at"])
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+    def similar(self, doc_id: str, size: int = SIMILAR_TOP_K) -> Optional[List[Tuple[str, float]]]:
+        """Láng giềng (id, score) của `doc_id`; None nếu không có trong đồ thị."""
+        row = self.rows.get(doc_id)
+        if row is None:
+            return None
+        result = []
+        for neighbor, score in zip(self.neighbors[row][:size], self.scores[row][:size]):
+            if neighbor < 0:
+                break
+            result.append((self.ids[neighbor], round(float(score), 4)))
+        return result
+
+
+_graph: Optional[SimilarGraph] = None
+_graph_mtime = 0.0
+_graph_lock = threading.Lock()
+
+
+def get_similar_graph(path: str = SIMILAR_GRAPH_PATH) -> Optional[SimilarGraph]:
+    """Đồ thị đã build (nạp lại khi job ghi file mới); None nếu chưa chạy job."""
+    global _graph, _graph_mtime
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _graph is None or mtime != _graph_mtime:
+        with _graph_lock:
+            if _graph is None or mtime != _graph_mtime:
+                _graph = SimilarGraph(path)
+                _graph_mtime = mtime
+    return _graph
@@ -0,0 +1,872 @@
+# services/sync_svc.py
+"""
+Incremental sync (change data capture) Firestore -> Elasticsearch.
+
+Mỗi collection có một listener `on_snapshot`. Thay đổi (ADDED / MODIFIED / REMOVED)
+được gom lại và đẩy sang ES theo batch nhỏ bởi một thread flush. Sau mỗi batch
+thành công, watermark (read_time của snapshot đã áp dụng) được lưu vào
+document `_sync_state/{collection}`; khi khởi động lại, snapshot đầu tiên chỉ
+áp dụng các doc có `update_time` mới hơn watermark, và xóa khỏi ES những doc
+không còn trong Firestore.
+
+Full sync lúc khởi động (`run_startup_sync`) chạy nhiều collection song song,
+số worker tự giảm khi ES báo quá tải (429 / hàng đợi write đầy).
+
+Mỗi full sync (lúc khởi động hoặc qua `POST /sync`) là một `SyncJob`: có id,
+tiến độ (đã đọc / đã index / lỗi, tốc độ, ETA), hủy được, và lưu checkpoint
+(id doc cuối đã index) để lần sau chạy tiếp thay vì đọc lại từ đầu.
+"""
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from elasticsearch import Elasticsearch, helpers
+from firebase_admin import firestore
+from prometheus_client import Gauge
+
+from services.es_svc import (
+    _physical_indices,
+    apply_changes,
+    bulk_load_settings,
+    create_index_version,
+    ensure_index,
+    index_many,
+    index_migration_lock,
+    promote_index_version,
+    refresh_index_lock,
+)
+from services.es_client import (
+    ES_BULK_CHUNK_DOCS,
+    ES_BULK_CONCURRENCY,
+    ES_BULK_FORCE_MERGE,
+    ES_BULK_MAX_BYTES,
+)
+from services.embedding_svc import get_embedder
+from services.firestore_svc import FIRESTORE_PAGE_SIZE, _ensure_valid_collection, iter_snapshots
+from services.match_feed_svc import SCHOLARSHIP_COLLECTION, notify_new_matches
+
+SYNC_STATE_COLLECTION = "_sync_state"
+SYNC_FLUSH_INTERVAL = float(os.getenv("SYNC_FLUSH_INTERVAL", "2"))
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "200"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "3"))
+SYNC_READY_TIMEOUT = os.getenv("SYNC_READY_TIMEOUT", "30s")
+# Hàng đợi write thread pool của ES vượt ngưỡng này thì chưa bắt đầu collection mới
+SYNC_MAX_WRITE_QUEUE = int(os.getenv("SYNC_MAX_WRITE_QUEUE", "200"))
+# Thay đổi bị ES từ chối được thử lại tối đa bấy nhiêu lần rồi ghi vào `failed_docs` của `_sync_state`
+SYNC_MAX_RETRIES = int(os.getenv("SYNC_MAX_RETRIES", "5"))
+# Collection catalog được giữ change feed (không mirror `users`... sang ES)
+SYNC_CATALOG_COLLECTIONS = [
+    c.strip() for c in os.getenv("SYNC_CATALOG_COLLECTIONS", SCHOLARSHIP_COLLECTION).split(",") if c.strip()
+]
+
+ES_SYNC_LAG_SECONDS = Gauge(
+    "es_sync_lag_seconds",
+    "Seconds between a Firestore change and its arrival in Elasticsearch",
+    ["collection"],
+)
+ES_SYNC_PENDING_CHANGES = Gauge(
+    "es_sync_pending_changes",
+    "Firestore changes waiting to be flushed to Elasticsearch",
+    ["collection"],
+)
+ES_SYNC_WATERMARK = Gauge(
+    "es_sync_watermark_timestamp_seconds",
+    "Read time of the last Firestore snapshot applied to Elasticsearch",
+    ["collection"],
+)
+
+_feeds: Dict[str, "CollectionChangeFeed"] = {}
+_feeds_lock = threading.Lock()
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return None
+
+
+def load_watermark(db, collection: str) -> Optional[datetime]:
+    snap = db.collection(SYNC_STATE_COLLECTION).document(collection).get()
+    if not snap.exists:
+        return None
+    return (snap.to_dict() or {}).get("watermark")
+
+
+def catalog_version(client: Elasticsearch, db, collection: str) -> str:
+    """
+    Phiên bản catalog giống nhau ở mọi process: index vật lý sau alias + watermark
+    sync. Đổi khi full sync đổi alias hoặc change feed áp dụng thay đổi.
+    """
+    physical = _physical_indices(client, collection)
+    watermark = load_watermark(db, collection)
+    return "{}@{}".format(
+        physical[0] if physical else collection,
+        watermark.isoformat() if watermark is not None else "-",
+    )
+
+
+def save_failed_docs(db, collection: str, failed: Dict[str, str]) -> None:
+    """Ghi lại các doc bỏ cuộc sau `SYNC_MAX_RETRIES` lần (id -> lỗi) để xử lý / resync thủ công."""
+    db.collection(SYNC_STATE_COLLECTION).document(collection).set(
+        {"failed_docs": failed, "updated_at": firestore.SERVER_TIMESTAMP},
+        merge=True,
+    )
+
+
+def load_full_sync_at(db, collection: str) -> Optional[datetime]:
+    """Thời điểm bắt đầu của full sync gần nhất đã hoàn tất (None nếu chưa có)."""
+    snap = db.collection(SYNC_STATE_COLLECTION).document(collection).get()
+    if not snap.exists:
+        return None
+    return (snap.to_dict() or {}).get("full_sync_at")
+
+
+def save_watermark(db, collection: str, watermark: datetime, *, full_sync: bool = False) -> None:
+    state: Dict[str, Any] = {"watermark": watermark, "updated_at": firestore.SERVER_TIMESTAMP}
+    if full_sync:
+        state["full_sync_at"] = watermark
+    db.collection(SYNC_STATE_COLLECTION).document(collection).set(state, merge=True)
+
+
+# Hàm nhận thay đổi change feed đã áp dụng vào ES: (collection, upserts, deletes)
+ChangeListener = Callable[[str, Dict[str, Dict[str, Any]], Set[str]], None]
+_change_listeners: List[ChangeListener] = []
+
+
+def add_change_listener(listener: ChangeListener) -> None:
+    """Đăng ký nhận thay đổi (ví dụ snapshot search dự phòng cập nhật tại chỗ)."""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+class CollectionChangeFeed:
+    """Đồng bộ liên tục một collection Firestore sang index ES cùng tên."""
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        db,
+        collection: str,
+        *,
+        flush_interval: float = SYNC_FLUSH_INTERVAL,
+        batch_size: int = SYNC_BATCH_SIZE,
+    ):
+        self.client = client
+        self.db = db
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.watermark: Optional[datetime] = None
+        self.applied = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._upserts: Dict[str, Dict[str, Any]] = {}
+        self._deletes: Set[str] = set()
+        self._oldest_change: Optional[float] = None
+        self._attempts: Dict[str, int] = {}
+        self._pending_read_time: Optional[datetime] = None
+        self._initial = True
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._watch = None
+        self._flusher: Optional[threading.Thread] = None
+        # Học bổng mới / thay đổi được percolate để báo cho user có profile khớp
+        self._percolate = collection == SCHOLARSHIP_COLLECTION
+        self._skip_initial_percolate = False
+
+    # ------------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        self.watermark = load_watermark(self.db, self.collection)
+        # Chưa có watermark: snapshot đầu là cả collection, không phải "học bổng mới"
+        self._skip_initial_percolate = self.watermark is None
+        if self.watermark is not None:
+            ES_SYNC_WATERMARK.labels(self.collection).set(_timestamp(self.watermark) or 0)
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name=f"cdc-{self.collection}", daemon=True
+        )
+        self._flusher.start()
+        self._watch = self.db.collection(self.collection).on_snapshot(self._on_snapshot)
+        print(f"👂 Change feed started for '{self.collection}' (watermark={self.watermark})")
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval * 5)
+        self._flush()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._upserts) + len(self._deletes)
+        return {
+            "collection": self.collection,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "pending": pending,
+            "applied": self.applied,
+            "failed": self.failed,
+        }
+
+    # ------------------------------------------------------------------ listener
+
+    def _on_snapshot(self, col_snapshot, changes, read_time) -> None:
+        watermark_ts = _timestamp(self.watermark)
+        initial, self._initial = self._initial, False
+
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                changed_at = _timestamp(getattr(doc, "update_time", None)) or _timestamp(read_time)
+                if change.type.name == "REMOVED":
+                    self._upserts.pop(doc.id, None)
+                    self._deletes.add(doc.id)
+                else:
+                    # Snapshot đầu tiên trả về toàn bộ collection: bỏ qua doc đã sync
+                    if initial and watermark_ts is not None and changed_at is not None and changed_at <= watermark_ts:
+                        continue
+                    self._deletes.discard(doc.id)
+                    self._upserts[doc.id] = {"id": doc.id, **(doc.to_dict() or {})}
+                if changed_at is not None:
+                    self._oldest_change = min(self._oldest_change or changed_at, changed_at)
+            self._pending_read_time = read_time
+            pending = len(self._upserts) + len(self._deletes)
+            ES_SYNC_PENDING_CHANGES.labels(self.collection).set(pending)
+
+        if initial and self.watermark is not None:
+            # Doc bị xóa trong lúc app không chạy
+            self._reconcile_deletes({doc.id for doc in col_snapshot})
+            with self._lock:
+                pending = len(self._upserts) + len(self._deletes)
+
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _reconcile_deletes(self, firestore_ids: Set[str]) -> None:
+        try:
+            es_ids = {
+                hit["_id"]
+                for hit in helpers.scan(
+                    self.client, index=self.collection, query={"query": {"match_all": {}}}, _source=False
+                )
+            }
+        except Exception as e:
+            print(f"⚠️  Could not reconcile deletes for '{self.collection}': {e}")
+            return
+        missing = es_ids - firestore_ids
+        if missing:
+            with self._lock:
+                self._deletes.update(missing - set(self._upserts))
+            print(f"🧹 {len(missing)} docs removed from '{self.collection}' while offline")
+
+    # ------------------------------------------------------------------ flusher
+
+    def _flush_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            upserts, self._upserts = self._upserts, {}
+            deletes, self._deletes = self._deletes, set()
+            oldest, self._oldest_change = self._oldest_change, None
+            read_time = self._pending_read_time
+            ES_SYNC_PENDING_CHANGES.labels(self.collection).set(0)
+
+        if not upserts and not deletes:
+            ES_SYNC_LAG_SECONDS.labels(self.collection).set(0)
+            return
+
+        # Từng đoạn `batch_size` doc (snapshot đầu có thể là cả collection),
+        # chờ ES hết tồn write queue giữa các đoạn
+        items = list(upserts.items())
+        chunks = [dict(items[i:i + self.batch_size]) for i in range(0, len(items), self.batch_size)] or [{}]
+        result: Dict[str, Any] = {"success": 0, "failed": 0, "failed_ids": [], "errors": []}
+        unapplied = False
+        for n, chunk in enumerate(chunks):
+            chunk_deletes = deletes if n == 0 else set()
+            try:
+                if n:
+                    _wait_for_write_capacity(self.client)
+                part = apply_changes(
+                    self.client,
+                    index=self.collection,
+                    upserts=chunk,
+                    deletes=chunk_deletes,
+                    collection=self.collection,
+                    batch_size=self.batch_size,
+                    embedder=get_embedder(),
+                )
+            except Exception as e:
+                print(f"❌ Change feed flush failed for '{self.collection}': {e}")
+                self._requeue(
+                    {doc_id: doc for rest in chunks[n:] for doc_id, doc in rest.items()}, chunk_deletes, oldest
+                )
+                # Phần đã áp dụng vẫn được xử lý tiếp bên dưới, watermark giữ nguyên
+                unapplied = True
+                upserts = {doc_id: doc for done in chunks[:n] for doc_id, doc in done.items()}
+                deletes = deletes if n else set()
+                break
+            result["success"] += part["success"]
+            result["failed"] += part["failed"]
+            result["errors"].extend(part.get("errors", part["failed_ids"]))
+        result["failed_ids"] = result["errors"][:10]
+
+        self.applied += result["success"]
+        self.failed += result["failed"]
+        errors = {f["id"]: f["error"] for f in result.get("errors", result["failed_ids"])}
+        for doc_id in set(upserts) | set(deletes):
+            if doc_id not in errors:
+                self._attempts.pop(doc_id, None)
+        retry = self._retry_failed(errors)
+        if result["failed"]:
+            print(f"⚠️  {result['failed']} changes failed for '{self.collection}': {result['failed_ids']}")
+        if retry:
+            # Watermark không vượt qua batch còn doc lỗi: batch sau (hoặc lần khởi động sau) áp dụng lại
+            self._requeue(
+                {d: upserts[d] for d in retry if d in upserts},
+                {d for d in retry if d in deletes},
+                oldest,
+            )
+        elif not unapplied:
+            if oldest is not None:
+                ES_SYNC_LAG_SECONDS.labels(self.collection).set(max(0.0, time.time() - oldest))
+            if read_time is not None:
+                self.watermark = read_time
+                save_watermark(self.db, self.collection, read_time)
+                ES_SYNC_WATERMARK.labels(self.collection).set(_timestamp(read_time) or 0)
+
+        if _change_listeners:
+            failed = {f["id"] for f in result["errors"]}
+            applied = {doc_id: doc for doc_id, doc in upserts.items() if doc_id not in failed}
+            for listener in _change_listeners:
+                try:
+                    listener(self.collection, applied, {d for d in deletes if d not in failed})
+                except Exception as e:
+                    print(f"⚠️  Change listener failed for '{self.collection}': {e}")
+
+        if self._percolate and upserts:
+            if self._skip_initial_percolate:
+                self._skip_initial_percolate = False
+            else:
+                self._notify(upserts, result.get("errors", result["failed_ids"]))
+
+    def _retry_failed(self, errors: Dict[str, str]) -> Set[str]:
+        """Id cần thử lại; doc lỗi quá `SYNC_MAX_RETRIES` lần được ghi vào `_sync_state` và bỏ qua."""
+        retry, dead = set(), {}
+        for doc_id, error in errors.items():
+            attempts = self._attempts.get(doc_id, 0) + 1
+            if attempts > SYNC_MAX_RETRIES:
+                self._attempts.pop(doc_id, None)
+                dead[doc_id] = error
+            else:
+                self._attempts[doc_id] = attempts
+                retry.add(doc_id)
+        if dead:
+            print(f"❌ Giving up on {len(dead)} '{self.collection}' docs after {SYNC_MAX_RETRIES} retries: {sorted(dead)[:10]}")
+            try:
+                save_failed_docs(self.db, self.collection, dead)
+            except Exception as e:
+                print(f"⚠️  Could not record failed docs for '{self.collection}': {e}")
+        return retry
+
+    def _requeue(self, upserts: Dict[str, Dict[str, Any]], deletes: Set[str], oldest: Optional[float]) -> None:
+        """Đưa lại vào hàng đợi, batch sau thử lại (thay đổi mới hơn được ưu tiên)."""
+        with self._lock:
+            for doc_id, doc in upserts.items():
+                if doc_id not in self._deletes:
+                    self._upserts.setdefault(doc_id, doc)
+            self._deletes.update(d for d in deletes if d not in self._upserts)
+            self._oldest_change = min(filter(None, [self._oldest_change, oldest]), default=None)
+
+    def _notify(self, upserts: Dict[str, Dict[str, Any]], failed_ids: List[Dict[str, Any]]) -> None:
+        failed = {f["id"] for f in failed_ids}
+        try:
+            notify_new_matches(
+                self.client,
+                self.collection,
+                [doc for doc_id, doc in upserts.items() if doc_id not in failed],
+                db=self.db,
+            )
+        except Exception as e:
+            print(f"⚠️  Could not percolate new '{self.collection}' docs: {e}")
+
+
+# ============================================================================
+# Registry các change feed đang chạy trong process
+# ============================================================================
+
+def start_change_feed(client: Elasticsearch, collection: str, db=None) -> CollectionChangeFeed:
+    _ensure_valid_collection(collection)
+    with _feeds_lock:
+        feed = _feeds.get(collection)
+        if feed is None:
+            feed = CollectionChangeFeed(client, db or firestore.client(), collection)
+            feed.start()
+            _feeds[collection] = feed
+        return feed
+
+
+def get_change_feed(collection: str) -> Optional[CollectionChangeFeed]:
+    return _feeds.get(collection)
+
+
+def stop_change_feeds() -> None:
+    with _feeds_lock:
+        feeds = list(_feeds.values())
+        _feeds.clear()
+    for feed in feeds:
+        feed.stop()
+
+
+# ============================================================================
+# Full sync lúc khởi động: nhiều collection song song
+# ============================================================================
+
+class _AdaptiveLimit:
+    """
+    Giới hạn số collection sync cùng lúc. Collection nào bị ES trả 429 thì
+    giới hạn giảm một nửa; collection sạch thì tăng lại dần tới `maximum`.
+    """
+
+    def __init__(self, maximum: int):
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, pressured: bool) -> None:
+        with self._cond:
+            self.active -= 1
+            if pressured:
+                self.limit = max(1, self.limit // 2)
+            elif self.limit < self.maximum:
+                self.limit += 1
+            self._cond.notify_all()
+
+
+def _write_queue(es: Elasticsearch) -> int:
+    """Tổng số task đang chờ trong write thread pool (0 nếu không đọc được)."""
+    try:
+        rows = es.cat.thread_pool(thread_pool_patterns="write", h="queue", format="json")
+        return sum(int(r.get("queue") or 0) for r in rows)
+    except Exception:
+        return 0
+
+
+def _wait_for_write_capacity(es: Elasticsearch, max_wait: float = 60.0) -> None:
+    deadline = time.monotonic() + max_wait
+    delay = 1.0
+    while _write_queue(es) > SYNC_MAX_WRITE_QUEUE and time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 10.0)
+
+
+def sync_collection(es: Elasticsearch, db, coll_ref) -> Dict[str, Any]:
+    """Full sync một collection (dưới dạng sync job); trả về tóm tắt kết quả."""
+    job = create_sync_job(es, coll_ref.id, db=db, trigger="startup")
+    return job.run()
+
+
+def run_startup_sync(es: Elasticsearch, db, *, workers: int = SYNC_WORKERS) -> List[Dict[str, Any]]:
+    """
+    Sync mọi collection Firestore (trừ `_sync_state`) với tối đa `workers`
+    collection chạy song song. Trả về tóm tắt theo từng collection.
+    """
+    coll_refs = [c for c in db.collections() if c.id != SYNC_STATE_COLLECTION]
+    limit = _AdaptiveLimit(workers)
+
+    def run(coll_ref) -> Dict[str, Any]:
+        limit.acquire()
+        summary: Dict[str, Any] = {"collection": coll_ref.id, "status": "failed", "rejected": 0}
+        try:
+            summary = sync_collection(es, db, coll_ref)
+        except Exception as e:
+            print(f"❌ Error syncing '{coll_ref.id}': {e}")
+            summary["error"] = str(e)
+        finally:
+            limit.release(pressured=summary.get("rejected", 0) > 0)
+        return summary
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="es-sync") as pool:
+        results = list(pool.map(run, coll_refs))
+    print(f"⏱️  Synced {len(results)} collections in {time.monotonic() - started:.1f}s (workers={workers})")
+    return results
+
+
+# ============================================================================
+# Sync job: full sync chạy nền, theo dõi / hủy được, resume từ checkpoint
+# ============================================================================
+
+SYNC_JOB_WORKERS = int(os.getenv("SYNC_JOB_WORKERS", "2"))
+# Sau mỗi bấy nhiêu doc (đã được ES xác nhận) thì lưu checkpoint
+SYNC_CHECKPOINT_DOCS = int(os.getenv("SYNC_CHECKPOINT_DOCS", "2000"))
+SYNC_JOB_HISTORY = int(os.getenv("SYNC_JOB_HISTORY", "100"))
+
+SYNC_JOB_STATES = ("queued", "running", "completed", "skipped", "failed", "cancelled")
+
+_jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_collection_locks: Dict[str, threading.Lock] = {}
+_job_executor: Optional[ThreadPoolExecutor] = None
+
+
+class SyncCancelled(Exception):
+    pass
+
+
+def load_checkpoint(db, collection: str) -> Optional[Dict[str, Any]]:
+    snap = db.collection(SYNC_STATE_COLLECTION).document(collection).get()
+    if not snap.exists:
+        return None
+    return (snap.to_dict() or {}).get("checkpoint")
+
+
+def save_checkpoint(db, collection: str, checkpoint: Optional[Dict[str, Any]]) -> None:
+    """Lưu checkpoint của full sync đang chạy; `None` để xóa khi sync xong."""
+    db.collection(SYNC_STATE_COLLECTION).document(collection).set(
+        {"checkpoint": checkpoint, "updated_at": firestore.SERVER_TIMESTAMP},
+        merge=True,
+    )
+
+
+def _count_documents(coll_ref) -> Optional[int]:
+    """Số doc trong collection (aggregation query), None nếu không lấy được."""
+    try:
+        result = coll_ref.count().get()
+        return int(result[0][0].value)
+    except Exception as e:
+        print(f"⚠️  Could not count documents in '{coll_ref.id}': {e}")
+        return None
+
+
+def _collection_lock(collection: str) -> threading.Lock:
+    with _jobs_lock:
+        return _collection_locks.setdefault(collection, threading.Lock())
+
+
+class SyncJob:
+    """
+    Full sync một collection Firestore sang ES.
+
+    Doc được đọc theo thứ tự id và index theo từng đoạn `SYNC_CHECKPOINT_DOCS`;
+    sau mỗi đoạn, id của doc cuối được lưu làm checkpoint trong
+    `_sync_state/{collection}`. Job bị hủy hoặc process chết giữa chừng thì job
+    sau đọc tiếp từ checkpoint (cùng index đích) thay vì đọc lại từ đầu. Các job
+    trên cùng collection chạy lần lượt (job sau ở trạng thái `queued`).
+    """
+
+    def __init__(self, client: Elasticsearch, db, collection: str, *, force: bool = False, trigger: str = "api"):
+        self.id = uuid.uuid4().hex
+        self.client = client
+        self.db = db
+        self.collection = collection
+        self.force = force
+        self.trigger = trigger
+
+        self.state = "queued"
+        self.target: Optional[str] = None
+        self.resumed_from: Optional[str] = None
+        self.total: Optional[int] = None
+        self.read = 0
+        self.indexed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.failed_ids: List[str] = []
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._indexed_at_start = 0
+        self._last_id: Optional[str] = None
+        self._cancel = threading.Event()
+        self._locks = ExitStack()
+        # Percolate (báo "học bổng mới phù hợp") các doc đổi sau watermark của lần sync trước
+        self._percolate_after: Optional[float] = None
+        self._changed: List[Dict[str, Any]] = []
+
+    # ------------------------------------------------------------------ status
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("completed", "skipped", "failed", "cancelled")
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def status(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        done_now = self.indexed + self.failed - self._indexed_at_start
+        throughput = done_now / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.state == "running" and self.total is not None and throughput > 0:
+            eta = max(0.0, (self.total - self.indexed - self.failed) / throughput)
+        return {
+            "job_id": self.id,
+            "collection": self.collection,
+            "status": self.state,
+            "force": self.force,
+            "trigger": self.trigger,
+            "target_index": self.target,
+            "resumed_from": self.resumed_from,
+            "total": self.total,
+            "read": self.read,
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "failed_records": self.failed_ids[:10],
+            "throughput_docs_per_sec": round(throughput, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "cancel_requested": self._cancel.is_set() and not self.done,
+            "message": self.message,
+            "error": self.error,
+        }
+
+    # ------------------------------------------------------------------ run
+
+    def run(self) -> Dict[str, Any]:
+        """Chạy job trong thread hiện tại (chờ nếu collection đang có job khác)."""
+        with _collection_lock(self.collection):
+            if self._cancel.is_set():
+                self.state = "cancelled"
+                self.finished_at = time.time()
+                return self.status()
+            self.state = "running"
+            self.started_at = time.time()
+            try:
+                with self._locks:
+                    self._run()
+            except SyncCancelled:
+                self.state = "cancelled"
+                self.message = f"Cancelled after {self.read} docs, resumable from '{self._last_id}'"
+                print(f"🛑 Sync job {self.id} for '{self.collection}' cancelled ({self.message})")
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                print(f"❌ Sync job {self.id} for '{self.collection}' failed: {e}")
+            finally:
+                self.finished_at = time.time()
+        return self.status()
+
+    def _read(self, snaps: Iterator[Any]) -> Iterator[Dict[str, Any]]:
+        for snap in snaps:
+            if self._cancel.is_set():
+                return
+            doc = {"id": snap.id, **(snap.to_dict() or {})}
+            self.read += 1
+            self._last_id = doc["id"]
+            if self._percolate_after is not None:
+                updated = _timestamp(getattr(snap, "update_time", None))
+                if updated is None or updated > self._percolate_after:
+                    self._changed.append(doc)
+            yield doc
+
+    def _notify(self, failed: Set[str]) -> None:
+        """Percolate các doc mới / đổi của đoạn vừa index (bỏ doc bị ES từ chối)."""
+        docs, self._changed = [d for d in self._changed if d["id"] not in failed], []
+        try:
+            notify_new_matches(self.client, self.collection, docs, db=self.db)
+        except Exception as e:
+            print(f"⚠️  Could not percolate new '{self.collection}' docs: {e}")
+
+    def _run(self) -> None:
+        es, name = self.client, self.collection
+        coll_ref = self.db.collection(name)
+
+        checkpoint = load_checkpoint(self.db, name)
+        if checkpoint and not es.indices.exists(index=checkpoint.get("target") or name):
+            print(f"⚠️  Checkpoint target '{checkpoint.get('target')}' is gone, starting '{name}' from scratch")
+            checkpoint = None
+
+        if checkpoint:
+            self.target = checkpoint["target"]
+            self.resumed_from = self._last_id = checkpoint["last_doc_id"]
+            self.indexed = self._indexed_at_start = int(checkpoint.get("indexed") or 0)
+            sync_started = checkpoint.get("started_at") or datetime.now(timezone.utc)
+            print(f"⏯️  Resuming '{name}' into '{self.target}' after doc '{self.resumed_from}'")
+        else:
+            sync_started = datetime.now(timezone.utc)
+            self.target = name
+            if es.indices.exists(index=name):
+                doc_count = es.count(index=name).get("count", 0)
+                if doc_count > 0 and not self.force:
+                    self.state = "skipped"
+                    self.message = f"Index '{name}' already has {doc_count} documents. Use force=true to resync."
+                    print(f"⏭️  Skipping '{name}' - already has {doc_count} documents")
+                    if load_watermark(self.db, name) is None:
+                        # Index được coi là đã đồng bộ: change feed chỉ áp dụng thay đổi từ
+                        # đây, không đẩy lại cả collection từ snapshot đầu tiên
+                        save_watermark(self.db, name, sync_started)
+                    return
+            else:
+                print(f"📝 Creating new index '{name}'...")
+
+        if name == SCHOLARSHIP_COLLECTION:
+            # Chưa có watermark = lần load đầu: cả catalog, không phải "học bổng mới"
+            self._percolate_after = _timestamp(load_watermark(self.db, name))
+
+        # Stream documents from Firestore (từng trang, không giữ cả collection trong RAM)
+        docs = self._read(iter_snapshots(coll_ref, page_size=FIRESTORE_PAGE_SIZE, start_after=self.resumed_from))
+        first = next(docs, None)
+        if first is None and not checkpoint:
+            self.state = "completed"
+            self.message = f"No documents in collection '{name}'"
+            print(f"⚠️ {self.message}")
+            return
+
+        if not checkpoint and self.force and es.indices.exists(index=name):
+            # Full resync: build một index phiên bản mới rồi đổi alias, search không bị gián đoạn.
+            # Lock cấp cluster: worker / pod khác không build song song (và xóa index này khi promote)
+            self._locks.enter_context(index_migration_lock(es, name, owner=f"sync job {self.id}"))
+            self.target = create_index_version(es, name)
+        elif self.target != name:
+            # Chạy tiếp một lần build phiên bản mới từ checkpoint
+            self._locks.enter_context(index_migration_lock(es, name, owner=f"sync job {self.id}"))
+
+        # Index được tạo với wait_for_active_shards (mặc định 1), sau đó chờ primary
+        # active bằng một lệnh health phía server thay vì vòng lặp sleep
+        ensure_index(es, self.target)
+        health = es.cluster.health(index=self.target, wait_for_status="yellow", timeout=SYNC_READY_TIMEOUT)
+        if health.get("timed_out"):
+            print(f"⚠️  '{self.target}' not ready after {SYNC_READY_TIMEOUT} ({health.get('status')}), attempting anyway...")
+
+        self.total = _count_documents(coll_ref)
+        print(f"📦 Indexing '{name}' -> '{self.target}' (parallel bulk x{ES_BULK_CONCURRENCY}, job {self.id})...")
+
+        with bulk_load_settings(es, self.target, force_merge=ES_BULK_FORCE_MERGE):
+            while first is not None:
+                _wait_for_write_capacity(es)
+                result = index_many(
+                    es,
+                    itertools.chain([first], itertools.islice(docs, SYNC_CHECKPOINT_DOCS - 1)),
+                    index=self.target,
+                    collection=name,
+                    batch_size=ES_BULK_CHUNK_DOCS,
+                    max_chunk_bytes=ES_BULK_MAX_BYTES,
+                    concurrency=ES_BULK_CONCURRENCY,
+                    embedder=get_embedder(),
+                )
+                self.indexed += result["success"]
+                self.failed += result["failed"]
+                self.rejected += result.get("rejected", 0)
+                self.failed_ids.extend(result["failed_ids"][: max(0, 10 - len(self.failed_ids))])
+                if result.get("error"):
+                    raise RuntimeError(result["error"])
+                if self._changed:
+                    self._notify(set(result.get("failed_doc_ids", [])))
+                if self.target != name:
+                    refresh_index_lock(es, name)
+                # Đoạn này đã được ES xác nhận hết: lần sau đọc tiếp từ sau doc cuối
+                save_checkpoint(self.db, name, {
+                    "job_id": self.id,
+                    "target": self.target,
+                    "last_doc_id": self._last_id,
+                    "indexed": self.indexed,
+                    "started_at": sync_started,
+                })
+                first = next(docs, None)
+
+        if self._cancel.is_set():
+            raise SyncCancelled()
+
+        if self.target != name:
+            promote_index_version(es, name, self.target)
+        # Change feed chỉ cần áp dụng thay đổi xảy ra sau thời điểm bắt đầu full sync
+        save_watermark(self.db, name, sync_started, full_sync=True)
+        save_checkpoint(self.db, name, None)
+
+        self.state = "completed"
+        self.message = f"Synced {self.indexed} docs from '{name}'"
+        print(f"✅ {self.message}")
+        if self.failed:
+            print(f"⚠️  {self.failed} documents failed")
+
+
+def _register_job(job: SyncJob) -> None:
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Chỉ giữ lịch sử SYNC_JOB_HISTORY job đã xong gần nhất
+        finished = [j.id for j in _jobs.values() if j.done]
+        for job_id in finished[: max(0, len(finished) - SYNC_JOB_HISTORY)]:
+            del _jobs[job_id]
+
+
+def create_sync_job(
+    client: Elasticsearch, collection: str, *, force: bool = False, db=None, trigger: str = "api"
+) -> SyncJob:
+    """Tạo và đăng ký job (chưa chạy) - dùng khi muốn tự chạy `job.run()`."""
+    _ensure_valid_collection(collection)
+    job = SyncJob(client, db or firestore.client(), collection, force=force, trigger=trigger)
+    _register_job(job)
+    return job
+
+
+def submit_sync_job(client: Elasticsearch, collection: str, *, force: bool = False, db=None) -> SyncJob:
+    """Tạo job và chạy nền; trả về ngay để client theo dõi qua `get_sync_job`."""
+    global _job_executor
+    job = create_sync_job(client, collection, force=force, db=db)
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=max(1, SYNC_JOB_WORKERS), thread_name_prefix="sync-job")
+        executor = _job_executor
+    executor.submit(job.run)
+    print(f"🧾 Sync job {job.id} queued for '{collection}' (force={force})")
+    return job
+
+
+def get_sync_job(job_id: str) -> Optional[SyncJob]:
+    return _jobs.get(job_id)
+
+
+def list_sync_jobs(collection: Optional[str] = None) -> List[Dict[str, Any]]:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return [j.status() for j in reversed(jobs) if collection is None or j.collection == collection]
+
+
+def cancel_sync_job(job_id: str) -> Optional[SyncJob]:
+    """Yêu cầu hủy; job dừng sau đoạn đang index và giữ checkpoint để resume."""
+    job = _jobs.get(job_id)
+    if job is not None and not job.done:
+        job.cancel()
+    return job
+
+
+def cancel_sync_jobs() -> None:
+    """Lúc shutdown: hủy mọi job chưa xong để chúng kịp lưu checkpoint."""
+    global _job_executor
+    with _jobs_lock:
+        jobs = [j for j in _jobs.values() if not j.done]
+        executor, _job_executor = _job_executor, None
+    for job in jobs:
+        job.cancel()
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=False)
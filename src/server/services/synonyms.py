@@ -0,0 +1,237 @@
+# services/synonyms.py
+"""
+Từ điển đồng nghĩa VI <-> EN dùng cho analyzer lúc search (`synonym_graph`).
+
+Dữ liệu học bổng được lưu bằng tiếng Anh, còn người dùng (và filter trên UI)
+hay gõ tiếng Việt: "Đức", "Hà Lan", "toàn phần", "thạc sĩ"... Key của các dict
+dưới đây là đúng các giá trị enumeration trong `ScholarshipSearchFilters`
+(services/chatbot_thread2/config.py) - khi thêm giá trị mới ở đó thì thêm ở đây.
+
+Không cần bỏ dấu: rule được ES phân tích qua lowercase + asciifolding giống query.
+Vì vậy trong bảng chung (`synonym_rules`, analyzer `en_search` trên mọi field và
+`__text`) biến thể tiếng Việt phải là cụm nhiều từ ("nước ý", "hàn quốc", "vương
+quốc anh"): một từ đơn sau khi bỏ dấu thường trùng từ thông dụng hoặc tên người
+("ý" -> "y", "áo" -> "ao", "anh", "đức", "quỹ" -> "quy" như "quy hoạch").
+
+Tên nước một từ ("Đức", "Mỹ", "Nhật"...) chỉ có trong `country_synonym_rules`,
+dùng cho analyzer `country_search` của field `Country`: ở đó giá trị là tên
+nước nên từ đơn không còn mơ hồ.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# Country: các nước xuất hiện trong dữ liệu (kể cả tên viết tắt UK/USA/UAE)
+COUNTRY_SYNONYMS: Dict[str, List[str]] = {
+    "UK": ["united kingdom", "england", "nước anh", "anh quốc", "vương quốc anh"],
+    "USA": ["united states", "america", "nước mỹ", "hoa kỳ"],
+    "Canada": ["ca na đa", "ca-na-đa"],
+    "Australia": ["nước úc"],
+    "Germany": ["nước đức", "cộng hòa liên bang đức"],
+    "Netherlands": ["holland", "hà lan"],
+    "China": ["trung quốc"],
+    "Switzerland": ["thụy sĩ", "thụy sỹ"],
+    "Italy": ["nước ý", "italia"],
+    "France": ["nước pháp"],
+    "Japan": ["nước nhật", "nhật bản"],
+    "Singapore": ["xinh ga po", "xin-ga-po"],
+    "Belgium": ["nước bỉ", "vương quốc bỉ"],
+    "Sweden": ["thụy điển"],
+    "Ireland": ["ai len", "ai-len"],
+    "Hong Kong": ["hồng kông"],
+    "Thailand": ["thái lan"],
+    "South Africa": ["nam phi"],
+    "Malaysia": ["ma lai xi a", "mã lai"],
+    "South Korea": ["korea", "hàn quốc", "nam hàn"],
+    "Hungary": ["hung ga ri", "hungari"],
+    "Indonesia": ["in đô nê xi a"],
+    "Saudi Arabia": ["ả rập xê út", "saudi"],
+    "Spain": ["tây ban nha"],
+    "India": ["ấn độ"],
+    "Türkiye": ["turkey", "thổ nhĩ kỳ"],
+    "Russia": ["nước nga", "liên bang nga"],
+    "Czech Republic": ["czechia", "nước séc", "cộng hòa séc"],
+    "Norway": ["na uy"],
+    "Finland": ["phần lan"],
+    "New Zealand": ["niu di lân", "tân tây lan"],
+    "Taiwan": ["đài loan"],
+    "Austria": ["nước áo", "cộng hòa áo"],
+    "Portugal": ["bồ đào nha"],
+    "Poland": ["ba lan"],
+    "Denmark": ["đan mạch"],
+    "Egypt": ["ai cập"],
+    "United Arab Emirates": ["uae", "các tiểu vương quốc ả rập thống nhất"],
+    "Philippines": ["phi líp pin", "philippin"],
+    "Vietnam": ["việt nam"],
+    "Brazil": ["braxin"],
+    "Mexico": ["mê hi cô"],
+    "Europe": ["châu âu"],
+    "Asia": ["châu á"],
+    "Africa": ["châu phi"],
+    "Latin America": ["mỹ latinh", "mỹ la tinh"],
+}
+
+# Tên nước một từ: chỉ dùng trên field `Country` (xem docstring module)
+COUNTRY_SHORT_NAMES: Dict[str, List[str]] = {
+    "UK": ["anh"],
+    "USA": ["mỹ"],
+    "Australia": ["úc"],
+    "Germany": ["đức"],
+    "Italy": ["ý"],
+    "France": ["pháp"],
+    "Japan": ["nhật"],
+    "Belgium": ["bỉ"],
+    "South Korea": ["hàn"],
+    "Russia": ["nga"],
+    "Czech Republic": ["séc"],
+    "Austria": ["áo"],
+}
+
+# Wanted_Degree / Required_Degree
+DEGREE_SYNONYMS: Dict[str, List[str]] = {
+    "High School Diploma": ["tốt nghiệp thpt", "trung học phổ thông", "cấp 3", "cấp ba"],
+    "Bachelor": ["bachelor's", "undergraduate", "cử nhân"],
+    "Master": ["master's", "postgraduate", "thạc sĩ", "thạc sỹ", "cao học"],
+    "PhD": ["doctorate", "doctoral", "tiến sĩ", "tiến sỹ", "nghiên cứu sinh"],
+}
+
+# Funding_Level
+FUNDING_LEVEL_SYNONYMS: Dict[str, List[str]] = {
+    "Full scholarship": ["fully funded", "toàn phần", "học bổng toàn phần"],
+    "Tuition Waiver": ["tuition fee waiver", "miễn học phí", "miễn giảm học phí"],
+    "Stipend": ["living allowance", "trợ cấp", "sinh hoạt phí", "phụ cấp"],
+    "Accommodation": ["housing", "chỗ ở", "nhà ở", "ký túc xá"],
+    "Partial Funding": ["partial scholarship", "bán phần", "học bổng bán phần", "một phần"],
+    "Fixed Amount": ["số tiền cố định"],
+    "Other Costs": ["chi phí khác"],
+}
+
+# Scholarship_Type
+SCHOLARSHIP_TYPE_SYNONYMS: Dict[str, List[str]] = {
+    "Government": ["chính phủ", "nhà nước"],
+    "University": ["trường đại học"],
+    "Organization/Foundation": ["tổ chức", "quỹ học bổng"],
+}
+
+# Eligible_Field_Group: mỗi nhóm ghép từ nhiều khái niệm ("Economics & Business"),
+# nên tách thành từng bộ đồng nghĩa riêng để "kinh tế" khớp cả tài liệu chỉ ghi "economics".
+FIELD_GROUP_SYNONYMS: Dict[str, List[List[str]]] = {
+    "Education & Training": [["education", "giáo dục", "sư phạm"], ["training", "đào tạo"]],
+    "Arts, Design & Media": [
+        ["arts", "nghệ thuật", "mỹ thuật"],
+        ["design", "thiết kế"],
+        ["media", "truyền thông", "báo chí"],
+    ],
+    "Humanities & Social Sciences": [
+        ["humanities", "nhân văn"],
+        ["social sciences", "khoa học xã hội", "xã hội học"],
+    ],
+    "Economics & Business": [
+        ["economics", "kinh tế"],
+        ["business", "kinh doanh", "quản trị kinh doanh"],
+        ["finance", "tài chính"],
+    ],
+    "Law & Public Policy": [["law", "luật", "pháp luật"], ["public policy", "chính sách công"]],
+    "Natural Sciences": [["natural sciences", "khoa học tự nhiên"]],
+    "IT & Data Science": [
+        ["information technology", "công nghệ thông tin", "cntt", "tin học"],
+        ["data science", "khoa học dữ liệu"],
+        ["computer science", "khoa học máy tính"],
+    ],
+    "Engineering & Technology": [["engineering", "kỹ thuật", "kĩ thuật"], ["technology", "công nghệ"]],
+    "Construction & Planning": [
+        ["construction", "xây dựng"],
+        ["planning", "quy hoạch"],
+        ["architecture", "kiến trúc"],
+    ],
+    "Agriculture & Environment": [["agriculture", "nông nghiệp"], ["environment", "môi trường"]],
+    "Healthcare & Medicine": [
+        ["healthcare", "chăm sóc sức khỏe", "y tế"],
+        ["medicine", "y khoa", "y học", "y dược"],
+        ["nursing", "điều dưỡng"],
+        ["pharmacy", "dược học", "ngành dược"],
+    ],
+    "Social Services & Care": [["social work", "social services", "công tác xã hội"], ["care", "chăm sóc"]],
+    "Personal Services & Tourism": [["tourism", "du lịch"], ["hospitality", "khách sạn", "nhà hàng khách sạn"]],
+    "Security & Defense": [["security", "an ninh"], ["defense", "quốc phòng"]],
+    "Library & Information Management": [
+        ["library", "thư viện"],
+        ["information management", "quản lý thông tin"],
+    ],
+    "Transportation & Logistics": [["transportation", "giao thông", "vận tải"], ["logistics", "hậu cần"]],
+    "All fields": [["all fields", "tất cả các ngành", "tất cả ngành", "mọi ngành"]],
+}
+
+
+def synonym_rules() -> List[str]:
+    """Rule dạng Solr (`a, b, c` = tương đương hai chiều) cho filter `synonym_graph`."""
+    rules: List[str] = []
+    for table in (COUNTRY_SYNONYMS, DEGREE_SYNONYMS, FUNDING_LEVEL_SYNONYMS, SCHOLARSHIP_TYPE_SYNONYMS):
+        for canonical, variants in table.items():
+            rules.append(", ".join([canonical.lower()] + variants))
+    for groups in FIELD_GROUP_SYNONYMS.values():
+        for terms in groups:
+            rules.append(", ".join(terms))
+    return rules
+
+
+def country_synonym_rules() -> List[str]:
+    """Rule cho analyzer `country_search`: bảng `COUNTRY_SYNONYMS` kèm tên nước một từ."""
+    return [
+        ", ".join([canonical.lower()] + variants + COUNTRY_SHORT_NAMES.get(canonical, []))
+        for canonical, variants in COUNTRY_SYNONYMS.items()
+    ]
+
+
+# ============================================================================
+# Mở rộng đồng nghĩa phía Python (search dự phòng, test): cùng cách ES phân tích
+# rule (lowercase + asciifolding, so khớp theo cụm token liên tiếp)
+# ============================================================================
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Lowercase + bỏ dấu (kể cả "đ"), giống `asciifolding`."""
+    text = unicodedata.normalize("NFKD", str(text).replace("đ", "d").replace("Đ", "D"))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def fold_tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def synonym_groups(rules: Optional[List[str]] = None) -> List[List[Tuple[str, ...]]]:
+    """Mỗi rule (mặc định `synonym_rules()`) dưới dạng danh sách cụm token đã bỏ dấu."""
+    groups = []
+    for rule in synonym_rules() if rules is None else rules:
+        members = [tuple(fold_tokens(term)) for term in rule.split(",")]
+        groups.append([m for m in members if m])
+    return groups
+
+
+_GROUPS = synonym_groups()
+_COUNTRY_GROUPS = synonym_groups(country_synonym_rules())
+
+
+def _contains(tokens: Tuple[str, ...], phrase: Tuple[str, ...]) -> bool:
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+
+def expand_phrase(tokens: Tuple[str, ...], *, country: bool = False) -> List[Tuple[str, ...]]:
+    """
+    `tokens` và các cách viết đồng nghĩa (thay cụm khớp rule bằng các cụm cùng
+    nhóm). `country=True`: dùng bảng của analyzer `country_search`.
+    """
+    alternatives = [tokens]
+    for group in _COUNTRY_GROUPS if country else _GROUPS:
+        # Cụm dài nhất khớp trước (như synonym_graph): "học bổng toàn phần" trước "toàn phần"
+        for member in sorted(group, key=len, reverse=True):
+            if _contains(tokens, member):
+                joined = " ".join(tokens)
+                for other in group:
+                    if other != member:
+                        alternatives.append(tuple(joined.replace(" ".join(member), " ".join(other)).split()))
+                break
+    return alternatives
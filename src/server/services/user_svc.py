@@ -1,9 +1,19 @@
 # services/user_svc.py
-from typing import Any, Dict, List, Optional
-from elasticsearch import Elasticsearch
+from typing import Any, Dict, List
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 from dtos.user_dtos import UserProfile
 from dtos.search_dtos import FilterItem
-from services.es_svc import filter_advanced
+from services.es_svc import rank_by_profile, rank_by_profile_async
+
+# Trọng số của từng tiêu chí khi xếp hạng (điểm = tổng trọng số các tiêu chí khớp,
+# cộng GPA / kinh nghiệm / hạn nộp - xem `es_svc._build_profile_query`)
+PROFILE_CRITERIA_WEIGHTS: Dict[str, float] = {
+    "Eligible_Fields": 3.0,
+    "Country": 3.0,
+    "Funding_Level": 2.0,
+    "Scholarship_Type": 1.0,
+    "Application_Mode": 1.0,
+}
 
 def map_profile_to_filters(user_profile: UserProfile) -> List[FilterItem]:
     """
@@ -37,17 +47,19 @@ def map_profile_to_filters(user_profile: UserProfile) -> List[FilterItem]:
     elif user_profile.field_of_study: # Chỉ dùng field_of_study từ CV nếu không có desired_field_of_study
         filters.append(FilterItem(field="Eligible_Fields", values=[user_profile.field_of_study], operator="OR"))
     
-    # === Các tiêu chí có thể là "mềm" hoặc thêm vào sau ===
-    # Ví dụ, nếu bạn có trường Years_of_Experience trong học bổng
-    # if user_profile.years_of_experience is not None and user_profile.years_of_experience > 0:
-    #     filters.append(FilterItem(field="Min_Experience", values=[str(user_profile.years_of_experience)], operator="AND"))
-    # (Đây chỉ là ví dụ, cần mapping cẩn thận với trường trong ES)
+    # === Các tiêu chí "mềm" ===
+    # GPA (`gpa_range_4`) và `years_of_experience` không lọc mà chỉ cộng điểm khi xếp hạng,
+    # so với field chuẩn hóa `min_gpa` / `experience_years` (xem `es_svc._build_profile_query`)
 
     return filters
 
-# services/user_svc.py
+def map_profile_to_criteria(user_profile: UserProfile) -> List[Dict[str, Any]]:
+    """Các filter từ `map_profile_to_filters` kèm trọng số xếp hạng."""
+    return [
+        {**f.model_dump(), "weight": PROFILE_CRITERIA_WEIGHTS.get(f.field, 1.0)}
+        for f in map_profile_to_filters(user_profile)
+    ]
 
-# ... (các import và hàm map_profile_to_filters giữ nguyên) ...
 
 def find_matching_scholarships_for_profile(
     client: Elasticsearch,
@@ -58,30 +70,49 @@ def find_matching_scholarships_for_profile(
     offset: int = 0,
 ) -> Dict[str, Any]:
     """
-    Tìm kiếm học bổng phù hợp dựa trên profile người dùng,
-    sử dụng logic "OR" để truy xuất một danh sách rộng các ứng viên tiềm năng
-    cho giai đoạn AI Re-ranking sau này.
+    Tìm kiếm học bổng phù hợp dựa trên profile người dùng. Học bổng khớp ít nhất
+    một tiêu chí được trả về, xếp hạng ngay trong ES theo trọng số từng tiêu chí,
+    độ phù hợp GPA / kinh nghiệm và hạn nộp gần - không cần re-rank phía sau.
     """
-    filters = map_profile_to_filters(user_profile)
+    criteria = map_profile_to_criteria(user_profile)
 
-    if not filters:
-        # Nếu không có tiêu chí nào từ profile, trả về rỗng hoặc một thông báo
+    if not criteria:
+        # Nếu không có tiêu chí nào từ profile, trả về rỗng
         return {"total": 0, "items": []}
-    
-    filters_dict = [f.model_dump() for f in filters]
 
-    # --- Luôn sử dụng logic "OR" để đảm bảo một danh sách kết quả đa dạng ---
-    # Điều này tạo tiền đề tốt cho AI Re-ranking sau này.
-    results = filter_advanced(
-        client=client,
+    return rank_by_profile(
+        client,
         index=index,
         collection=collection,
-        filters=filters_dict,
-        inter_field_operator="OR",
+        criteria=criteria,
+        gpa=user_profile.gpa_range_4,
+        years_of_experience=user_profile.years_of_experience,
         size=size,
         offset=offset,
     )
 
-    # Trong tương lai, đây sẽ là nơi bạn đưa 'results["items"]' vào AI Re-ranking
-    # For now, we return the ES results directly
-    return results
\ No newline at end of file
+
+async def find_matching_scholarships_for_profile_async(
+    client: AsyncElasticsearch,
+    user_profile: UserProfile,
+    index: str,
+    collection: str,
+    size: int = 10,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """Phiên bản asyncio của `find_matching_scholarships_for_profile`."""
+    criteria = map_profile_to_criteria(user_profile)
+
+    if not criteria:
+        return {"total": 0, "items": []}
+
+    return await rank_by_profile_async(
+        client,
+        index=index,
+        collection=collection,
+        criteria=criteria,
+        gpa=user_profile.gpa_range_4,
+        years_of_experience=user_profile.years_of_experience,
+        size=size,
+        offset=offset,
+    )
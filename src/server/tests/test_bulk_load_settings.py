@@ -0,0 +1,70 @@
+"""
+`bulk_load_settings`: luôn trả index về settings đọc được (không bao giờ để lại
+refresh -1 / replica 0 / translog async), kể cả khi job resume sau crash.
+"""
+import pytest
+
+from services.es_svc import _BULK_LOAD_SETTINGS, _DEFAULT_LOAD_SETTINGS, bulk_load_settings
+
+
+class FakeIndices:
+    def __init__(self, settings):
+        self.settings = dict(settings)
+        self.refreshed = 0
+
+    def get_settings(self, index, flat_settings=True):
+        return {"scholarships_v2": {"settings": dict(self.settings)}}
+
+    def put_settings(self, index, settings):
+        for key, value in settings.items():
+            if value is None:
+                self.settings.pop(key, None)
+            else:
+                self.settings[key] = value
+
+    def refresh(self, index):
+        self.refreshed += 1
+
+
+class FakeClient:
+    def __init__(self, settings=None):
+        self.indices = FakeIndices(settings or {})
+
+
+def test_restores_original_settings():
+    client = FakeClient({"index.refresh_interval": "30s", "index.number_of_replicas": "2"})
+    with bulk_load_settings(client, "scholarships_v2"):
+        assert client.indices.settings["index.refresh_interval"] == "-1"
+    assert client.indices.settings == {"index.refresh_interval": "30s", "index.number_of_replicas": "2"}
+    assert client.indices.refreshed == 1
+
+
+def test_restores_even_when_body_fails():
+    client = FakeClient()
+    with pytest.raises(RuntimeError):
+        with bulk_load_settings(client, "scholarships_v2"):
+            raise RuntimeError("bulk failed")
+    # Setting chưa từng đặt -> xóa, ES dùng giá trị mặc định
+    assert client.indices.settings == {}
+
+
+def test_resume_after_crash_does_not_keep_bulk_settings():
+    # Job trước chết giữa chừng: index còn nguyên settings bulk
+    client = FakeClient(_BULK_LOAD_SETTINGS)
+    with bulk_load_settings(client, "scholarships_v2"):
+        pass
+    with bulk_load_settings(client, "scholarships_v2"):
+        pass
+    settings = client.indices.settings
+    assert "index.refresh_interval" not in settings
+    assert settings["index.number_of_replicas"] == _DEFAULT_LOAD_SETTINGS["index.number_of_replicas"]
+    assert settings["index.translog.durability"] == "request"
+
+
+def test_nested_entry_restores_defaults():
+    client = FakeClient()
+    with bulk_load_settings(client, "scholarships_v2"):
+        with bulk_load_settings(client, "scholarships_v2"):
+            pass
+    for key, bulk in _BULK_LOAD_SETTINGS.items():
+        assert client.indices.settings.get(key) != bulk
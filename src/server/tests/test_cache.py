@@ -0,0 +1,51 @@
+"""
+Cache kết quả search: bản sao khi đọc, invalidation theo generation trong
+process và theo phiên bản catalog dùng chung giữa các worker.
+"""
+import itertools
+
+from services import cache_svc
+from services.cache_svc import _poll_versions, bump_generation, cached
+
+
+def counting_compute():
+    counter = itertools.count(1)
+    return lambda: {"total": next(counter), "items": []}
+
+
+def test_hit_returns_copy():
+    compute = counting_compute()
+    first = cached("search", "test_copy", {"q": "x"}, compute)
+    first["items"].append("mutated")
+    second = cached("search", "test_copy", {"q": "x"}, compute)
+    assert second == {"total": 1, "items": []}
+
+
+def test_bump_generation_invalidates():
+    compute = counting_compute()
+    assert cached("search", "test_bump", {"q": "x"}, compute)["total"] == 1
+    assert cached("search", "test_bump", {"q": "x"}, compute)["total"] == 1
+    bump_generation("test_bump")
+    assert cached("search", "test_bump", {"q": "x"}, compute)["total"] == 2
+
+
+def test_shared_catalog_version_invalidates():
+    versions = {"test_shared": "test_shared_v1@-"}
+    compute = counting_compute()
+    _poll_versions(versions.get, ["test_shared"])
+    assert cached("filter", "test_shared", {"f": 1}, compute)["total"] == 1
+
+    # Worker khác sync: generation trong process không đổi, phiên bản catalog đổi
+    versions["test_shared"] = "test_shared_v1@2026-10-17T00:00:00"
+    _poll_versions(versions.get, ["test_shared"])
+    assert cached("filter", "test_shared", {"f": 1}, compute)["total"] == 2
+    assert cached("filter", "test_shared", {"f": 1}, compute)["total"] == 2
+
+
+def test_failed_version_read_keeps_last_version():
+    def broken(collection):
+        raise RuntimeError("firestore down")
+
+    _poll_versions(lambda c: "v1", ["test_broken"])
+    _poll_versions(broken, ["test_broken"])
+    assert cache_svc._shared_versions["test_broken"] == "v1"
@@ -0,0 +1,82 @@
+"""
+`CollectionChangeFeed`: flush theo từng đoạn `batch_size`, giữ watermark khi
+còn thay đổi chưa áp dụng, snapshot đầu bỏ qua doc đã sync.
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services import sync_svc
+from services.sync_svc import CollectionChangeFeed
+
+T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    calls, saved = [], []
+
+    def apply_changes(client, *, index, upserts, deletes, **kwargs):
+        calls.append((sorted(upserts), sorted(deletes)))
+        if feed.fail_on == len(calls):
+            raise ConnectionError("es down")
+        return {"success": len(upserts) + len(deletes), "failed": 0, "failed_ids": [], "errors": []}
+
+    monkeypatch.setattr(sync_svc, "apply_changes", apply_changes)
+    monkeypatch.setattr(sync_svc, "save_watermark", lambda db, collection, wm: saved.append(wm))
+    monkeypatch.setattr(sync_svc, "_wait_for_write_capacity", lambda client: None)
+    monkeypatch.setattr(sync_svc, "get_embedder", lambda: None)
+
+    feed = CollectionChangeFeed(None, None, "test_feed", batch_size=2)
+    feed.calls, feed.saved, feed.fail_on = calls, saved, None
+    return feed
+
+
+def queue(feed, upserts, deletes=(), read_time=T0):
+    feed._upserts = {doc_id: {"id": doc_id} for doc_id in upserts}
+    feed._deletes = set(deletes)
+    feed._pending_read_time = read_time
+
+
+def test_flush_is_chunked_by_batch_size(feed):
+    queue(feed, ["a", "b", "c", "d", "e"], deletes=["z"])
+    feed._flush()
+    assert feed.calls == [(["a", "b"], ["z"]), (["c", "d"], []), (["e"], [])]
+    assert feed.saved == [T0]
+    assert not feed._upserts and not feed._deletes
+
+
+def test_failed_chunk_is_requeued_and_watermark_held(feed):
+    feed.fail_on = 2
+    queue(feed, ["a", "b", "c", "d", "e"], deletes=["z"])
+    feed._flush()
+    assert sorted(feed._upserts) == ["c", "d", "e"]
+    assert feed._deletes == set()
+    assert feed.saved == []
+
+
+def test_failed_first_chunk_requeues_deletes(feed):
+    feed.fail_on = 1
+    queue(feed, ["a"], deletes=["z"])
+    feed._flush()
+    assert sorted(feed._upserts) == ["a"] and feed._deletes == {"z"}
+    assert feed.saved == []
+
+
+def change(doc_id, updated, kind="ADDED"):
+    doc = SimpleNamespace(id=doc_id, update_time=updated, to_dict=lambda: {"name": doc_id})
+    return SimpleNamespace(document=doc, type=SimpleNamespace(name=kind))
+
+
+def test_initial_snapshot_skips_docs_already_synced(feed, monkeypatch):
+    monkeypatch.setattr(feed, "_reconcile_deletes", lambda ids: None)
+    feed.watermark = T0
+    old, new = change("old", T0 - timedelta(hours=1)), change("new", T0 + timedelta(minutes=1))
+    feed._on_snapshot([old.document, new.document], [old, new], T0 + timedelta(minutes=2))
+    assert list(feed._upserts) == ["new"]
+
+    # Snapshot sau: mọi thay đổi đều được áp dụng
+    again = change("old", T0 - timedelta(hours=1), kind="MODIFIED")
+    feed._on_snapshot([], [again], T0 + timedelta(minutes=3))
+    assert sorted(feed._upserts) == ["new", "old"]
@@ -0,0 +1,68 @@
+"""
+Cursor pagination: token opaque (PIT + search_after) và vòng đời PIT.
+"""
+import pytest
+
+from services.es_svc import _cursor_sort, _cursor_state, _decode_cursor, _encode_cursor, _run_search
+
+DOCS = [{"_id": f"d{i}", "_score": 1.0, "sort": [1.0, i]} for i in range(5)]
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def open_point_in_time(self, *, index, keep_alive):
+        self.calls.append(("open", index))
+        return {"id": "pit-1"}
+
+    def close_point_in_time(self, *, id):
+        self.calls.append(("close", id))
+
+    def search(self, *, size, search_after=None, **kwargs):
+        self.calls.append(("search", search_after, kwargs.get("pit"), kwargs.get("sort")))
+        start = 0 if search_after is None else search_after[1] + 1
+        hits = DOCS[start:start + size]
+        return {"pit_id": "pit-2", "hits": {"total": {"value": len(DOCS), "relation": "eq"}, "hits": hits}}
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor("pit-1", [1.5, 7], {"phase": "fuzzy"})
+    assert _decode_cursor(cursor) == ("pit-1", [1.5, 7])
+    assert _cursor_state(cursor) == {"phase": "fuzzy"}
+    assert _decode_cursor("*") == (None, None) and _cursor_state("*") == {}
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "e30="])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        _decode_cursor(cursor)
+
+
+def test_cursor_sort_adds_shard_doc_tiebreak():
+    assert _cursor_sort(None)[-1] == {"_shard_doc": {"order": "asc"}}
+    assert _cursor_sort([{"end_date": {"order": "asc"}}]) == [
+        {"end_date": {"order": "asc"}}, {"_shard_doc": {"order": "asc"}},
+    ]
+
+
+def test_pages_follow_pit_and_close_on_last_page():
+    client, cursor, seen = FakeClient(), "*", []
+    while cursor:
+        page = _run_search(client, index="scholarships", size=2, offset=0, cursor=cursor, query={"match_all": {}})
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+
+    assert seen == ["d0", "d1", "d2", "d3", "d4"]
+    assert client.calls[0] == ("open", "scholarships")
+    # Trang sau dùng PIT id mới nhất ES trả về và sort values của hit cuối
+    assert client.calls[2][1:3] == ([1.0, 1], {"id": "pit-2", "keep_alive": "2m"})
+    assert client.calls[-1] == ("close", "pit-2")
+    assert sum(call[0] == "open" for call in client.calls) == 1
+
+
+def test_offset_paging_without_cursor():
+    client = FakeClient()
+    page = _run_search(client, index="scholarships", size=2, offset=0, cursor=None)
+    assert "next_cursor" not in page and page["total"] == 5
+    assert [call[0] for call in client.calls] == ["search"]
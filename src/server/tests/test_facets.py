@@ -0,0 +1,47 @@
+"""
+Facet counts: filter đang chọn ở `post_filter`, mỗi facet đếm trên filter của các field khác.
+"""
+import pytest
+
+from services.es_svc import _build_facets_body, _to_facets_result
+
+FILTERS = [
+    {"field": "Country", "values": ["Germany"], "operator": "OR"},
+    {"field": "Wanted_Degree", "values": ["PhD"], "operator": "OR"},
+]
+
+
+def test_disjunctive_facet_filters():
+    body = _build_facets_body(FILTERS, "scholarships", "AND", ["Country", "Funding_Level"], 5)
+    assert body["size"] == 0 and body["query"] == {"term": {"collection": "scholarships"}}
+
+    # Facet Country bỏ filter Country của chính nó, Funding_Level giữ cả hai
+    country = body["aggs"]["Country"]
+    assert len(country["filter"]["bool"]["filter"]) == 1
+    assert "Wanted_Degree" in str(country["filter"]) and "Germany" not in str(country["filter"])
+    assert country["aggs"]["values"]["terms"] == {"field": "Country.raw", "size": 5}
+    assert len(body["aggs"]["Funding_Level"]["filter"]["bool"]["filter"]) == 2
+    assert len(body["post_filter"]["bool"]["filter"]) == 2
+
+
+def test_no_filters_counts_everything():
+    body = _build_facets_body([], None, "AND", ["Country"], 10)
+    assert body["query"] == {"match_all": {}}
+    assert body["aggs"]["Country"]["filter"] == {"match_all": {}}
+    assert "post_filter" not in body
+
+
+def test_unknown_facet_rejected():
+    with pytest.raises(ValueError, match="Unsupported facet fields"):
+        _build_facets_body([], None, "AND", ["Min_Gpa"], 10)
+
+
+def test_facet_result_shape():
+    res = {
+        "hits": {"total": {"value": 7}},
+        "aggregations": {"Country": {"doc_count": 7, "values": {"buckets": [{"key": "Germany", "doc_count": 4}]}}},
+    }
+    assert _to_facets_result(res, ["Country", "Funding_Level"]) == {
+        "total": 7,
+        "facets": {"Country": [{"value": "Germany", "count": 4}], "Funding_Level": []},
+    }
@@ -0,0 +1,139 @@
+"""
+Search dự phòng: BM25 / filter trên snapshot, circuit breaker, cursor cục bộ
+và thay đổi từ change feed.
+"""
+import asyncio
+import time
+
+import pytest
+from elasticsearch import ConnectionError as ESConnectionError
+
+from services import fallback_svc
+from services.fallback_svc import CatalogSnapshot, CircuitBreaker, FallbackEngine, call_with_fallback
+
+DOCS = [
+    {
+        "id": "a", "Scholarship_Name": "Chevening Scholarship", "Country": "United Kingdom",
+        "Wanted_Degree": "Master", "Funding_Level": "Fully Funded", "Eligible_Fields": "Computer Science, Engineering",
+        "End_Date": "2099-01-01", "Min_Gpa": "3.0",
+    },
+    {
+        "id": "b", "Scholarship_Name": "DAAD Study Scholarship", "Country": "Germany",
+        "Wanted_Degree": "PhD", "Funding_Level": "Partial", "Eligible_Fields": "Medicine",
+        "End_Date": "2001-01-01", "Min_Gpa": "3.5",
+    },
+    {
+        "id": "c", "Scholarship_Name": "Fulbright", "Country": "USA",
+        "Wanted_Degree": "Master, PhD", "Funding_Level": "Fully Funded", "Eligible_Fields": "Engineering",
+        "End_Date": "2098-05-01",
+    },
+]
+
+
+@pytest.fixture
+def snapshot():
+    return CatalogSnapshot("scholarships", DOCS, "-", time.time())
+
+
+def ids(snapshot, ranked):
+    return [snapshot.ids[pos] for pos, _ in ranked]
+
+
+def test_search_ranks_name_match_first(snapshot):
+    assert ids(snapshot, snapshot.search("chevening"))[0] == "a"
+
+
+def test_search_expands_vietnamese_country(snapshot):
+    assert ids(snapshot, snapshot.search("học bổng Đức")) == ["b"]
+
+
+def test_search_open_only_mask(snapshot):
+    assert sorted(ids(snapshot, snapshot.search("engineering", snapshot.open_bitmap()))) == ["a", "c"]
+
+
+def test_filter_semantics(snapshot):
+    def filtered(filters, **kwargs):
+        return [snapshot.ids[p] for p in snapshot.positions(snapshot.filter_mask(filters, **kwargs))]
+
+    assert filtered([{"field": "Country", "values": ["Hà Lan", "Đức"], "operator": "OR"}]) == ["b"]
+    assert filtered([
+        {"field": "Wanted_Degree", "values": ["master"], "operator": "OR"},
+        {"field": "Min_Gpa", "values": [3.2], "operator": "lte"},
+    ]) == ["a"]
+    assert filtered([{"field": "End_Date", "values": ["2050-01-01", "2099-12-31"], "operator": "range"}]) == ["a", "c"]
+    assert filtered(
+        [{"field": "Country", "values": ["USA"], "operator": "OR"}, {"field": "Country", "values": ["Germany"]}],
+        inter_field_operator="OR",
+    ) == ["b", "c"]
+    with pytest.raises(ValueError):
+        filtered([{"field": "End_Date", "values": ["2050-01-01"], "operator": "range"}])
+
+
+def test_local_cursor_pages_through_results(snapshot):
+    ranked = [(pos, None) for pos in range(snapshot.size)]
+    first = snapshot.result(ranked, 2, 0, None, cursor="*")
+    assert [item["id"] for item in first["items"]] == ["a", "b"]
+    second = snapshot.result(ranked, 2, 0, None, cursor=first["next_cursor"])
+    assert [item["id"] for item in second["items"]] == ["c"]
+    assert second["next_cursor"] is None
+
+
+def test_es_cursor_is_rejected_in_degraded_mode(snapshot):
+    from services.es_svc import _encode_cursor
+
+    with pytest.raises(ValueError, match="degraded mode"):
+        snapshot.result([(0, None)], 2, 0, None, cursor=_encode_cursor("pit-id", [1.0, 3]))
+
+
+def test_change_feed_deltas_update_snapshot(snapshot):
+    engine = FallbackEngine(collections=["scholarships"])
+    engine._snapshots["scholarships"] = snapshot
+    engine.on_changes("scholarships", {"d": {"id": "d", "Scholarship_Name": "MEXT", "Country": "Japan"}}, {"b"})
+    engine.on_changes("other", {"x": {"id": "x"}}, set())
+    engine._apply_pending("scholarships")
+
+    updated = engine.snapshot("scholarships")
+    assert sorted(updated.ids) == ["a", "c", "d"]
+    assert updated.version == snapshot.version and updated.built_at == snapshot.built_at
+    assert ids(updated, updated.search("MEXT")) == ["d"]
+    assert "other" not in engine._pending
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure("timeout")
+    assert breaker.allow() and breaker.state == "closed"
+    breaker.record_failure("timeout")
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # chỉ một request thử
+    breaker.record_failure("timeout")
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_call_with_fallback_serves_snapshot_on_es_failure(monkeypatch, snapshot):
+    engine = FallbackEngine(collections=["scholarships"])
+    engine._snapshots["scholarships"] = snapshot
+    engine.breaker = CircuitBreaker(failure_threshold=5, cooldown=30)
+    monkeypatch.setattr(fallback_svc, "_engine", engine)
+
+    async def down():
+        raise ESConnectionError("down")
+
+    def local():
+        return engine.search("scholarships", "fulbright")
+
+    result = asyncio.run(call_with_fallback("search", "scholarships", down, local))
+    assert result["degraded"] is True and result["items"][0]["id"] == "c"
+    assert engine.breaker.failures == 1
+
+    # Collection không có snapshot: trả lại lỗi gốc
+    with pytest.raises(ESConnectionError):
+        asyncio.run(call_with_fallback("search", "users", down, lambda: engine.search("users", "x")))
@@ -0,0 +1,97 @@
+"""
+`_build_filter_query` và chuẩn hóa field số / ngày cho range filter.
+"""
+import pytest
+
+from services.es_svc import _build_filter_query, _normalize_fields, _parse_date, _parse_number, _prepare_source
+
+
+def test_empty_filters_without_collection():
+    assert _build_filter_query([]) is None
+
+
+def test_and_filters_with_collection():
+    query = _build_filter_query(
+        [
+            {"field": "Country", "values": ["Germany", "Japan"], "operator": "OR"},
+            {"field": "Funding_Level", "values": ["Full scholarship"], "operator": "AND"},
+            {"field": "Scholarship_Name", "values": ["Chevening"]},
+        ],
+        "scholarships",
+    )
+    assert query == {"bool": {"filter": [
+        {"bool": {"should": [
+            {"match": {"Country": {"query": "Germany", "operator": "and"}}},
+            {"match": {"Country": {"query": "Japan", "operator": "and"}}},
+        ], "minimum_should_match": 1}},
+        {"match_phrase": {"Funding_Level": "Full scholarship"}},
+        {"term": {"Scholarship_Name.raw": "Chevening"}},
+        {"term": {"collection": "scholarships"}},
+    ]}}
+
+
+def test_or_between_fields_keeps_collection_as_filter():
+    query = _build_filter_query(
+        [{"field": "Country", "values": ["Germany"]}, {"field": "Wanted_Degree", "values": ["PhD"]}],
+        "scholarships",
+        inter_field_operator="OR",
+    )
+    assert len(query["bool"]["should"]) == 2 and query["bool"]["minimum_should_match"] == 1
+    assert query["bool"]["filter"] == [{"term": {"collection": "scholarships"}}]
+
+
+def test_range_operators_target_normalized_fields():
+    query = _build_filter_query([
+        {"field": "Min_Gpa", "values": [3.2], "operator": "lte"},
+        {"field": "Experience_Years", "values": [1], "operator": "gte"},
+        {"field": "End_Date", "values": ["2026-01-01", "2026-12-31"], "operator": "range"},
+    ])
+    assert query["bool"]["filter"] == [
+        {"range": {"min_gpa": {"lte": 3.2}}},
+        {"range": {"experience_years": {"gte": 1}}},
+        {"range": {"end_date": {"gte": "2026-01-01", "lte": "2026-12-31"}}},
+    ]
+
+
+@pytest.mark.parametrize("filters", [
+    [{"field": "End_Date", "values": ["2026-01-01"], "operator": "range"}],
+    [{"field": "Min_Gpa", "values": [3, 4], "operator": "gte"}],
+])
+def test_range_operators_check_value_count(filters):
+    with pytest.raises(ValueError):
+        _build_filter_query(filters)
+
+
+def test_open_only_alone_is_a_condition():
+    assert _build_filter_query([], open_only=True) == {"bool": {"filter": [{"range": {"end_date": {"gte": "now/d"}}}]}}
+
+
+@pytest.mark.parametrize("value, upper, expected", [
+    ("~GPA 3.5", 10, 3.5),
+    ("3,2/4", 10, 3.2),
+    (2, 50, 2.0),
+    ("Not stated", 10, None),
+    (True, 10, None),
+    ("95", 10, None),
+])
+def test_parse_number(value, upper, expected):
+    assert _parse_number(value, upper=upper) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2025-06-01", "2025-06-01T00:00:00"),
+    ("June 1st, 2025", "2025-06-01"),
+    ("Deadline: 15 Mar 2026", "2026-03-15"),
+    ("31/12/2025", "2025-12-31"),
+    ("rolling", None),
+])
+def test_parse_date(value, expected):
+    assert _parse_date(value) == expected
+
+
+def test_prepare_source_recomputes_normalized_fields():
+    doc = {"id": "a", "Min_Gpa": "2.5 GPA", "Experience_Years": "1.5 years", "End_Date": "June 1, 2025",
+           "min_gpa": 9.9, "__text": "stale"}
+    src = _prepare_source(doc, "scholarships")
+    assert _normalize_fields(doc) == {"min_gpa": 2.5, "experience_years": 2, "end_date": "2025-06-01"}
+    assert src["min_gpa"] == 2.5 and "__text" not in src and src["collection"] == "scholarships"
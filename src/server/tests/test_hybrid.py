@@ -0,0 +1,52 @@
+"""
+Hybrid search: reciprocal rank fusion BM25 + kNN, kNN lỗi thì chỉ còn BM25.
+"""
+import pytest
+
+from services.es_svc import EMBEDDING_FIELD, _hybrid_searches, _rrf_result
+
+
+def ranking(*ids, total=None):
+    return {
+        "hits": {
+            "total": {"value": len(ids) if total is None else total, "relation": "eq"},
+            "hits": [{"_id": doc_id, "_score": 1.0, "_source": {"name": doc_id}} for doc_id in ids],
+        }
+    }
+
+
+def test_rrf_fuses_both_rankings():
+    result = _rrf_result([ranking("a", "b", "c", total=40), ranking("c", "d", "a")], size=10, offset=0, rank_constant=60)
+    assert [item["id"] for item in result["items"]] == ["a", "c", "b", "d"]
+    assert result["items"][0]["score"] == pytest.approx(1 / 61 + 1 / 63)
+    assert result["items"][1]["ranks"] == {"bm25": 3, "knn": 1}
+    assert (result["total"], result["window"], result["mode"]) == (40, 4, "hybrid")
+
+
+def test_rrf_pages_inside_window():
+    result = _rrf_result([ranking("a", "b", "c"), ranking("c", "d", "a")], size=2, offset=2)
+    assert [item["id"] for item in result["items"]] == ["b", "d"]
+    assert result["total"] == 4
+
+
+def test_knn_failure_falls_back_to_bm25():
+    result = _rrf_result([ranking("a", "b"), {"status": 400, "error": {"reason": "no vectors"}}], size=10, offset=0)
+    assert result["mode"] == "bm25" and [item["id"] for item in result["items"]] == ["a", "b"]
+
+
+def test_bm25_failure_raises():
+    with pytest.raises(RuntimeError, match="BM25 search failed"):
+        _rrf_result([{"status": 500, "error": {"reason": "boom"}}], size=10, offset=0)
+
+
+def test_searches_share_filter_and_skip_knn_without_vector():
+    filter_query = {"term": {"collection": "scholarships"}}
+    kwargs = dict(index="scholarships", filter_query=filter_query, window=50, num_candidates=100, fields=None)
+
+    searches = _hybrid_searches("data science", [0.1, 0.2], **kwargs)
+    assert len(searches) == 4
+    assert searches[1]["query"]["bool"]["filter"] == [filter_query]
+    assert searches[3]["knn"]["filter"] == filter_query and searches[3]["knn"]["k"] == 50
+    assert searches[3]["_source"] == {"excludes": [EMBEDDING_FIELD]}
+
+    assert len(_hybrid_searches("data science", None, **kwargs)) == 2
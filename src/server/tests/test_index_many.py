@@ -0,0 +1,30 @@
+"""
+`index_many`: kết quả trả về serialize được (JSON) và liệt kê đủ id lỗi.
+"""
+import json
+
+from services import es_svc
+from services.es_svc import index_many
+
+
+class FakeClient:
+    def options(self, **kwargs):
+        return self
+
+
+def test_result_is_json_serializable(monkeypatch):
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            if action["_id"].startswith("bad"):
+                yield False, {"index": {"_id": action["_id"], "status": 400, "error": {"type": "mapper_parsing_exception"}}}
+            else:
+                yield True, {"index": {"_id": action["_id"], "status": 201}}
+
+    monkeypatch.setattr(es_svc, "ensure_index", lambda client, index: None)
+    monkeypatch.setattr(es_svc.helpers, "parallel_bulk", parallel_bulk)
+
+    docs = [{"id": "ok1"}, {"id": "bad2"}, {"id": "bad1"}, {"id": "ok1"}]
+    result = index_many(FakeClient(), docs, index="test_index")
+
+    assert json.loads(json.dumps(result))["failed_doc_ids"] == ["bad1", "bad2"]
+    assert (result["success"], result["failed"], result["duplicates"]) == (1, 2, 1)
@@ -0,0 +1,56 @@
+"""
+Kiểm tra kiểu pyflakes (không cần cài linter): không có import thừa trong các
+module service / route / script.
+"""
+import ast
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULES = [
+    "app.py",
+    "routes/auth.py",
+    "routes/health.py",
+    "routes/search.py",
+    "routes/user.py",
+    "scripts/backfill_profile_queries.py",
+    "scripts/bench_catch_all.py",
+    "scripts/build_similar.py",
+    "scripts/migrate_index.py",
+    "services/cache_svc.py",
+    "services/embedding_svc.py",
+    "services/es_client.py",
+    "services/es_svc.py",
+    "services/fallback_svc.py",
+    "services/firestore_svc.py",
+    "services/match_feed_svc.py",
+    "services/recommendation_svc.py",
+    "services/similar_svc.py",
+    "services/sync_svc.py",
+    "services/synonyms.py",
+    "services/user_svc.py",
+]
+
+
+def unused_imports(source: str):
+    tree = ast.parse(source)
+    imported = {}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                # `import a.b` gắn tên `a`; `from x import *` không kiểm tra được
+                name = alias.asname or alias.name.split(".")[0]
+                if name != "*":
+                    imported[name] = node.lineno
+    used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    # Annotation dạng chuỗi ("Elasticsearch") và `__all__`
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.isidentifier():
+            used.add(node.value)
+    return sorted((line, name) for name, line in imported.items() if name not in used)
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_no_unused_imports(module):
+    assert unused_imports((ROOT / module).read_text(encoding="utf-8")) == []
@@ -0,0 +1,144 @@
+"""
+Feed match mới: percolate batch doc vào feed của user, chỉ đánh dấu match có
+trong feed, backfill query cho user cũ.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from services import es_svc, match_feed_svc
+from services.es_svc import percolate_documents, register_profile_query
+from services.match_feed_svc import backfill_profile_queries, mark_matches_seen, notify_new_matches
+
+
+class FakeRef:
+    def __init__(self, store, path):
+        self.store, self.path, self.id = store, path, path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeRef(self.store, f"{self.path}/{name}")
+
+    def document(self, doc_id):
+        return FakeRef(self.store, f"{self.path}/{doc_id}")
+
+
+class FakeBatch:
+    def __init__(self, store):
+        self.store, self.ops = store, []
+
+    def set(self, ref, data):
+        self.ops.append((ref.path, data, False))
+
+    def update(self, ref, data):
+        self.ops.append((ref.path, data, True))
+
+    def commit(self):
+        for path, data, existing in self.ops:
+            if existing and path not in self.store:
+                raise KeyError(f"No document to update: {path}")
+            self.store.setdefault(path, {}).update(data)
+        self.ops = []
+
+
+class FakeDb:
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self, name):
+        return FakeRef(self.store, name)
+
+    def batch(self):
+        return FakeBatch(self.store)
+
+    def get_all(self, refs):
+        return [SimpleNamespace(id=ref.id, exists=ref.path in self.store) for ref in refs]
+
+
+@pytest.fixture
+def db():
+    return FakeDb({
+        "users/u1/new_matches/a": {"seen": False},
+        "users/u1/new_matches/b": {"seen": False},
+    })
+
+
+def test_mark_matches_seen_skips_ids_outside_feed(db):
+    assert mark_matches_seen("u1", ["a", "zzz", "a"], db=db) == 1
+    assert db.store["users/u1/new_matches/a"] == {"seen": True}
+    assert db.store["users/u1/new_matches/b"] == {"seen": False}
+    assert "users/u1/new_matches/zzz" not in db.store
+
+
+def test_mark_matches_seen_empty_list(db):
+    assert mark_matches_seen("u1", [], db=db) == 0
+
+
+def test_backfill_registers_every_user(monkeypatch):
+    users = [
+        {"id": "u1", "desired_countries": ["Germany"]},
+        {"id": "u2"},
+        {"id": "u3", "desired_countries": ["Japan"]},
+    ]
+    registered = {}
+
+    def register(client, collection, uid, filters):
+        if uid == "u3":
+            raise ConnectionError("es down")
+        registered[uid] = filters
+        return bool(filters)
+
+    monkeypatch.setattr(match_feed_svc, "iter_documents", lambda col: (dict(u) for u in users))
+    monkeypatch.setattr(match_feed_svc, "register_profile_query", register)
+
+    counts = backfill_profile_queries(None, FakeDb({}), "scholarships")
+    assert counts == {"registered": 1, "skipped": 1, "failed": 1}
+    assert registered["u1"] and registered["u2"] == []
+
+
+def test_percolate_maps_slots_back_to_doc_ids(monkeypatch):
+    requests = []
+
+    def scan(client, *, index, query, _source):
+        documents = query["query"]["percolate"]["documents"]
+        requests.append([d["Scholarship_Name"] for d in documents])
+        # u1 khớp mọi doc của batch, u2 chỉ khớp doc "c"
+        yield {"_id": "u1", "_source": {"uid": "u1"}, "fields": {"_percolator_document_slot": list(range(len(documents)))}}
+        if len(documents) == 1:
+            yield {"_id": "u2", "_source": {"uid": "u2"}, "fields": {"_percolator_document_slot": [0]}}
+
+    monkeypatch.setattr(es_svc, "PERCOLATE_BATCH_DOCS", 2)
+    monkeypatch.setattr(es_svc, "ensure_percolator_index", lambda client, collection: "pq")
+    monkeypatch.setattr(es_svc.helpers, "scan", scan)
+
+    docs = [{"id": doc_id, "Scholarship_Name": doc_id.upper(), "embedding": [0.1]} for doc_id in "abc"]
+    assert percolate_documents(None, "scholarships", docs) == {"u1": ["a", "b", "c"], "u2": ["c"]}
+    assert requests == [["A", "B"], ["C"]]
+
+
+def test_notify_writes_unseen_feed_entries(monkeypatch):
+    monkeypatch.setattr(match_feed_svc, "percolate_documents", lambda client, collection, docs: {"u1": ["a", "a"]})
+    db = FakeDb({})
+    docs = [{"id": "a", "Scholarship_Name": "Chevening", "End_Date": "2099-01-01"}, {"Scholarship_Name": "no id"}]
+
+    assert notify_new_matches(None, "scholarships", docs, db=db) == 1
+    entry = db.store["users/u1/new_matches/a"]
+    assert entry["seen"] is False and entry["name"] == "Chevening" and entry["collection"] == "scholarships"
+
+
+def test_register_without_criteria_removes_query(monkeypatch):
+    class Client:
+        def __init__(self):
+            self.calls = []
+
+        def index(self, **kwargs):
+            self.calls.append(("index", kwargs["id"], kwargs["document"]["query"]))
+
+        def delete(self, **kwargs):
+            self.calls.append(("delete", kwargs["id"]))
+
+    monkeypatch.setattr(es_svc, "ensure_percolator_index", lambda client, collection: "pq")
+    client = Client()
+    assert register_profile_query(client, "scholarships", "u1", [{"field": "Country", "values": ["Japan"]}])
+    assert not register_profile_query(client, "scholarships", "u1", [])
+    assert client.calls[0][:2] == ("index", "u1") and "Japan" in str(client.calls[0][2])
+    assert client.calls[1] == ("delete", "u1")
@@ -0,0 +1,47 @@
+"""
+`multi_search`: một `_msearch` cho cả batch, lỗi tách theo từng spec, pha fuzzy
+gộp thành `_msearch` thứ hai.
+"""
+from services import es_svc
+from services.es_svc import multi_search
+
+
+def hits(n):
+    return {"hits": {"total": {"value": n}, "hits": [{"_id": f"h{i}", "_score": 1.0} for i in range(n)]}}
+
+
+class FakeClient:
+    def __init__(self, *phases):
+        self.phases, self.requests = list(phases), []
+
+    def msearch(self, *, searches):
+        self.requests.append(searches)
+        return {"responses": self.phases.pop(0)}
+
+
+def test_batch_order_errors_and_fuzzy_phase(monkeypatch):
+    monkeypatch.setattr(es_svc, "ensure_index", lambda client, index: index)
+    specs = [
+        {"type": "search", "index": "scholarships", "collection": "scholarships", "q": "chevening"},
+        {"type": "filter", "index": "scholarships", "collection": None, "filters": []},
+        {"type": "filter", "index": "scholarships", "filters": [
+            {"field": "End_Date", "values": ["2026-01-01"], "operator": "range"},
+        ]},
+        {"type": "search", "index": "scholarships", "collection": "scholarships", "q": "fullbright"},
+        {"type": "filter", "index": "scholarships", "filters": [{"field": "Country", "values": ["Japan"]}]},
+    ]
+    client = FakeClient(
+        [hits(5), hits(0), {"status": 400, "error": {"reason": "bad query"}}],
+        [hits(2)],
+    )
+
+    results = multi_search(client, specs)
+
+    # Spec rỗng / lỗi khi build không được gửi lên ES
+    assert len(client.requests[0]) == 6
+    assert [header["index"] for header in client.requests[1][::2]] == ["scholarships"]
+    assert results[0]["total"] == 5 and results[0]["phase"] == "exact"
+    assert results[1] == {"total": 0, "items": [], "error": None}
+    assert results[2]["error_type"] == "ValueError"
+    assert results[3]["total"] == 2 and results[3]["phase"] == "fuzzy"
+    assert results[4]["error"] == "bad query" and results[4]["error_type"] == "HTTP 400"
@@ -0,0 +1,51 @@
+"""
+Xếp hạng theo profile: một function_score query, trọng số theo tiêu chí,
+GPA / kinh nghiệm / hạn nộp chỉ cộng điểm.
+"""
+from dtos.user_dtos import UserProfile
+from services.es_svc import PROFILE_GPA_WEIGHT, _build_profile_query
+from services.user_svc import map_profile_to_criteria
+
+CRITERIA = [
+    {"field": "Country", "values": ["Germany"], "operator": "OR", "weight": 3.0},
+    {"field": "Funding_Level", "values": ["Full scholarship"], "operator": "OR", "weight": 2.0},
+]
+
+
+def test_no_criteria_means_no_query():
+    assert _build_profile_query([], "scholarships", gpa=3.5) is None
+
+
+def test_weighted_criteria_must_match_at_least_one():
+    query = _build_profile_query(CRITERIA, "scholarships")["function_score"]
+    must = query["query"]["bool"]["must"][0]["bool"]
+    assert must["minimum_should_match"] == 1
+    assert [clause["constant_score"]["boost"] for clause in must["should"]] == [3.0, 2.0]
+    assert query["query"]["bool"]["filter"] == [{"term": {"collection": "scholarships"}}]
+    assert query["query"]["bool"]["should"] == []
+    assert query["score_mode"] == "sum" and query["boost_mode"] == "sum"
+    assert query["functions"][0]["gauss"]["end_date"]["origin"] == "now/d"
+
+
+def test_gpa_and_experience_only_boost():
+    query = _build_profile_query(CRITERIA, None, gpa=3.4, years_of_experience=2)["function_score"]["query"]
+    should = query["bool"]["should"]
+    assert should[0] == {"constant_score": {"filter": {"range": {"min_gpa": {"lte": 3.4}}}, "boost": PROFILE_GPA_WEIGHT}}
+    # Học bổng không ghi yêu cầu GPA được một nửa điểm
+    assert should[1]["constant_score"]["boost"] == PROFILE_GPA_WEIGHT / 2
+    assert should[2]["constant_score"]["filter"] == {"range": {"experience_years": {"lte": 2}}}
+    assert len(should) == 4 and "filter" not in query["bool"]
+
+
+def test_profile_mapping_attaches_weights():
+    profile = UserProfile.model_construct(
+        uid="u1",
+        desired_countries=["Germany"],
+        desired_funding_level=["Full scholarship"],
+        desired_scholarship_type=None,
+        desired_application_mode=None,
+        desired_field_of_study=None,
+        field_of_study="Computer Science",
+    )
+    weights = {c["field"]: c["weight"] for c in map_profile_to_criteria(profile)}
+    assert weights == {"Country": 3.0, "Funding_Level": 2.0, "Eligible_Fields": 3.0}
@@ -0,0 +1,83 @@
+"""
+Route `/api/v1/es`: response ORJSON dựng sẵn (không qua `jsonable_encoder`),
+lỗi ES trả payload lỗi / HTTPException như các route khác.
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+
+from routes import search as search_routes
+from services import fallback_svc
+
+RESULT = {"total": 1, "items": [{"id": "a", "score": 1.5, "source": {"Scholarship_Name": "Chevening"}}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(search_routes.router, prefix="/api/v1/es")
+    app.dependency_overrides[search_routes.get_async_search_es] = lambda: object()
+    monkeypatch.setattr(fallback_svc, "FALLBACK_ENABLED", False)
+    return TestClient(app)
+
+
+def _returns(value):
+    async def run(*args, **kwargs):
+        return value
+    return run
+
+
+def _raises(error):
+    async def run(*args, **kwargs):
+        raise error
+    return run
+
+
+@pytest.mark.parametrize(
+    "method, path, patched, body",
+    [
+        ("get", "/search?q=x&collection=scholarships", "search_keyword_async", None),
+        ("post", "/filter?collection=scholarships", "filter_advanced_async", []),
+        ("post", "/facets?collection=scholarships", "facet_counts_async", []),
+    ],
+)
+def test_hot_routes_return_orjson_responses(client, monkeypatch, method, path, patched, body):
+    monkeypatch.setattr(search_routes, patched, _returns(RESULT))
+    response = getattr(client, method)(f"/api/v1/es{path}", **({"json": body} if body is not None else {}))
+    assert response.status_code == 200
+    assert response.json() == RESULT
+
+
+def test_batch_returns_results_in_order(client, monkeypatch):
+    monkeypatch.setattr(search_routes, "multi_search_async", _returns([RESULT, {"error": "boom"}]))
+    response = client.post("/api/v1/es/batch", json=[
+        {"type": "search", "collection": "scholarships", "q": "x"},
+        {"type": "filter", "collection": "scholarships"},
+    ])
+    assert response.json() == {"results": [RESULT, {"error": "boom"}]}
+
+
+def test_search_error_payload(client, monkeypatch):
+    monkeypatch.setattr(search_routes, "search_keyword_async", _raises(ValueError("Invalid cursor")))
+    body = client.get("/api/v1/es/search?q=x&collection=scholarships&cursor=bad").json()
+    assert body["error"] == "Invalid cursor" and body["items"] == []
+
+
+def test_handlers_build_orjson_responses_directly(monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(search_routes, "get_scholarship_async", _returns({"id": "a", "source": {}}))
+    response = asyncio.run(search_routes.get_scholarship_detail("a", collection="scholarships", es=None))
+    assert isinstance(response, ORJSONResponse)
+
+
+@pytest.mark.parametrize(
+    "fetch, status",
+    [(_returns(None), 404), (_raises(ConnectionError("down")), 500)],
+)
+def test_detail_errors(client, monkeypatch, fetch, status):
+    monkeypatch.setattr(search_routes, "get_scholarship_async", fetch)
+    response = client.get("/api/v1/es/scholarships/abc?collection=scholarships")
+    assert response.status_code == status
+    assert "abc" in response.json()["detail"]
@@ -0,0 +1,108 @@
+"""
+Đồ thị học bổng tương tự: lần build sau chỉ embed / tính lại phần bị ảnh
+hưởng và cho cùng kết quả với build lại toàn bộ.
+"""
+import hashlib
+
+import numpy as np
+
+from services.similar_svc import SimilarGraph, build_similar_graph
+
+COUNTRIES = ["Germany", "Japan", "USA", "UK"]
+FIELDS = ["Engineering", "Medicine", "Economics & Business"]
+DEGREES = ["Master", "PhD", "Bachelor, Master"]
+
+
+class FakeEmbedder:
+    """Vector 32 chiều đếm hash của từng từ: text giống nhau -> cosine cao."""
+
+    model = "fake-embedder"
+
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        vectors = []
+        for text in texts:
+            vector = np.zeros(32)
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1
+            vectors.append(vector.tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def catalog(n=12):
+    ids = [f"s{i:02d}" for i in range(n)]
+    docs = [
+        {
+            "Scholarship_Name": f"Scholarship {i} {['alpha', 'beta', 'gamma'][i % 3]} {i * 7 % 5}",
+            "Country": COUNTRIES[i % 4],
+            "Eligible_Field_Group": FIELDS[i % 3],
+            "Wanted_Degree": DEGREES[i % 3],
+        }
+        for i in range(n)
+    ]
+    return ids, docs
+
+
+def graph_rows(path):
+    graph = SimilarGraph(str(path))
+    return {doc_id: graph.similar(doc_id) for doc_id in graph.ids}
+
+
+def tie_order(neighbor):
+    doc_id, score = neighbor
+    return -score, doc_id
+
+
+def test_incremental_build_matches_full_rebuild(tmp_path):
+    incremental, full = tmp_path / "incremental.npz", tmp_path / "full.npz"
+    ids, docs = catalog()
+    build_similar_graph(ids, docs, path=str(incremental), top_k=3, embedder=FakeEmbedder())
+
+    # Đổi một học bổng, xóa một, thêm một
+    docs[4] = {**docs[4], "Scholarship_Name": "Renamed gamma program", "Country": "Japan"}
+    del ids[7], docs[7]
+    ids.append("s99")
+    docs.append({"Scholarship_Name": "Scholarship alpha new", "Country": "Germany",
+                 "Eligible_Field_Group": "Engineering", "Wanted_Degree": "Master"})
+
+    embedder = FakeEmbedder()
+    stats = build_similar_graph(ids, docs, path=str(incremental), top_k=3, embedder=embedder)
+    assert embedder.embedded == 2 and stats["changed"] == 2
+    assert stats["merged_rows"] > 0 and stats["recomputed_rows"] < len(ids)
+
+    build_similar_graph(ids, docs, path=str(full), top_k=3, embedder=FakeEmbedder(), full=True)
+    expected, actual = graph_rows(full), graph_rows(incremental)
+    assert actual.keys() == expected.keys() and "s07" not in actual
+    for doc_id in expected:
+        # Thứ tự giữa các láng giềng bằng điểm nhau không cố định
+        assert sorted(actual[doc_id], key=tie_order) == sorted(expected[doc_id], key=tie_order), doc_id
+
+
+def test_unchanged_catalog_embeds_nothing(tmp_path):
+    path = tmp_path / "graph.npz"
+    ids, docs = catalog(5)
+    build_similar_graph(ids, docs, path=str(path), top_k=10, embedder=FakeEmbedder())
+
+    embedder = FakeEmbedder()
+    stats = build_similar_graph(ids, docs, path=str(path), top_k=10, embedder=embedder)
+    assert embedder.embedded == 0 and stats["recomputed_rows"] == 0
+
+    # top_k lớn hơn catalog: đệm, không trả về chính nó
+    rows = graph_rows(path)
+    assert len(rows["s00"]) == 4 and "s00" not in [n for n, _ in rows["s00"]]
+
+
+def test_config_change_forces_full_rebuild(tmp_path):
+    path = tmp_path / "graph.npz"
+    ids, docs = catalog(6)
+    build_similar_graph(ids, docs, path=str(path), top_k=3, embedder=FakeEmbedder())
+
+    embedder = FakeEmbedder()
+    stats = build_similar_graph(ids, docs, path=str(path), top_k=4, embedder=embedder)
+    assert embedder.embedded == 6 and stats["recomputed_rows"] == 6
@@ -0,0 +1,120 @@
+"""
+`SyncJob`: checkpoint sau mỗi đoạn, chạy tiếp từ checkpoint, hủy giữa chừng.
+"""
+import contextlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from services import sync_svc
+from services.sync_svc import SyncJob
+
+COLLECTION = "test_jobs"
+DOC_IDS = ["d0", "d1", "d2", "d3", "d4"]
+T0 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+class FakeIndices:
+    def __init__(self, existing):
+        self.existing = set(existing)
+
+    def exists(self, index):
+        return index in self.existing
+
+
+class FakeEs:
+    def __init__(self, existing=()):
+        self.indices = FakeIndices(existing)
+        self.cluster = SimpleNamespace(health=lambda **kwargs: {"status": "green"})
+
+    def count(self, index):
+        return {"count": 0}
+
+
+class FakeDb:
+    def collection(self, name):
+        return SimpleNamespace(name=name)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    env = SimpleNamespace(checkpoint=None, checkpoints=[], watermarks=[], batches=[], promoted=[], job=None)
+
+    def iter_snapshots(coll_ref, page_size, start_after=None):
+        start = DOC_IDS.index(start_after) + 1 if start_after else 0
+        for doc_id in DOC_IDS[start:]:
+            yield SimpleNamespace(id=doc_id, to_dict=lambda: {"name": "x"}, update_time=None)
+
+    def index_many(client, docs, *, index, **kwargs):
+        batch = [d["id"] for d in docs]
+        env.batches.append((index, batch))
+        if env.cancel_after == len(env.batches):
+            env.job.cancel()
+        return {"success": len(batch), "failed": 0, "failed_ids": [], "failed_doc_ids": []}
+
+    def save_checkpoint(db, collection, checkpoint):
+        env.checkpoint = checkpoint
+        env.checkpoints.append(checkpoint)
+
+    env.cancel_after = None
+    monkeypatch.setattr(sync_svc, "SYNC_CHECKPOINT_DOCS", 2)
+    monkeypatch.setattr(sync_svc, "iter_snapshots", iter_snapshots)
+    monkeypatch.setattr(sync_svc, "index_many", index_many)
+    monkeypatch.setattr(sync_svc, "load_checkpoint", lambda db, collection: env.checkpoint)
+    monkeypatch.setattr(sync_svc, "save_checkpoint", save_checkpoint)
+    monkeypatch.setattr(sync_svc, "load_watermark", lambda db, collection: None)
+    monkeypatch.setattr(
+        sync_svc, "save_watermark", lambda db, collection, wm, full_sync=False: env.watermarks.append((wm, full_sync))
+    )
+    monkeypatch.setattr(sync_svc, "promote_index_version", lambda es, alias, physical: env.promoted.append(physical))
+    monkeypatch.setattr(sync_svc, "index_migration_lock", lambda es, alias, owner: contextlib.nullcontext())
+    monkeypatch.setattr(sync_svc, "bulk_load_settings", lambda es, index, force_merge=False: contextlib.nullcontext())
+    monkeypatch.setattr(sync_svc, "refresh_index_lock", lambda es, alias: None)
+    monkeypatch.setattr(sync_svc, "ensure_index", lambda es, index: index)
+    monkeypatch.setattr(sync_svc, "_wait_for_write_capacity", lambda es: None)
+    monkeypatch.setattr(sync_svc, "_count_documents", lambda coll_ref: len(DOC_IDS))
+    monkeypatch.setattr(sync_svc, "get_embedder", lambda: None)
+    return env
+
+
+def run_job(env, es, **kwargs):
+    env.job = SyncJob(es, FakeDb(), COLLECTION, **kwargs)
+    return env.job.run()
+
+
+def test_checkpoint_after_each_chunk(env):
+    status = run_job(env, FakeEs())
+    assert status["status"] == "completed" and status["indexed"] == 5
+    assert env.batches == [(COLLECTION, ["d0", "d1"]), (COLLECTION, ["d2", "d3"]), (COLLECTION, ["d4"])]
+    assert [c["last_doc_id"] for c in env.checkpoints[:-1]] == ["d1", "d3", "d4"]
+    assert env.checkpoints[-1] is None and env.watermarks[-1][1] is True
+
+
+def test_cancel_keeps_checkpoint_and_resume_continues(env):
+    env.cancel_after = 1
+    status = run_job(env, FakeEs())
+    assert status["status"] == "cancelled"
+    assert env.checkpoint["last_doc_id"] == "d1" and env.watermarks == []
+
+    # Index đích đã có dữ liệu, nhưng checkpoint còn: đọc tiếp sau "d1" thay vì skip
+    env.cancel_after, env.batches = None, []
+    status = run_job(env, FakeEs(existing=[COLLECTION]))
+    assert status["status"] == "completed" and status["resumed_from"] == "d1"
+    assert [doc_id for _, batch in env.batches for doc_id in batch] == ["d2", "d3", "d4"]
+    assert status["indexed"] == 5 and env.checkpoint is None
+
+
+def test_resume_into_versioned_index_promotes_it(env):
+    env.checkpoint = {"job_id": "old", "target": f"{COLLECTION}_v2", "last_doc_id": "d3", "indexed": 4, "started_at": T0}
+    status = run_job(env, FakeEs(existing=[COLLECTION, f"{COLLECTION}_v2"]))
+    assert env.batches == [(f"{COLLECTION}_v2", ["d4"])]
+    assert env.promoted == [f"{COLLECTION}_v2"] and env.watermarks == [(T0, True)]
+    assert status["indexed"] == 5
+
+
+def test_checkpoint_with_missing_target_starts_over(env):
+    env.checkpoint = {"job_id": "old", "target": f"{COLLECTION}_v9", "last_doc_id": "d3", "indexed": 4}
+    status = run_job(env, FakeEs())
+    assert status["resumed_from"] is None
+    assert [doc_id for _, batch in env.batches for doc_id in batch] == DOC_IDS
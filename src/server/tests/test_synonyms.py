@@ -0,0 +1,79 @@
+"""
+Bảng đồng nghĩa VI <-> EN: chỉ cụm đúng nghĩa mới được mở rộng, từ đơn / cụm
+không liên quan (sau khi bỏ dấu) thì giữ nguyên.
+
+    cd src/server && python -m pytest tests
+"""
+import pytest
+
+from services.synonyms import country_synonym_rules, expand_phrase, fold_tokens, synonym_rules
+
+
+def expansions(query: str, country: bool = False):
+    tokens = tuple(fold_tokens(query))
+    return {" ".join(alt) for alt in expand_phrase(tokens, country=country)} - {" ".join(tokens)}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "y",            # "ý" bỏ dấu
+        "ao",           # "áo"
+        "anh",          # tên người / "anh" (anh trai)
+        "han",          # "hàn", "hạn nộp"
+        "hạn nộp hồ sơ",
+        "quy định",     # "quỹ" bỏ dấu là "quy"
+        "đại học",      # không còn ánh xạ sang Bachelor
+        "được",         # "dược" bỏ dấu
+        "my",
+        "Nguyễn Văn Đức",
+        "Trần Thị Nga",
+        "phương pháp",  # "pháp" (France)
+        "ưu tiên thứ nhất",
+    ],
+)
+def test_unrelated_queries_do_not_expand(query):
+    assert expansions(query) == set()
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("nước ý", "italy"),
+        ("hàn quốc", "south korea"),
+        ("vương quốc anh", "uk"),
+        ("nước áo", "austria"),
+        ("quỹ học bổng", "organization foundation"),
+        ("thạc sĩ", "master"),
+        ("trường đại học", "university"),
+        ("học bổng toàn phần", "full scholarship"),
+    ],
+)
+def test_vietnamese_phrases_expand_to_english(query, expected):
+    assert expected in expansions(query)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("Đức", "germany"),
+        ("Mỹ", "usa"),
+        ("Nhật", "japan"),
+        ("Hà Lan", "netherlands"),
+        ("Anh", "uk"),
+        ("mỹ latinh", "latin america"),
+    ],
+)
+def test_single_word_countries_expand_on_country_field(query, expected):
+    assert expected in expansions(query, country=True)
+
+
+@pytest.mark.parametrize("query", ["Đức", "Mỹ", "Anh", "Nguyễn Văn Đức"])
+def test_single_word_countries_stay_out_of_catch_all_rules(query):
+    assert expansions(query) == set()
+
+
+def test_country_rules_only_add_single_words():
+    catch_all = set(synonym_rules())
+    extra = [rule for rule in country_synonym_rules() if rule not in catch_all]
+    assert extra and all(len(rule.split(", ")[-1].split()) == 1 for rule in extra)